@@ -0,0 +1,427 @@
+#!/usr/bin/env python
+"""
+Time each of the hooks, and file discovery, over synthetic corpora of different
+shapes, reporting throughput in MB/s and files/s.
+
+Run from the repo root with the package installed (or with `src` on the path):
+
+    python benchmarks/bench_hooks.py
+    python benchmarks/bench_hooks.py --scale 0.1 --hook fix-smartquotes
+    python benchmarks/bench_hooks.py --output after.json --compare before.json
+
+The corpora are generated deterministically, so results saved with `--output` can
+be compared across commits with `--compare`. Fixers rewrite the files they
+change, so each run gets a fresh copy of its corpus, which is not timed. The cache
+is always disabled. No network access is needed.
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import typing as t
+
+from texthooks import (
+    alphabetize_codeowners,
+    combined,
+    fix_ligatures,
+    fix_smartquotes,
+    fix_spaces,
+    fix_unicode_dashes,
+    forbid_bidi_controls,
+    macro_expand,
+)
+from texthooks._common import all_filenames
+
+Corpus = dict[str, bytes]
+
+_WORDS = (
+    "def class return import from self value result data items index count "
+    "name path file line text list dict None True False for while if else"
+).split()
+_CJK = "这是一行中文文本其中没有任何需要替换的字符日本語の文章も少し含まれています"
+_DENSE = (
+    "“quoted” text, don’t — it’s ﬁne – really ‘single’ and issue:{n} ﬂow…",
+    "see pr:{n} for the fix\xa0(non-breaking) and the em—dash",
+    "plain ASCII line number {n} with nothing to replace",
+)
+
+
+def _source_line(rng: random.Random) -> str:
+    indent = "    " * rng.randrange(4)
+    return indent + " ".join(rng.choices(_WORDS, k=rng.randrange(2, 12))) + "\n"
+
+
+def _text(lines: t.Iterator[str], size: int) -> bytes:
+    out: list[str] = []
+    total = 0
+    for line in lines:
+        out.append(line)
+        total += len(line.encode("utf-8"))
+        if total >= size:
+            break
+    return "".join(out).encode("utf-8")
+
+
+def _ascii_lines(rng: random.Random) -> t.Iterator[str]:
+    while True:
+        yield _source_line(rng)
+
+
+def _cjk_lines(rng: random.Random) -> t.Iterator[str]:
+    while True:
+        yield "".join(rng.choices(_CJK, k=rng.randrange(10, 60))) + "。\n"
+
+
+def _dense_lines(rng: random.Random) -> t.Iterator[str]:
+    n = 0
+    while True:
+        n += 1
+        yield rng.choice(_DENSE).format(n=n) + "\n"
+
+
+def _mixed_lines(rng: random.Random) -> t.Iterator[str]:
+    dense = _dense_lines(rng)
+    while True:
+        yield next(dense) if rng.random() < 0.01 else _source_line(rng)
+
+
+def gen_ascii(rng: random.Random, scale: float) -> Corpus:
+    """Pure ASCII source code, in 40KB files."""
+    return {
+        f"src/pkg{i % 10}/mod{i}.py": _text(_ascii_lines(rng), 40_000)
+        for i in range(int(200 * scale) or 1)
+    }
+
+
+def gen_cjk(rng: random.Random, scale: float) -> Corpus:
+    """CJK-heavy prose, in 40KB files."""
+    return {
+        f"docs/chapter{i}.txt": _text(_cjk_lines(rng), 40_000)
+        for i in range(int(100 * scale) or 1)
+    }
+
+
+def gen_minified(rng: random.Random, scale: float) -> Corpus:
+    """Minified files, each a single line of about 300KB with a few smartquotes."""
+    corpus = {}
+    for i in range(int(20 * scale) or 1):
+        words = []
+        for _ in range(50_000):
+            words.append(rng.choice(_WORDS) + rng.choice(";,(){}="))
+            if rng.random() < 0.0005:
+                words.append("“x”")
+        corpus[f"dist/bundle{i}.min.js"] = "".join(words).encode("utf-8")
+    return corpus
+
+
+def gen_tiny(rng: random.Random, scale: float) -> Corpus:
+    """Many tiny files, spread over nested directories."""
+    return {
+        f"tiny/{i % 50}/{i // 50 % 10}/f{i}.txt": _text(_ascii_lines(rng), 100)
+        for i in range(int(5000 * scale) or 1)
+    }
+
+
+def gen_huge(rng: random.Random, scale: float) -> Corpus:
+    """A few huge files of mixed ASCII and dense content."""
+    return {
+        f"data/huge{i}.txt": _text(_mixed_lines(rng), int(20_000_000 * scale) or 1)
+        for i in range(2)
+    }
+
+
+def gen_dense(rng: random.Random, scale: float) -> Corpus:
+    """Text where most lines have smartquotes, dashes, ligatures, or macros."""
+    return {
+        f"notes/note{i}.md": _text(_dense_lines(rng), 40_000)
+        for i in range(int(100 * scale) or 1)
+    }
+
+
+def gen_codeowners(rng: random.Random, scale: float) -> Corpus:
+    """A large CODEOWNERS file, with owners out of order."""
+    lines = []
+    for i in range(int(20_000 * scale) or 1):
+        owners = rng.sample([f"@org/team-{j}" for j in range(30)], k=5)
+        lines.append(f"/path/{i}/ {' '.join(owners)}\n")
+    return {"CODEOWNERS": "".join(lines).encode("utf-8")}
+
+
+CORPORA: dict[str, t.Callable[[random.Random, float], Corpus]] = {
+    "ascii": gen_ascii,
+    "cjk": gen_cjk,
+    "minified": gen_minified,
+    "tiny": gen_tiny,
+    "huge": gen_huge,
+    "dense": gen_dense,
+    "codeowners": gen_codeowners,
+}
+# the corpora which the hooks run over, other than alphabetize-codeowners
+TEXT_CORPORA = ("ascii", "cjk", "minified", "tiny", "huge", "dense")
+
+_MACROS = ["--macro", "issue:", "[$VALUE](#$VALUE)", "--macro", "pr:", "PR $VALUE"]
+# a large configuration, such as one documentation site's set of link macros
+_MANY_MACROS = [
+    arg
+    for i in range(300)
+    for arg in ("--macro", f"link{i}:", f"[$VALUE](https://example.com/{i}/$VALUE)")
+]
+
+
+def _project_key(i: int) -> str:
+    key = ""
+    while True:
+        i, letter = divmod(i, 26)
+        key = chr(ord("A") + letter) + key
+        if not i:
+            return key
+
+
+# one macro per issue tracker project, as generated from a tracker's export, along
+# with the macros which the dense corpus uses
+_MACRO_FILE = "".join(
+    f"{key}- [{key}-$VALUE](https://tracker.example.com/browse/{key}-$VALUE)\n"
+    for key in map(_project_key, range(10_000))
+) + ("issue: [$VALUE](#$VALUE)\npr: PR $VALUE\n")
+# files which hooks read, written next to each copy of a corpus
+_HOOK_FILES = {"macros.txt": _MACRO_FILE}
+# hook name -> (main function, extra arguments, corpora)
+HOOKS: dict[str, tuple[t.Callable[..., int | None], list[str], t.Sequence[str]]] = {
+    "fix-smartquotes": (fix_smartquotes.main, [], TEXT_CORPORA),
+    "fix-spaces": (fix_spaces.main, [], TEXT_CORPORA),
+    "fix-unicode-dashes": (fix_unicode_dashes.main, [], TEXT_CORPORA),
+    "fix-ligatures": (fix_ligatures.main, [], TEXT_CORPORA),
+    "forbid-bidi-controls": (forbid_bidi_controls.main, [], TEXT_CORPORA),
+    "macro-expand": (macro_expand.main, _MACROS, TEXT_CORPORA),
+    "macro-expand-300": (macro_expand.main, _MANY_MACROS, TEXT_CORPORA),
+    "macro-expand-whole-file": (
+        macro_expand.main,
+        [*_MACROS, "--whole-file"],
+        TEXT_CORPORA,
+    ),
+    "macro-expand-10k": (
+        macro_expand.main,
+        ["--macro-file", "../macros.txt"],
+        TEXT_CORPORA,
+    ),
+    "texthooks": (combined.main, [], TEXT_CORPORA),
+    "alphabetize-codeowners": (alphabetize_codeowners.main, [], ("codeowners",)),
+}
+DISCOVERY_MODES = ("walk", "git")
+
+
+def write_corpus(root: str, corpus: Corpus) -> None:
+    for relpath, data in corpus.items():
+        path = os.path.join(root, relpath)
+        os.makedirs(os.path.dirname(path) or root, exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+
+
+def _result(
+    name: str, corpus_name: str, corpus: Corpus, times: list[float]
+) -> dict[str, t.Any]:
+    size = sum(map(len, corpus.values()))
+    best = min(times)
+    return {
+        "name": name,
+        "corpus": corpus_name,
+        "files": len(corpus),
+        "bytes": size,
+        "seconds": best,
+        "times": times,
+        "mb_per_s": size / best / 1e6,
+        "files_per_s": len(corpus) / best,
+    }
+
+
+@contextlib.contextmanager
+def _quiet_in(directory: str) -> t.Iterator[None]:
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        with open(os.devnull, "w") as devnull:
+            with (
+                contextlib.redirect_stdout(devnull),
+                contextlib.redirect_stderr(devnull),
+            ):
+                yield
+    finally:
+        os.chdir(cwd)
+
+
+def time_hook(
+    hook: str, corpus_name: str, corpus: Corpus, source: str, args: argparse.Namespace
+) -> dict[str, t.Any]:
+    main, extra_args, _ = HOOKS[hook]
+    argv = ["--no-cache", *extra_args, *sorted(corpus)]
+    if args.jobs is not None:
+        argv += ["--jobs", str(args.jobs)]
+    if args.io_concurrency is not None:
+        argv += ["--io-concurrency", str(args.io_concurrency)]
+    times = []
+    for _ in range(args.repeat):
+        with tempfile.TemporaryDirectory() as workdir:
+            workdir = os.path.join(workdir, "corpus")
+            shutil.copytree(source, workdir)
+            for name, content in _HOOK_FILES.items():
+                with open(os.path.join(os.path.dirname(workdir), name), "w") as f:
+                    f.write(content)
+            with _quiet_in(workdir):
+                start = time.perf_counter()
+                main(argv=argv)
+                times.append(time.perf_counter() - start)
+    return _result(hook, corpus_name, corpus, times)
+
+
+def time_discovery(
+    mode: str, corpus_name: str, corpus: Corpus, source: str, args: argparse.Namespace
+) -> dict[str, t.Any]:
+    times = []
+    for _ in range(args.repeat):
+        with _quiet_in(source):
+            start = time.perf_counter()
+            found = list(all_filenames([], discovery=mode))
+            times.append(time.perf_counter() - start)
+    assert len(found) == len(corpus), (mode, corpus_name, len(found))
+    return _result(f"discovery-{mode}", corpus_name, corpus, times)
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _git_init(directory: str) -> bool:
+    try:
+        for command in (["git", "init", "-q"], ["git", "add", "-A"]):
+            subprocess.run(command, cwd=directory, capture_output=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return False
+    return True
+
+
+def print_result(result: dict[str, t.Any], previous: dict[str, t.Any] | None) -> None:
+    line = (
+        f"{result['name']:<24} {result['corpus']:<11} {result['seconds']:>9.4f} "
+        f"{result['mb_per_s']:>10.2f} {result['files_per_s']:>11.1f}"
+    )
+    if previous is not None:
+        line += f" {previous['seconds'] / result['seconds']:>8.2f}x"
+    print(line, flush=True)
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--scale",
+        type=float,
+        default=1.0,
+        help="Multiply the size of every corpus by this factor. default: 1.0",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="Run each benchmark this many times, keeping the best. default: 3",
+    )
+    parser.add_argument(
+        "--hook",
+        action="append",
+        choices=[*HOOKS, *(f"discovery-{mode}" for mode in DISCOVERY_MODES)],
+        help="Only run this benchmark. May be given multiple times.",
+    )
+    parser.add_argument(
+        "--corpus",
+        action="append",
+        choices=list(CORPORA),
+        help="Only use this corpus. May be given multiple times.",
+    )
+    parser.add_argument("--jobs", type=int, help="Pass --jobs to the hooks.")
+    parser.add_argument(
+        "--io-concurrency", type=int, help="Pass --io-concurrency to the hooks."
+    )
+    parser.add_argument("--seed", type=int, default=0, help="default: 0")
+    parser.add_argument("--output", help="Save the results to this JSON file.")
+    parser.add_argument(
+        "--compare", help="Show speedups relative to the results in this JSON file."
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = parse_args(argv)
+    previous = {}
+    if args.compare:
+        with open(args.compare) as f:
+            previous = {(r["name"], r["corpus"]): r for r in json.load(f)["results"]}
+
+    results = []
+    print(
+        f"{'benchmark':<24} {'corpus':<11} {'seconds':>9} {'MB/s':>10} "
+        f"{'files/s':>11}" + (f" {'speedup':>9}" if previous else "")
+    )
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for corpus_name, generate in CORPORA.items():
+            if args.corpus and corpus_name not in args.corpus:
+                continue
+            corpus = generate(random.Random(args.seed), args.scale)
+            source = os.path.join(tmpdir, corpus_name)
+            write_corpus(source, corpus)
+
+            for hook, (_, _, corpora) in HOOKS.items():
+                if corpus_name in corpora and (not args.hook or hook in args.hook):
+                    results.append(time_hook(hook, corpus_name, corpus, source, args))
+                    print_result(results[-1], previous.get((hook, corpus_name)))
+
+            if corpus_name not in TEXT_CORPORA:
+                continue
+            for mode in DISCOVERY_MODES:
+                name = f"discovery-{mode}"
+                if args.hook and name not in args.hook:
+                    continue
+                if mode == "git" and not _git_init(source):
+                    print(f"skipping {name}: git is not available", file=sys.stderr)
+                    continue
+                results.append(time_discovery(mode, corpus_name, corpus, source, args))
+                print_result(results[-1], previous.get((name, corpus_name)))
+
+    if args.output:
+        meta = {
+            "commit": _git_commit(),
+            "python": sys.version,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "scale": args.scale,
+            "repeat": args.repeat,
+            "seed": args.seed,
+        }
+        with open(args.output, "w") as f:
+            json.dump({"meta": meta, "results": results}, f, indent=2)
+            f.write("\n")
+
+
+if __name__ == "__main__":
+    main()
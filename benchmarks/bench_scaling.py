@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+"""
+Time a hook over a corpus with increasing numbers of jobs, reporting the speedup
+over a single job, to show how the file loop scales on this build of Python.
+
+Run from the repo root with the package installed (or with `src` on the path):
+
+    python benchmarks/bench_scaling.py
+    python benchmarks/bench_scaling.py --backend processes --corpus ascii
+
+On builds of Python running without the GIL (e.g. `python3.14t`), the jobs are
+threads by default; elsewhere, they are worker processes. `--backend` overrides
+the choice, so that the two can be compared on the same build. The corpora are
+those of `bench_hooks.py`.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+
+from bench_hooks import CORPORA, HOOKS, TEXT_CORPORA, time_hook, write_corpus
+
+from texthooks import _recorders
+
+
+def _job_counts(max_jobs: int) -> list[int]:
+    counts = [1]
+    while counts[-1] * 2 < max_jobs:
+        counts.append(counts[-1] * 2)
+    if max_jobs > 1:
+        counts.append(max_jobs)
+    return counts
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--hook",
+        choices=[hook for hook, (_, _, corpora) in HOOKS.items() if "tiny" in corpora],
+        default="texthooks",
+        help="default: texthooks",
+    )
+    parser.add_argument(
+        "--corpus",
+        action="append",
+        choices=TEXT_CORPORA,
+        help="Use this corpus. May be given multiple times. default: tiny, ascii",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=("threads", "processes"),
+        help="Force the jobs to be threads or processes.",
+    )
+    parser.add_argument(
+        "--max-jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="The largest number of jobs to time. default: the CPU count",
+    )
+    parser.add_argument("--scale", type=float, default=1.0, help="default: 1.0")
+    parser.add_argument("--repeat", type=int, default=3, help="default: 3")
+    parser.add_argument("--seed", type=int, default=0, help="default: 0")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = parse_args(argv)
+    if args.backend is not None:
+        processes = args.backend == "processes"
+        _recorders._gil_enabled = lambda: processes
+    gil_enabled = getattr(sys, "_is_gil_enabled", lambda: True)()
+    backend = "processes" if _recorders._gil_enabled() else "threads"
+    print(f"python {sys.version.split()[0]}, GIL enabled: {gil_enabled}")
+    print(f"{args.hook}, jobs are {backend}")
+    print(f"{'corpus':<11} {'jobs':>5} {'seconds':>9} {'files/s':>11} {'speedup':>8}")
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for corpus_name in args.corpus or ("tiny", "ascii"):
+            corpus = CORPORA[corpus_name](random.Random(args.seed), args.scale)
+            source = os.path.join(tmpdir, corpus_name)
+            write_corpus(source, corpus)
+
+            baseline = None
+            for jobs in _job_counts(args.max_jobs):
+                hook_args = argparse.Namespace(
+                    jobs=jobs, io_concurrency=None, repeat=args.repeat
+                )
+                result = time_hook(args.hook, corpus_name, corpus, source, hook_args)
+                baseline = baseline or result["seconds"]
+                print(
+                    f"{corpus_name:<11} {jobs:>5} {result['seconds']:>9.4f} "
+                    f"{result['files_per_s']:>11.1f} "
+                    f"{baseline / result['seconds']:>7.2f}x",
+                    flush=True,
+                )
+
+
+if __name__ == "__main__":
+    main()
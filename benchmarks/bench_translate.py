@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+"""
+Compare the `str.translate` fixers against the regex-alternation fixers which
+they replaced. The fixers are timed as the recorders call them, through the
+function which `TranslationFixer.line_function` returns.
+
+Run from the repo root with the package installed (or with `src` on the path):
+
+    python benchmarks/bench_translate.py
+"""
+
+import re
+import timeit
+import typing as t
+
+from texthooks._common import codepoints2chars
+from texthooks.fix_ligatures import CHAR_MAP, LIGATURE_FIXER
+from texthooks.fix_smartquotes import (
+    DEFAULT_DOUBLE_QUOTE_CODEPOINTS,
+    DEFAULT_SINGLE_QUOTE_CODEPOINTS,
+)
+from texthooks.fix_smartquotes import gen_line_fixer as gen_smartquotes_fixer
+from texthooks.fix_spaces import DEFAULT_SEPARATOR_CODEPOINTS
+from texthooks.fix_spaces import gen_line_fixer as gen_spaces_fixer
+from texthooks.fix_unicode_dashes import (
+    DEFAULT_DOUBLE_HYPHEN_CODEPOINTS,
+    DEFAULT_SINGLE_HYPHEN_CODEPOINTS,
+)
+from texthooks.fix_unicode_dashes import gen_line_fixer as gen_dashes_fixer
+
+
+# the regex-based engine, as it was implemented before the switch to translate
+def _codepoints2regex(codepoints: t.Sequence[str]) -> re.Pattern:
+    return re.compile("(" + "|".join(codepoints2chars(codepoints)) + ")")
+
+
+def _regex_pair_fixer(
+    first: t.Sequence[str], first_repl: str, second: t.Sequence[str], second_repl: str
+) -> t.Callable[[str], str]:
+    first_regex = _codepoints2regex(first)
+    second_regex = _codepoints2regex(second)
+
+    def line_fixer(line: str) -> str:
+        return second_regex.sub(second_repl, first_regex.sub(first_repl, line))
+
+    return line_fixer
+
+
+def _regex_spaces_fixer() -> t.Callable[[str], str]:
+    regex = _codepoints2regex(DEFAULT_SEPARATOR_CODEPOINTS)
+    return lambda line: regex.sub(" ", line)
+
+
+_LIGATURE_REGEX = re.compile("(" + "|".join(CHAR_MAP.keys()) + ")")
+
+
+def _regex_ligatures_fixer(line: str) -> str:
+    return _LIGATURE_REGEX.sub(lambda m: CHAR_MAP.get(m.group(0), m.group(0)), line)
+
+
+FIXERS: dict[str, tuple[t.Callable[[str], str], t.Callable[[str], str]]] = {
+    "fix-smartquotes": (
+        _regex_pair_fixer(
+            DEFAULT_DOUBLE_QUOTE_CODEPOINTS, '"', DEFAULT_SINGLE_QUOTE_CODEPOINTS, "'"
+        ),
+        gen_smartquotes_fixer(
+            DEFAULT_SINGLE_QUOTE_CODEPOINTS, DEFAULT_DOUBLE_QUOTE_CODEPOINTS
+        ).line_function(),
+    ),
+    "fix-unicode-dashes": (
+        _regex_pair_fixer(
+            DEFAULT_DOUBLE_HYPHEN_CODEPOINTS,
+            "--",
+            DEFAULT_SINGLE_HYPHEN_CODEPOINTS,
+            "-",
+        ),
+        gen_dashes_fixer(
+            DEFAULT_SINGLE_HYPHEN_CODEPOINTS, DEFAULT_DOUBLE_HYPHEN_CODEPOINTS
+        ).line_function(),
+    ),
+    "fix-spaces": (
+        _regex_spaces_fixer(),
+        gen_spaces_fixer(DEFAULT_SEPARATOR_CODEPOINTS).line_function(),
+    ),
+    "fix-ligatures": (_regex_ligatures_fixer, LIGATURE_FIXER.line_function()),
+}
+
+CORPORA = {
+    "ascii": ["def foo(bar, baz):  # a line of source code\n"] * 2000,
+    "cjk": ["这是一行中文文本，其中没有任何需要替换的字符。\n"] * 2000,
+    "dense": ["“quoted” don’t — ﬁne ﬂow – x y\n"] * 2000,
+}
+
+
+def main() -> None:
+    print(f"{'hook':<20} {'corpus':<8} {'regex (ms)':>12} {'translate (ms)':>15}")
+    for hook, (regex_fixer, translate_fixer) in FIXERS.items():
+        for corpus_name, lines in CORPORA.items():
+            for line in lines[:1]:
+                assert regex_fixer(line) == translate_fixer(line), (hook, line)
+            regex_time = min(
+                timeit.repeat(
+                    "[fixer(x) for x in lines]",
+                    globals={"fixer": regex_fixer, "lines": lines},
+                    number=5,
+                )
+            )
+            translate_time = min(
+                timeit.repeat(
+                    "[fixer(x) for x in lines]",
+                    globals={"fixer": translate_fixer, "lines": lines},
+                    number=5,
+                )
+            )
+            print(
+                f"{hook:<20} {corpus_name:<8} "
+                f"{regex_time * 200:>12.3f} {translate_time * 200:>15.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
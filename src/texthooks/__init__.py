@@ -0,0 +1,45 @@
+"""
+pre-commit fixers and linters for handling text files
+
+The fixers and checkers can also be applied to text in memory, with `fix_text`,
+`fix_texts`, `check_text`, and `check_texts`. See `texthooks.api`.
+"""
+
+import typing as t
+
+if t.TYPE_CHECKING:
+    from .api import (
+        CHECKER_NAMES,
+        FIXER_NAMES,
+        Change,
+        Finding,
+        check_text,
+        check_texts,
+        fix_text,
+        fix_texts,
+    )
+
+__all__ = (
+    "FIXER_NAMES",
+    "CHECKER_NAMES",
+    "Change",
+    "Finding",
+    "fix_text",
+    "fix_texts",
+    "check_text",
+    "check_texts",
+)
+
+
+# the API is imported on first use, so that running a single hook does not import
+# all of the others
+def __getattr__(name: str) -> t.Any:
+    if name in __all__:
+        from . import api
+
+        return getattr(api, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__() -> list[str]:
+    return sorted(list(globals()) + list(__all__))
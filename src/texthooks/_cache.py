@@ -0,0 +1,313 @@
+#
+# a persistent cache of files which were found to be clean
+#
+# Each hook configuration gets its own cache file, named by a hash of the work done
+# on each file (the fixer or checker and its settings) and of the texthooks source.
+# In that file, clean files are recorded two ways:
+#
+# - by path, size, and mtime, so that an unmodified file is skipped without reading
+# - by git blob id, so that a file with the same content is skipped even when the
+#   stat info differs, e.g. in a fresh checkout with a cache copied from elsewhere;
+#   for files which git reports as unmodified, blob ids come from the index, which
+#   again avoids reading the file; this is only done for files which git stores
+#   as they are, without filters or line ending or encoding conversions, as the
+#   blob ids of the others do not match their content in the work tree
+#
+# Blob ids are computed from the content which the work on each file read anyway,
+# so that files are never read a second time. Files which are streamed, or read
+# through a memory map, are never held in memory whole, and are not cached.
+#
+# Files modified within the last few seconds are not recorded by path, as they may
+# be modified again without their mtime changing.
+#
+from __future__ import annotations
+
+import functools
+import hashlib
+import json
+import os
+import pickle
+import threading
+import time
+import typing as t
+
+DEFAULT_CACHE_DIR = os.path.join(".cache", "texthooks")
+
+_CACHE_FORMAT_VERSION = 1
+# the maximum number of paths and of blob ids retained in each cache file
+_MAX_ENTRIES = 100_000
+# the maximum number of cache files (one per hook configuration) retained, and the
+# age after which unused ones are removed
+_MAX_CACHE_FILES = 16
+_MAX_CACHE_FILE_AGE = 30 * 24 * 60 * 60
+_RACY_SECONDS = 2
+# at most this many paths are given to git to look up their blob ids; beyond that,
+# the whole index is read
+_MAX_GIT_PATHSPECS = 1000
+# the attributes which make git store a file differently from its content in the
+# work tree
+_CONVERSION_ATTRIBUTES = ("filter", "text", "eol", "ident", "working-tree-encoding")
+
+# (size, mtime_ns, blob id)
+Fingerprint = tuple[int, int, str]
+
+
+def git_blob_id(data: bytes) -> str:
+    digest = hashlib.sha1(b"blob %d\0" % len(data))
+    digest.update(data)
+    return digest.hexdigest()
+
+
+def _package_sources() -> tuple[tuple[str, int, int], ...]:
+    pkgdir = os.path.dirname(os.path.abspath(__file__))
+    sources = []
+    for entry in os.scandir(pkgdir):
+        if entry.name.endswith(".py"):
+            stat = entry.stat()
+            sources.append((entry.path, stat.st_size, stat.st_mtime_ns))
+    return tuple(sorted(sources))
+
+
+def package_fingerprint() -> str:
+    """A hash of the texthooks source, which changes whenever the package does.
+
+    The source is only read again when the size or mtime of one of its files
+    changes, so that a long-running process (such as the daemon) can check it
+    cheaply."""
+    return _hash_sources(_package_sources())
+
+
+@functools.lru_cache(maxsize=1)
+def _hash_sources(sources: tuple[tuple[str, int, int], ...]) -> str:
+    digest = hashlib.sha256()
+    for path, _, _ in sources:
+        with open(path, "rb") as f:
+            digest.update(os.path.basename(path).encode() + b"\0" + f.read() + b"\0")
+    return digest.hexdigest()
+
+
+def config_key(work: t.Any) -> str | None:
+    """Compute the cache key for a unit of work, or None if it can't be computed."""
+    try:
+        payload = pickle.dumps((_CACHE_FORMAT_VERSION, package_fingerprint(), work))
+    except (pickle.PicklingError, AttributeError, TypeError):
+        return None
+    return hashlib.sha256(payload).hexdigest()[:32]
+
+
+# the state of `fingerprinted` in each thread, which may be running work on a file
+_local = threading.local()
+
+
+def note_read(data: bytes) -> None:
+    """Record the content of a file, as read by work running under `fingerprinted`.
+    Outside of `fingerprinted`, this does nothing."""
+    if getattr(_local, "fingerprinting", False):
+        _local.blob_id = git_blob_id(data)
+
+
+def fingerprinted(
+    work: t.Callable[[str], t.Any], filename: str
+) -> tuple[t.Any, Fingerprint | None]:
+    """Run work on a file, and fingerprint the content which the work read, as
+    passed to `note_read`.
+
+    The fingerprint is None if the work did not read the whole file at once, or if
+    the file changed while the work ran, including when the work itself rewrote
+    the file."""
+    before = os.stat(filename)
+    _local.fingerprinting, _local.blob_id = True, None
+    try:
+        result = work(filename)
+        blob_id = _local.blob_id
+    finally:
+        _local.fingerprinting, _local.blob_id = False, None
+    if blob_id is None:
+        return result, None
+    after = os.stat(filename)
+    if (before.st_size, before.st_mtime_ns) != (after.st_size, after.st_mtime_ns):
+        return result, None
+    return result, (after.st_size, after.st_mtime_ns, blob_id)
+
+
+def _git_lines(*args: str, input: str | None = None) -> list[str]:
+    import subprocess
+
+    try:
+        proc = subprocess.run(
+            ["git", "--literal-pathspecs", *args],
+            input=None if input is None else input.encode("utf-8", "surrogateescape"),
+            capture_output=True,
+            check=True,
+            timeout=60,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return []
+    return [x for x in proc.stdout.decode("utf-8", "surrogateescape").split("\0") if x]
+
+
+def _git_index_blob_ids(paths: list[str]) -> dict[str, str]:
+    # map paths (relative to the cwd) to blob ids, for files which git reports as
+    # unmodified relative to the index
+    # only the given paths are looked up, so that git does not stat the whole work
+    # tree, unless there are so many that reading the whole index is cheaper
+    pathspecs = ["--", *paths] if len(paths) <= _MAX_GIT_PATHSPECS else []
+    modified = {
+        os.path.normpath(x) for x in _git_lines("ls-files", "-z", "-m", *pathspecs)
+    }
+    blob_ids = {}
+    # entries are formatted as "<mode> <blob id> <stage>\t<path>"
+    for entry in _git_lines("ls-files", "-z", "-s", *pathspecs):
+        info, _, path = entry.partition("\t")
+        path = os.path.normpath(path)
+        if path not in modified:
+            blob_ids[path] = info.split()[1]
+    if not blob_ids or _git_converts_line_endings():
+        return {}
+    for path in _paths_with_conversions(list(blob_ids)):
+        del blob_ids[path]
+    return blob_ids
+
+
+def _git_converts_line_endings() -> bool:
+    # core.autocrlf converts the line endings of text files which have no
+    # attributes set at all
+    values = _git_lines("config", "-z", "--get", "core.autocrlf")
+    return bool(values) and values[-1].lower() not in ("false", "no", "off", "0", "")
+
+
+def _paths_with_conversions(paths: list[str]) -> set[str]:
+    # find which of the paths have any of the conversion attributes set; if git
+    # fails, all of them are assumed to
+    output = _git_lines(
+        "check-attr", "-z", "--stdin", *_CONVERSION_ATTRIBUTES, input="\0".join(paths)
+    )
+    if len(output) != 3 * len(paths) * len(_CONVERSION_ATTRIBUTES):
+        return set(paths)
+    # entries are formatted as "<path>\0<attribute>\0<value>", with the
+    # attributes of each path in turn, in the order in which they were given
+    values = output[2::3]
+    per_path = len(_CONVERSION_ATTRIBUTES)
+    return {
+        path
+        for i, path in enumerate(paths)
+        if any(
+            value not in ("unspecified", "unset")
+            for value in values[i * per_path : (i + 1) * per_path]
+        )
+    }
+
+
+class ResultCache:
+    def __init__(self, cache_dir: str, key: str) -> None:
+        self.cache_dir = cache_dir
+        self.path = os.path.join(cache_dir, f"{key}.json")
+        self.hits = 0
+        self._files, self._blobs = self._load()
+        self._modified = False
+
+    @classmethod
+    def open(cls, cache_dir: str, work: t.Any) -> ResultCache | None:
+        key = config_key(work)
+        if key is None:
+            return None
+        return cls(cache_dir, key)
+
+    def _load(self) -> tuple[dict[str, list[t.Any]], dict[str, None]]:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data["version"] != _CACHE_FORMAT_VERSION:
+                return {}, {}
+            return data["files"], dict.fromkeys(data["blobs"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return {}, {}
+
+    def find_clean(self, filenames: list[str]) -> list[bool]:
+        """Find which of the files are known to be clean. Files which miss the cache
+        by path are looked up by their blob id in the git index."""
+        clean = []
+        misses: dict[str, os.stat_result] = {}
+        for filename in filenames:
+            path = os.path.normpath(filename)
+            try:
+                stat = os.stat(filename)
+            except OSError:
+                clean.append(False)
+                continue
+            entry = self._files.get(path)
+            if entry is not None and entry[:2] == [stat.st_size, stat.st_mtime_ns]:
+                # move the entry to the end, marking it as recently used
+                self._files[path] = self._files.pop(path)
+                self._modified = True
+                self.hits += 1
+                clean.append(True)
+            else:
+                misses[path] = stat
+                clean.append(False)
+        if not misses or not self._blobs:
+            return clean
+
+        index_blob_ids = _git_index_blob_ids(list(misses))
+        for i, filename in enumerate(filenames):
+            path = os.path.normpath(filename)
+            blob_id = index_blob_ids.get(path)
+            if not clean[i] and blob_id is not None and blob_id in self._blobs:
+                stat = misses[path]
+                self.add_clean(filename, (stat.st_size, stat.st_mtime_ns, blob_id))
+                self.hits += 1
+                clean[i] = True
+        return clean
+
+    def add_clean(self, filename: str, fingerprint: Fingerprint) -> None:
+        size, mtime_ns, blob_id = fingerprint
+        path = os.path.normpath(filename)
+        self._files.pop(path, None)
+        if time.time_ns() - mtime_ns > _RACY_SECONDS * 1_000_000_000:
+            self._files[path] = [size, mtime_ns, blob_id]
+        self._blobs.pop(blob_id, None)
+        self._blobs[blob_id] = None
+        self._modified = True
+
+    def save(self) -> None:
+        if not self._modified:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            gitignore = os.path.join(self.cache_dir, ".gitignore")
+            if not os.path.exists(gitignore):
+                with open(gitignore, "w", encoding="utf-8") as f:
+                    f.write("# created by texthooks\n*\n")
+
+            # merge with the current content, in case another process (e.g. another
+            # pre-commit batch) saved entries since this cache was loaded
+            files, blobs = self._load()
+            files.update(self._files)
+            blobs.update(self._blobs)
+            data = {
+                "version": _CACHE_FORMAT_VERSION,
+                "files": dict(list(files.items())[-_MAX_ENTRIES:]),
+                "blobs": list(blobs)[-_MAX_ENTRIES:],
+            }
+            import tempfile
+
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(tmp_path, self.path)
+            self._evict_cache_files()
+        except OSError:
+            # the cache is an optimization, failing to save it is not an error
+            pass
+        self._modified = False
+
+    def _evict_cache_files(self) -> None:
+        now = time.time()
+        cache_files = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".json"):
+                cache_files.append((entry.stat().st_mtime, entry.path))
+        cache_files.sort(reverse=True)
+        for i, (mtime, path) in enumerate(cache_files):
+            if i >= _MAX_CACHE_FILES or now - mtime > _MAX_CACHE_FILE_AGE:
+                os.remove(path)
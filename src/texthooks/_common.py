@@ -2,14 +2,15 @@
 # common tools/utilities
 #
 import argparse
-import glob
+import functools
 import re
 import sys
 import typing as t
 
-from identify import identify
+from ._cache import DEFAULT_CACHE_DIR
+from ._discovery import git_text_files, walk_text_files
 
-_ANSI_RE = re.compile(r"\033\[[;?0-9]*[a-zA-Z]")
+_ANSI_RE = r"\033\[[;?0-9]*[a-zA-Z]"
 _ANSI_COLORS = {
     "yellow": 33,
     "bright_red": 91,
@@ -21,7 +22,7 @@ _ANSI_RESET = f"{_ANSI_ESCAPE}[0m"
 
 
 def strip_ansi(s: str) -> str:
-    return _ANSI_RE.sub("", s)
+    return re.sub(_ANSI_RE, "", s)
 
 
 def colorize(s: str, *, color: str, bold: bool = False) -> str:
@@ -39,15 +40,270 @@ def codepoints2chars(codepoints: t.Sequence[str]) -> t.List[str]:
     return [chr(int(c, 16)) for c in codepoints]
 
 
-def all_filenames(files: t.Optional[t.Iterable[str]]) -> t.Iterator[str]:
-    if not files:
-        for fn in glob.iglob("**/*", recursive=True):
-            tags = identify.tags_from_path(fn)
-            if "text" in tags:
-                yield fn
+def codepoints2map(codepoints: t.Sequence[str], replacement: str) -> dict[str, str]:
+    return {c: replacement for c in codepoints2chars(codepoints)}
+
+
+def trie_pattern(strings: t.Iterable[str], *, utf8: bool = False) -> str:
+    """
+    Make a regex pattern which matches any of a set of strings, shaped as a trie.
+
+    Strings which share a prefix share a branch of the pattern, so the work done at
+    each position of the text depends on the length of the strings, not on how many
+    there are. Where more than one of the strings matches at a position, the
+    longest is preferred.
+
+    :param strings: The strings to match.
+    :param utf8: Match the UTF-8 encodings of the strings. The pattern should be
+        encoded as ASCII and compiled as a bytes pattern.
+    """
+    trie: dict[str, t.Any] = {}
+    for string in strings:
+        node = trie
+        units: t.Iterable[str] = string
+        if utf8:
+            units = (f"\\x{byte:02x}" for byte in string.encode("utf-8"))
+        for unit in units:
+            node = node.setdefault(unit if utf8 else re.escape(unit), {})
+        node[""] = {}
+    return _trie_node_pattern(trie) if trie else "(?!)"
+
+
+def _trie_node_pattern(node: dict[str, t.Any]) -> str:
+    # the strings which end at a node are marked by an empty key
+    leaves = sorted(unit for unit, child in node.items() if unit and child == {"": {}})
+    branches = [
+        unit + _trie_node_pattern(child)
+        for unit, child in sorted(node.items())
+        if unit and child != {"": {}}
+    ]
+    if len(leaves) > 1:
+        branches.append(f"[{''.join(leaves)}]")
     else:
-        for fn in files:
-            yield fn
+        branches.extend(leaves)
+    if not branches:
+        return ""
+    if "" not in node and len(branches) == 1:
+        return branches[0]
+    # the branches are tried before the end of a shorter string, so that longer
+    # strings are matched first
+    return f"(?:{'|'.join(branches)})" + ("?" if "" in node else "")
+
+
+class TriggerSet:
+    """
+    A set of strings, at least one of which must appear in text for a fixer or
+    checker to act on it.
+
+    Fixers and checkers declare their triggers as a `triggers` attribute, so that
+    whole files can be skipped after a single scan of their content.
+    """
+
+    def __init__(self, triggers: t.Iterable[str]) -> None:
+        self.triggers = frozenset(x for x in triggers if x)
+        # if every trigger contains a non-ASCII character, pure ASCII content can be
+        # skipped without searching it at all
+        self._skip_ascii = not any(x.isascii() for x in self.triggers)
+        self._ordered = sorted(self.triggers, key=lambda x: (-len(x), x))
+        self._byte_pattern: re.Pattern[bytes] | None = None
+
+    def __reduce__(self) -> tuple[type, tuple[tuple[str, ...]]]:
+        # pickle the triggers in order, rather than as a frozenset, so that equal
+        # trigger sets always pickle identically (this is part of cache keys)
+        return (TriggerSet, (tuple(self._ordered),))
+
+    def __or__(self, other: "TriggerSet") -> "TriggerSet":
+        return TriggerSet(self.triggers | other.triggers)
+
+    # the patterns are compiled on first use, rather than when hooks are defined at
+    # import time
+    @functools.cached_property
+    def pattern(self) -> re.Pattern[str]:
+        """A pattern matching the triggers, or the longest of them where several
+        match at the same place."""
+        return re.compile(trie_pattern(self.triggers))
+
+    @property
+    def byte_pattern(self) -> re.Pattern[bytes]:
+        """A pattern matching the UTF-8 encodings of the triggers."""
+        if self._byte_pattern is None:
+            self._byte_pattern = re.compile(
+                trie_pattern(self.triggers, utf8=True).encode("ascii")
+            )
+        return self._byte_pattern
+
+    def search(self, content: str | bytes) -> bool:
+        if self._skip_ascii and content.isascii():
+            return False
+        if isinstance(content, bytes):
+            # bytes are searched for the UTF-8 encodings of the triggers, so that
+            # files with nothing to change are never decoded (this is about as fast
+            # as decoding and searching the text, and needs no copy of it)
+            return self.byte_pattern.search(content) is not None
+        return self.pattern.search(content) is not None
+
+
+class TranslationFixer:
+    """
+    A line fixer which replaces characters using a `str.translate` table.
+
+    Each character in the replacement map is replaced with its (possibly
+    multi-character) replacement in one pass over the line. Characters which map to
+    themselves are dropped from the table, as they can never produce a change.
+
+    `str.translate` does a table lookup for every character of its input, which is
+    slower than a regex scan for lines with nothing to replace. Lines are therefore
+    checked against a character class of the replaced characters first, and only
+    translated when one of them is present. When every character has the same
+    replacement, the character class is used to substitute it directly instead.
+    """
+
+    def __init__(self, replacements: t.Mapping[str, str]) -> None:
+        self.replacements = {k: v for k, v in replacements.items() if k != v}
+        self.triggers = TriggerSet(self.replacements)
+        self._table: list[int | str] | None = None
+        distinct_replacements = set(self.replacements.values())
+        # escaped for use as an `re.sub` template
+        self._single_replacement = (
+            distinct_replacements.pop().replace("\\", "\\\\")
+            if len(distinct_replacements) == 1
+            else None
+        )
+
+    @functools.cached_property
+    def pattern(self) -> re.Pattern[str]:
+        return self.triggers.pattern
+
+    @property
+    def table(self) -> list[int | str]:
+        # a list indexed by codepoint is used rather than a dict, because a dict
+        # lookup misses (and raises internally) for every unmapped non-ASCII
+        # character. It is built on first use, since most runs never need it
+        if self._table is None:
+            table: list[int | str] = list(range(max(map(ord, self.replacements)) + 1))
+            for char, replacement in self.replacements.items():
+                table[ord(char)] = replacement
+            self._table = table
+        return self._table
+
+    def __getstate__(self) -> dict[str, t.Any]:
+        # the table is rebuilt on demand, rather than copied to worker processes, and
+        # the pattern is left out so that a fixer pickles the same before and after
+        # its first use (this is part of cache keys)
+        state = {**self.__dict__, "_table": None}
+        state.pop("pattern", None)
+        return state
+
+    def replacement_spans(self, line: str) -> list[tuple[int, int, int, int]]:
+        """Find the replacements which fixing a line makes, as the start and end
+        offsets of each replaced section in the line and in the fixed line."""
+        spans = []
+        delta = 0
+        for match in self.pattern.finditer(line):
+            start, end = match.span()
+            replacement = self.replacements[match.group()]
+            spans.append((start, end, start + delta, start + delta + len(replacement)))
+            delta += len(replacement) - (end - start)
+        return spans
+
+    def __call__(self, line: str) -> str:
+        if self._single_replacement is not None:
+            return self.pattern.sub(self._single_replacement, line)
+        if self.pattern.search(line) is None:
+            return line
+        return line.translate(self.table)
+
+    def line_function(self) -> t.Callable[[str], str]:
+        """Get a plain function which fixes lines as calling the fixer does.
+
+        Calling an instance costs more than calling a function or a bound method,
+        which is a large part of the time spent on a line with nothing to replace,
+        so the recorders get this once per file and call it for each line."""
+        if self._single_replacement is not None:
+            return functools.partial(self.pattern.sub, self._single_replacement)
+        search, table = self.pattern.search, self.table
+
+        def fix(line: str) -> str:
+            return line if search(line) is None else line.translate(table)
+
+        return fix
+
+
+@functools.lru_cache(maxsize=32)
+def _cached_translation_fixer(
+    replacements: tuple[tuple[str, str], ...],
+) -> TranslationFixer:
+    return TranslationFixer(dict(replacements))
+
+
+def translation_fixer(replacements: t.Mapping[str, str]) -> TranslationFixer:
+    """Get a TranslationFixer for a replacement map. The same fixer is returned for
+    equal maps, so that a long-running process (such as the daemon) builds the
+    pattern and table of each fixer only once."""
+    return _cached_translation_fixer(tuple(replacements.items()))
+
+
+class CharacterChecker:
+    """
+    A line checker which fails lines containing any of a set of characters.
+
+    The characters are its `triggers`, so that files are checked with one scan of
+    their content, and only the lines containing a character are passed to it.
+    """
+
+    def __init__(self, chars: t.Iterable[str]) -> None:
+        self.triggers = TriggerSet(chars)
+
+    @functools.cached_property
+    def pattern(self) -> re.Pattern[str]:
+        return self.triggers.pattern
+
+    def __getstate__(self) -> dict[str, t.Any]:
+        # as for TranslationFixer, the pattern is not pickled
+        return {k: v for k, v in self.__dict__.items() if k != "pattern"}
+
+    def __call__(self, line: str) -> bool:
+        return self.pattern.search(line) is None
+
+
+def all_filenames(
+    files: t.Optional[t.Iterable[str]],
+    exclude: t.Iterable[str] | None = None,
+    *,
+    discovery: str = "auto",
+    untracked: bool = False,
+) -> t.Iterator[str]:
+    """Yield the given files or, if there are none, all text files in the current
+    directory (recursive) which do not match the `exclude` patterns.
+
+    With `discovery="auto"`, files are listed by git when inside a git work tree,
+    and found by walking the directory otherwise. "git" and "walk" force one or the
+    other. `untracked` includes untracked files which git does not ignore."""
+    if files:
+        yield from files
+        return
+
+    if discovery != "walk":
+        found = git_text_files(exclude, untracked)
+        if found is not None:
+            yield from found
+            return
+        if discovery == "git":
+            print(
+                "--discovery=git cannot be used outside of a git work tree.",
+                file=sys.stderr,
+            )
+            raise SystemExit(2)
+    yield from walk_text_files(".", exclude)
+
+
+def all_filenames_from_args(args: argparse.Namespace) -> t.Iterator[str]:
+    return all_filenames(
+        args.files,
+        args.exclude,
+        discovery=args.discovery,
+        untracked=args.untracked,
+    )
 
 
 class ColorParseAction(argparse.Action):
@@ -61,6 +317,32 @@ class ColorParseAction(argparse.Action):
         setattr(namespace, self.dest, values == "on")
 
 
+def _positive_int(value: str) -> int:
+    result = int(value)
+    if result < 1:
+        raise argparse.ArgumentTypeError(f"{value} is not a positive integer")
+    return result
+
+
+# files of this size or larger are processed as a stream of lines by default
+DEFAULT_STREAM_THRESHOLD = 64 * 1024 * 1024
+
+_SIZE_SUFFIXES = {"k": 1024, "m": 1024**2, "g": 1024**3}
+
+
+def _size(value: str) -> int:
+    # a number of bytes, with an optional K, M, or G suffix
+    multiplier = _SIZE_SUFFIXES.get(value[-1:].lower(), 1)
+    digits = value[:-1] if multiplier > 1 else value
+    try:
+        result = int(digits) * multiplier
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{value} is not a valid size")
+    if result < 1:
+        raise argparse.ArgumentTypeError(f"{value} is not a positive size")
+    return result
+
+
 def _standard_cli_parser(
     doc: str, fixer: bool, disable_args: t.Iterable[str] | None = None
 ) -> argparse.ArgumentParser:
@@ -81,18 +363,143 @@ def _standard_cli_parser(
         nargs="*",
         help="default: all text files in current directory (recursive)",
     )
+    _maybe_add_arg(
+        "--exclude",
+        action="append",
+        default=[],
+        metavar="PATTERN",
+        help=(
+            "When searching for files, skip files and directories matching this "
+            "glob pattern. May be given multiple times"
+        ),
+    )
+    _maybe_add_arg(
+        "--discovery",
+        choices=("auto", "git", "walk"),
+        default="auto",
+        help=(
+            "How to find files when none are given: list them with git, or walk "
+            "the directory. 'auto' uses git inside of a git work tree. "
+            "Defaults to 'auto'"
+        ),
+    )
+    _maybe_add_arg(
+        "--untracked",
+        action="store_true",
+        default=False,
+        help="When git lists the files, include untracked files which are not ignored",
+    )
     _maybe_add_arg(
         "--show-changes",
         action="store_true",
         default=False,
         help="Show the lines which were changed",
     )
+    _maybe_add_arg(
+        "--format",
+        choices=("text", "ndjson"),
+        default="text",
+        help=(
+            "The output format. 'ndjson' writes a JSON event for each finding, and "
+            "for each file with findings, as soon as the file is processed. "
+            "Defaults to 'text'"
+        ),
+    )
     _maybe_add_arg(
         "-v", "--verbose", action="count", help="Increase output verbosity", default=0
     )
     _maybe_add_arg(
         "-q", "--quiet", action="count", help="Decrease output verbosity", default=0
     )
+    _maybe_add_arg(
+        "--utf8-bytes",
+        action="store_true",
+        default=False,
+        help=(
+            "Process files as raw UTF-8 bytes. Only lines which may need changes are "
+            "decoded, and files with nothing to change are never decoded."
+        ),
+    )
+    _maybe_add_arg(
+        "-j",
+        "--jobs",
+        type=_positive_int,
+        default=None,
+        help=(
+            "The number of worker processes (or threads, on free-threaded Python) "
+            "to use. Defaults to the number of CPUs when many files are being "
+            "processed"
+        ),
+    )
+    _maybe_add_arg(
+        "--io-concurrency",
+        type=_positive_int,
+        default=None,
+        metavar="N",
+        help=(
+            "Work on up to N files at once in threads, overlapping their reads and "
+            "writes, rather than using worker processes. Useful on network "
+            "filesystems"
+        ),
+    )
+    _maybe_add_arg(
+        "--stream-threshold",
+        type=_size,
+        default=DEFAULT_STREAM_THRESHOLD,
+        metavar="SIZE",
+        help=(
+            "Process files of this size or larger one line at a time, rather than "
+            "reading them into memory. Accepts K, M, and G suffixes. Defaults to 64M"
+        ),
+    )
+    _maybe_add_arg(
+        "--no-cache",
+        action="store_true",
+        default=False,
+        help="Do not read or write the cache of files found to be clean",
+    )
+    _maybe_add_arg(
+        "--cache-dir",
+        default=DEFAULT_CACHE_DIR,
+        help=f"The directory for the cache. Defaults to '{DEFAULT_CACHE_DIR}'",
+    )
+    _maybe_add_arg(
+        "--timings",
+        action="store_true",
+        default=False,
+        help=(
+            "Print the time spent in each phase of the run, and on the slowest "
+            "files, to stderr"
+        ),
+    )
+    _maybe_add_arg(
+        "--trace-memory",
+        action="store_true",
+        default=False,
+        help=(
+            "Trace memory allocations, and include the peak in the timings. "
+            "Implies --timings and --jobs 1"
+        ),
+    )
+    _maybe_add_arg(
+        "--profile",
+        metavar="FILE",
+        help="Write cProfile stats for the run to FILE. Implies --jobs 1",
+    )
+    _maybe_add_arg(
+        "--metrics-file",
+        metavar="FILE",
+        help=(
+            "Write metrics for the run to FILE, for dashboards. The file is written "
+            "in the Prometheus text format if its name ends in '.prom', and as JSON "
+            "otherwise"
+        ),
+    )
+    _maybe_add_arg(
+        "--metrics-format",
+        choices=("json", "prometheus"),
+        help="The format of the --metrics-file, overriding its extension",
+    )
     _maybe_add_arg(
         "--color",
         type=str.lower,
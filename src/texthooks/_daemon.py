@@ -0,0 +1,531 @@
+#
+# an optional resident daemon, which runs hooks for the console scripts
+#
+# The console scripts are thin clients: if a daemon is listening on the socket for
+# this installation, they send it their argv and cwd, and print the output it sends
+# back. Otherwise, or if the daemon cannot take the run, they import the hook and
+# run it in-process, as before. The client side of this module is kept cheap to
+# import, since it is imported by every hook run; the server side imports what it
+# needs when it starts.
+#
+# The daemon serves one run at a time, in the same way a hook runs in its own
+# process: in the client's working directory and environment. Its stdout is sent
+# to the client as it is written, as one JSON message per write, so that output
+# such as `--format ndjson` events is streamed; the last message holds the exit
+# code and stderr. It restarts itself when the installed texthooks source changes.
+#
+# Clients only trust a daemon whose socket, and the directory containing it, belong
+# to the user, and, where the platform can report it, whose process does too.
+#
+from __future__ import annotations
+
+import io
+import json
+import os
+import socket
+import stat
+import struct
+import sys
+import typing as t
+import zlib
+
+# the modules which provide each console script's `main`
+HOOK_MODULES = {
+    "alphabetize-codeowners": "texthooks.alphabetize_codeowners",
+    "fix-smartquotes": "texthooks.fix_smartquotes",
+    "fix-spaces": "texthooks.fix_spaces",
+    "fix-ligatures": "texthooks.fix_ligatures",
+    "fix-unicode-dashes": "texthooks.fix_unicode_dashes",
+    "forbid-bidi-controls": "texthooks.forbid_bidi_controls",
+    "macro-expand": "texthooks.macro_expand",
+    "texthooks": "texthooks.combined",
+}
+
+_PKGDIR = os.path.dirname(os.path.abspath(__file__))
+# clients give up quickly on a daemon which does not accept connections, and the
+# daemon gives up on a client which does not send its request
+_CONNECT_TIMEOUT = 1.0
+_REQUEST_TIMEOUT = 10.0
+# clients give up on a daemon which has sent nothing for this long
+_RESPONSE_TIMEOUT = 300.0
+
+
+def _is_startup_variable(name: str) -> bool:
+    # environment variables which are read as the interpreter starts (e.g. to set
+    # the filesystem encoding), and so cannot be changed for a run in the daemon
+    return name.startswith(("PYTHON", "LC_")) or name in ("LANG", "LANGUAGE")
+
+
+def _startup_environment(environ: t.Mapping[str, str]) -> dict[str, str]:
+    return {k: v for k, v in environ.items() if _is_startup_variable(k)}
+
+
+def socket_path() -> str:
+    """The path of the daemon's socket. Each user, and each installation of
+    texthooks (e.g. in each pre-commit environment), has its own daemon.
+
+    `TEXTHOOKS_SOCKET` overrides the path."""
+    path = os.environ.get("TEXTHOOKS_SOCKET")
+    if path:
+        return path
+    directory = os.environ.get("XDG_RUNTIME_DIR") or os.path.join(
+        os.environ.get("TMPDIR", "/tmp"), f"texthooks-{os.getuid()}"
+    )
+    install = zlib.crc32(f"{sys.executable}\0{_PKGDIR}".encode())
+    return os.path.join(directory, f"texthooks-{install:08x}.sock")
+
+
+def _is_private(path: str) -> bool:
+    # the socket, and the directory containing it, must belong to the user, and the
+    # directory must be closed to other users, who could otherwise put a socket of
+    # their own in its place
+    try:
+        directory = os.stat(os.path.dirname(path) or ".")
+        info = os.lstat(path)
+    except OSError:
+        return False
+    uid = os.getuid()
+    return (
+        stat.S_ISSOCK(info.st_mode)
+        and info.st_uid == uid
+        and directory.st_uid == uid
+        and not directory.st_mode & 0o077
+    )
+
+
+def _peer_is_user(sock: socket.socket) -> bool:
+    # where the platform does not report the peer's credentials, the private
+    # socket directory is relied upon
+    if not hasattr(socket, "SO_PEERCRED"):
+        return True
+    size = struct.calcsize("3i")
+    creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, size)
+    _, uid, _ = struct.unpack("3i", creds)
+    return bool(uid == os.getuid())
+
+
+def _request(
+    path: str,
+    message: dict[str, t.Any],
+    output: t.Callable[[str], None] | None = None,
+) -> tuple[bool, dict[str, t.Any] | None]:
+    # send a request, returning whether it was sent, and the final response, if
+    # any; output sent before the response is passed to `output`
+    # a request is not sent to a socket or daemon which belongs to another user;
+    # once it is sent, a daemon which stops answering is treated as having failed,
+    # as it may still be working on the files
+    if not _is_private(path):
+        return False, None
+    try:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    except (AttributeError, OSError):
+        return False, None
+    with sock:
+        try:
+            sock.settimeout(_CONNECT_TIMEOUT)
+            sock.connect(path)
+            if not _peer_is_user(sock):
+                return False, None
+            sock.settimeout(_RESPONSE_TIMEOUT)
+            sock.sendall(json.dumps(message).encode("utf-8") + b"\n")
+            sock.shutdown(socket.SHUT_WR)
+        except OSError:
+            return False, None
+        try:
+            with sock.makefile("rb") as responses:
+                for line in responses:
+                    response = json.loads(line)
+                    if "output" not in response:
+                        return True, response
+                    if output is not None:
+                        output(response["output"])
+        except (OSError, ValueError):
+            pass
+        return True, None
+
+
+def _recv_all(sock: socket.socket) -> bytes:
+    chunks = []
+    while chunk := sock.recv(65536):
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def _write(stream: t.TextIO, text: str) -> None:
+    # output may hold undecodable bytes of files read with `--utf8-bytes`, as
+    # surrogates, which are shown escaped if the stream cannot write them, as the
+    # hooks do when they run in-process
+    try:
+        stream.write(text)
+    except UnicodeEncodeError:
+        encoding = stream.encoding or "utf-8"
+        stream.write(text.encode(encoding, "backslashreplace").decode(encoding))
+    stream.flush()
+
+
+def forward(hook: str, argv: list[str]) -> int | None:
+    """Run a hook in the daemon, if one is running, and print its output.
+
+    Returns the exit code of the run, or None if the hook should be run
+    in-process: when there is no daemon which belongs to the user, when
+    `TEXTHOOKS_NO_DAEMON` is set, or when the daemon declines the run, because it
+    is restarting or because it was started with a different locale or Python
+    settings."""
+    if os.environ.get("TEXTHOOKS_NO_DAEMON") or not hasattr(socket, "AF_UNIX"):
+        return None
+    request = {
+        "hook": hook,
+        "argv": argv,
+        "cwd": os.getcwd(),
+        "env": dict(os.environ),
+    }
+    # the stream is looked up once, before the daemon may redirect stdout
+    stdout = sys.stdout
+    sent, response = _request(socket_path(), request, lambda text: _write(stdout, text))
+    if not sent:
+        return None
+    if response is None:
+        # the daemon may have changed files, or may still be changing them, so the
+        # run is not repeated
+        print(
+            "texthooks: lost the connection to the daemon, or it stopped answering",
+            file=sys.stderr,
+        )
+        return 1
+    if response.get("exit_code") is None:
+        return None
+    _write(sys.stderr, response["stderr"])
+    return int(response["exit_code"])
+
+
+def run_hook(hook: str, argv: list[str] | None = None) -> int:
+    """Run a hook, in the daemon if one is running, or else in-process."""
+    if argv is None:
+        argv = sys.argv[1:]
+    exit_code = forward(hook, argv)
+    if exit_code is not None:
+        return exit_code
+
+    import importlib
+
+    main = importlib.import_module(HOOK_MODULES[hook]).main
+    return t.cast(int, main(argv=argv))
+
+
+def _entry_point(hook: str) -> t.Callable[[], int]:
+    def main() -> int:
+        return run_hook(hook)
+
+    main.__qualname__ = main.__name__ = hook.replace("-", "_")
+    return main
+
+
+# the console scripts
+alphabetize_codeowners = _entry_point("alphabetize-codeowners")
+fix_smartquotes = _entry_point("fix-smartquotes")
+fix_spaces = _entry_point("fix-spaces")
+fix_ligatures = _entry_point("fix-ligatures")
+fix_unicode_dashes = _entry_point("fix-unicode-dashes")
+forbid_bidi_controls = _entry_point("forbid-bidi-controls")
+macro_expand = _entry_point("macro-expand")
+texthooks = _entry_point("texthooks")
+
+
+def _exit_code(code: t.Any) -> int:
+    # the exit status for a `SystemExit` code, as the interpreter would give it
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code
+    print(code, file=sys.stderr)
+    return 1
+
+
+class Daemon:
+    """
+    A server which runs hooks for clients, one at a time, on a Unix socket.
+
+    The hooks are imported once, when the daemon starts, and the fixers they build
+    are reused between runs. If the texthooks source changes, the daemon declines
+    the next run, so that the client runs it in-process, and stops serving with
+    `reload` set, so that it can be restarted with the new source.
+
+    Each run has the client's environment. Runs from clients whose locale or
+    Python settings differ from the daemon's are declined, as those settings take
+    effect when the interpreter starts.
+
+    :param path: The path of the socket.
+    :param idle_timeout: Stop after this many seconds without a request. By
+        default, the daemon runs until it is stopped.
+    """
+
+    def __init__(self, path: str, idle_timeout: float | None = None) -> None:
+        from ._cache import package_fingerprint
+
+        self.path = path
+        self.idle_timeout = idle_timeout
+        self.fingerprint = package_fingerprint()
+        self.startup_environment = _startup_environment(os.environ)
+        self.running = False
+        self.reload = False
+        self.served = 0
+
+    def warm(self) -> None:
+        """Import all of the hooks."""
+        import importlib
+
+        for module in HOOK_MODULES.values():
+            importlib.import_module(module)
+
+    def serve(self) -> None:
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            server.bind(self.path)
+        except OSError:
+            server.close()
+            raise
+        try:
+            os.chmod(self.path, 0o600)
+            server.listen()
+            server.settimeout(self.idle_timeout)
+            self.running = True
+            while self.running:
+                try:
+                    conn, _ = server.accept()
+                except TimeoutError:
+                    break
+                with conn:
+                    self._serve_connection(conn)
+        finally:
+            self.running = False
+            server.close()
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+
+    def _serve_connection(self, conn: socket.socket) -> None:
+        def send(message: dict[str, t.Any]) -> None:
+            conn.sendall(json.dumps(message).encode("utf-8") + b"\n")
+
+        try:
+            if not _peer_is_user(conn):
+                return
+            conn.settimeout(_REQUEST_TIMEOUT)
+            request = json.loads(_recv_all(conn))
+            conn.settimeout(None)
+            send(self.handle(request, lambda text: send({"output": text})))
+        except (OSError, ValueError):
+            # the client went away, or sent something other than a request
+            pass
+
+    def handle(
+        self,
+        request: t.Any,
+        output: t.Callable[[str], None] | None = None,
+    ) -> dict[str, t.Any]:
+        """Handle a request. The stdout of a run is passed to `output` as it is
+        written, or else returned in the response."""
+        from ._cache import package_fingerprint
+
+        if not isinstance(request, dict):
+            return {"exit_code": None}
+        command = request.get("command", "run")
+        if command == "stop":
+            self.running = False
+            return {"stopped": True}
+        if command == "status":
+            return {"pid": os.getpid(), "served": self.served}
+        if package_fingerprint() != self.fingerprint:
+            self.running = False
+            self.reload = True
+            return {"exit_code": None}
+        hook = request.get("hook")
+        module = HOOK_MODULES.get(hook) if isinstance(hook, str) else None
+        argv, cwd, env = request.get("argv"), request.get("cwd"), request.get("env")
+        if (
+            module is None
+            or not _is_list_of_str(argv)
+            or not isinstance(cwd, str)
+            or not isinstance(env, dict)
+            or not _is_list_of_str(list(env.values()))
+            or _startup_environment(env) != self.startup_environment
+        ):
+            # malformed requests are declined, as are runs which would not behave
+            # as they would in-process
+            return {"exit_code": None}
+        return self._run(module, argv, cwd, env, output)
+
+    def _run(
+        self,
+        module: str,
+        argv: list[str],
+        cwd: str,
+        env: dict[str, str],
+        output: t.Callable[[str], None] | None,
+    ) -> dict[str, t.Any]:
+        import contextlib
+        import importlib
+        import traceback
+
+        original_cwd = os.getcwd()
+        try:
+            os.chdir(cwd)
+        except (OSError, ValueError):
+            return {"exit_code": None}
+        original_env = dict(os.environ)
+        try:
+            os.environ.clear()
+            os.environ.update(env)
+        except ValueError:
+            # a variable which cannot be set, e.g. one with a null byte in it
+            os.environ.clear()
+            os.environ.update(original_env)
+            os.chdir(original_cwd)
+            return {"exit_code": None}
+        stdout: io.TextIOBase = (
+            io.StringIO() if output is None else _OutputStream(output)
+        )
+        stderr = io.StringIO()
+        try:
+            with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+                try:
+                    exit_code = importlib.import_module(module).main(argv=argv)
+                except SystemExit as e:
+                    exit_code = _exit_code(e.code)
+                except Exception:
+                    traceback.print_exc()
+                    exit_code = 1
+        finally:
+            os.environ.clear()
+            os.environ.update(original_env)
+            os.chdir(original_cwd)
+        self.served += 1
+        response = {"exit_code": exit_code, "stderr": stderr.getvalue()}
+        if isinstance(stdout, io.StringIO):
+            response["stdout"] = stdout.getvalue()
+        return response
+
+
+def _is_list_of_str(value: t.Any) -> t.TypeGuard[list[str]]:
+    return isinstance(value, list) and all(isinstance(x, str) for x in value)
+
+
+class _OutputStream(io.TextIOBase):
+    # a text stream which passes everything written to it to a function, such as
+    # one sending it to a client
+    def __init__(self, output: t.Callable[[str], None]) -> None:
+        self._output = output
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        if text:
+            self._output(text)
+        return len(text)
+
+
+def _prepare_directory(directory: str) -> None:
+    # the socket directory must be private to the user, as anyone who can connect
+    # to the socket can run hooks as them
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    info = os.stat(directory)
+    if info.st_uid != os.getuid() or info.st_mode & 0o077:
+        print(
+            f"The daemon socket directory must be private to the user: {directory}",
+            file=sys.stderr,
+        )
+        raise SystemExit(2)
+
+
+def _start(path: str, detach: bool, idle_timeout: float | None) -> int:
+    sent, _ = _request(path, {"command": "status"})
+    if sent:
+        print(f"The texthooks daemon is already running on {path}", file=sys.stderr)
+        return 1
+    _prepare_directory(os.path.dirname(path) or ".")
+    if os.path.exists(path):
+        # left behind by a daemon which was killed
+        os.unlink(path)
+
+    argv = ["start", "--socket", path]
+    if idle_timeout is not None:
+        argv += ["--idle-timeout", str(idle_timeout)]
+    if detach:
+        import subprocess
+        import time
+
+        subprocess.Popen(
+            [sys.executable, "-m", "texthooks._daemon", *argv],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+        for _ in range(100):
+            if _request(path, {"command": "status"})[0]:
+                return 0
+            time.sleep(0.05)
+        print("The texthooks daemon did not start", file=sys.stderr)
+        return 1
+
+    import signal
+
+    # stop cleanly, removing the socket, when terminated
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    daemon = Daemon(path, idle_timeout)
+    daemon.warm()
+    daemon.serve()
+    if daemon.reload:
+        os.execv(sys.executable, [sys.executable, "-m", "texthooks._daemon", *argv])
+    return 0
+
+
+def daemon_main(*, argv: list[str] | None = None) -> int:
+    """
+    Run, stop, or query the texthooks daemon.
+
+    While the daemon is running, the texthooks console scripts send their runs to
+    it, rather than starting up and importing the hooks each time.
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(description=daemon_main.__doc__)
+    parser.add_argument("command", choices=("start", "stop", "status"))
+    parser.add_argument(
+        "--socket",
+        default=None,
+        metavar="PATH",
+        help="The path of the socket. Defaults to one for this user and installation",
+    )
+    parser.add_argument(
+        "--detach",
+        action="store_true",
+        default=False,
+        help="Start the daemon in the background",
+    )
+    parser.add_argument(
+        "--idle-timeout",
+        type=float,
+        default=None,
+        metavar="SECONDS",
+        help="Stop the daemon after this many seconds without a run",
+    )
+    args = parser.parse_args(argv)
+    path = args.socket or socket_path()
+
+    if args.command == "start":
+        return _start(path, args.detach, args.idle_timeout)
+
+    _, response = _request(path, {"command": args.command})
+    if response is None:
+        print("The texthooks daemon is not running", file=sys.stderr)
+        return 1
+    if args.command == "status":
+        print(f"pid: {response['pid']}, runs served: {response['served']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(daemon_main())
@@ -0,0 +1,160 @@
+#
+# discovery of the text files to check, when no files are given
+#
+# Inside a git work tree, the files are listed by git, so that ignored files are
+# never touched. Otherwise, the tree is walked with `os.scandir`, skipping hidden
+# files and directories as `glob` would, and pruning directories which belong to
+# tools rather than to the project.
+#
+# Either way, files are classified as text by name where possible, and their
+# content is only sniffed when the name is not recognized.
+#
+from __future__ import annotations
+
+import fnmatch
+import os
+import re
+import stat
+import typing as t
+
+# directories which are never searched, in addition to hidden ones (e.g. `.git`,
+# `.tox`, and `.venv`) and virtualenvs, which are identified by their `pyvenv.cfg`
+PRUNED_DIRECTORY_NAMES = frozenset(
+    {
+        "CVS",
+        "_darcs",
+        "__pycache__",
+        "node_modules",
+    }
+)
+
+
+class ExcludeMatcher:
+    """
+    Match paths against glob patterns.
+
+    A pattern without a slash is matched against the name of each file and
+    directory, at any depth. A pattern with a slash is matched against the whole
+    path, relative to the root of the search.
+    """
+
+    def __init__(self, patterns: t.Iterable[str]) -> None:
+        name_patterns = []
+        path_patterns = []
+        for pattern in patterns:
+            if "/" in pattern:
+                path_patterns.append(fnmatch.translate(pattern.strip("/")))
+            else:
+                name_patterns.append(fnmatch.translate(pattern))
+        self._name_regex = re.compile("|".join(name_patterns) or "(?!)")
+        self._path_regex = re.compile("|".join(path_patterns) or "(?!)")
+
+    def __call__(self, name: str, relpath: str) -> bool:
+        return bool(
+            self._name_regex.match(name)
+            or self._path_regex.match(relpath.replace(os.sep, "/"))
+        )
+
+    def matches_path(self, relpath: str) -> bool:
+        """Check a path and all of the directories which contain it."""
+        parts = relpath.replace(os.sep, "/").split("/")
+        return any(self(part, "/".join(parts[: i + 1])) for i, part in enumerate(parts))
+
+
+def _is_text(path: str, name: str) -> bool:
+    # imported here, as it is only needed when no files are given
+    from identify import identify
+
+    tags = identify.tags_from_filename(name)
+    if "text" in tags:
+        return True
+    if "binary" in tags:
+        return False
+    try:
+        return identify.file_is_text(path)
+    except (OSError, ValueError):
+        return False
+
+
+def walk_text_files(
+    root: str = ".", exclude: t.Iterable[str] | None = None
+) -> t.Iterator[str]:
+    """Find all of the text files under a directory, yielding paths relative to it.
+
+    Symlinks are not followed, and a file with several hardlinks is only yielded
+    once."""
+    is_excluded = ExcludeMatcher(exclude or ())
+    seen: set[tuple[int, int]] = set()
+    # relative paths of directories to search, with "" for the root
+    stack = [""]
+    while stack:
+        reldir = stack.pop()
+        dirpath = os.path.join(root, reldir) if reldir else root
+        try:
+            with os.scandir(dirpath) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+            device = os.stat(dirpath).st_dev
+        except OSError:
+            continue
+        if reldir and any(entry.name == "pyvenv.cfg" for entry in entries):
+            continue
+
+        subdirs = []
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            relpath = os.path.join(reldir, entry.name)
+            if is_excluded(entry.name, relpath):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                if entry.name not in PRUNED_DIRECTORY_NAMES:
+                    subdirs.append(relpath)
+            elif entry.is_file(follow_symlinks=False):
+                key = (device, entry.inode())
+                if key in seen:
+                    continue
+                seen.add(key)
+                if _is_text(entry.path, entry.name):
+                    yield relpath
+        stack.extend(reversed(subdirs))
+
+
+def _git_ls_files(untracked: bool) -> list[str] | None:
+    command = ["git", "ls-files", "-z", "--cached"]
+    if untracked:
+        command += ["--others", "--exclude-standard"]
+    import subprocess
+
+    try:
+        proc = subprocess.run(command, capture_output=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    # a path is listed once per stage while a merge conflict is unresolved
+    return list(dict.fromkeys(os.fsdecode(x) for x in proc.stdout.split(b"\0") if x))
+
+
+def git_text_files(
+    exclude: t.Iterable[str] | None = None, untracked: bool = False
+) -> t.Iterator[str] | None:
+    """Find the text files which git tracks under the current directory, and, with
+    `untracked`, the files which are untracked but not ignored.
+
+    Returns None if the current directory is not inside a git work tree."""
+    paths = _git_ls_files(untracked)
+    if paths is None:
+        return None
+    return _filter_git_files(paths, ExcludeMatcher(exclude or ()))
+
+
+def _filter_git_files(paths: list[str], is_excluded: ExcludeMatcher) -> t.Iterator[str]:
+    for path in paths:
+        if is_excluded.matches_path(path):
+            continue
+        # skip deleted files, symlinks, and submodules
+        try:
+            if not stat.S_ISREG(os.lstat(path).st_mode):
+                continue
+        except OSError:
+            continue
+        if _is_text(path, os.path.basename(path)):
+            yield path
@@ -0,0 +1,122 @@
+#
+# streaming output for `--format ndjson`
+#
+# Each event is a JSON object on a line of its own. The events for a file are
+# written as soon as its results are recorded, so that tools reading the output
+# can act on them while the run continues, and the recorders do not keep them.
+#
+from __future__ import annotations
+
+import json
+import sys
+import typing as t
+
+from ._common import TriggerSet
+from ._metrics import codepoint
+
+# the replacements made in a line, as in `_recorders.Spans`
+_Spans = t.List[t.Tuple[int, int, int, int]]
+
+
+def codepoints(text: str) -> str:
+    return " ".join(codepoint(char) for char in text)
+
+
+class EventStream:
+    """
+    Write the results of a run as newline-delimited JSON.
+
+    There are three kinds of event, each with the `hook` which produced it and
+    the `path` of the file:
+
+    - "change": a replacement made by a fixer, with its `line` and 1-based
+      `column`, the `original` text and its `codepoint`, and the `replacement`.
+      Fixers which do not report their replacements produce one event for each
+      changed line, covering the changed section of it, with a null `codepoint`
+    - "failure": a character found by a checker, with its `line`, `column`, and
+      `codepoint`. Checkers which do not declare `triggers` produce one event for
+      each failing line, with a null `column` and `codepoint`
+    - "file": the `result` for a file, "changed" or "failed", and the number of
+      `lines` affected, written after the other events for the file
+
+    :param stream: The stream to write to. Defaults to stdout.
+    """
+
+    def __init__(self, stream: t.TextIO | None = None) -> None:
+        self._stream = stream
+
+    def emit(self, event: str, **fields: t.Any) -> None:
+        stream = self._stream or sys.stdout
+        stream.write(json.dumps({"event": event, **fields}) + "\n")
+
+    def change(
+        self,
+        hook: str | None,
+        path: str,
+        original: str,
+        updated: str,
+        lineno: int,
+        spans: _Spans,
+        *,
+        replacements: bool = True,
+    ) -> None:
+        """Write the events for a changed line. If `spans` are not the replacements
+        made by the fixer, but the changed section of the line, `replacements` is
+        False and no codepoints are given."""
+        for start, end, new_start, new_end in spans:
+            self.emit(
+                "change",
+                hook=hook,
+                path=path,
+                line=lineno,
+                column=start + 1,
+                original=original[start:end],
+                codepoint=codepoints(original[start:end]) if replacements else None,
+                replacement=updated[new_start:new_end],
+            )
+
+    def failure(
+        self,
+        hook: str | None,
+        path: str,
+        line: str | t.Sequence[tuple[int, str]],
+        lineno: int,
+        triggers: TriggerSet | None,
+    ) -> None:
+        """Write the events for a line which failed a check. If the checker declares
+        `triggers`, there is an event for each of them found in the line. The line
+        may be given as the column and text of each trigger in it instead."""
+        if isinstance(line, str):
+            matches = (
+                []
+                if triggers is None
+                else [
+                    (m.start() + 1, m.group()) for m in triggers.pattern.finditer(line)
+                ]
+            )
+        else:
+            matches = list(line)
+        if not matches:
+            self.emit(
+                "failure",
+                hook=hook,
+                path=path,
+                line=lineno,
+                column=None,
+                codepoint=None,
+            )
+        for column, text in matches:
+            self.emit(
+                "failure",
+                hook=hook,
+                path=path,
+                line=lineno,
+                column=column,
+                codepoint=codepoints(text),
+            )
+
+    def file(self, hook: str | None, path: str, result: str, lines: int) -> None:
+        """Write the result for a file, after the other events for it."""
+        self.emit("file", hook=hook, path=path, result=result, lines=lines)
+        # each file's events are made available as soon as they are written
+        (self._stream or sys.stdout).flush()
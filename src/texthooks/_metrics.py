@@ -0,0 +1,247 @@
+#
+# machine-readable run metrics, for `--metrics-file`
+#
+# The recorders wrap their hooks in MeasuredFixer and MeasuredChecker, which count
+# lines and characters in the stats of the file being worked on. Those stats are
+# returned to the recorders with the results for each file, and are summed into a
+# JSON or Prometheus textfile at the end of the run.
+#
+from __future__ import annotations
+
+import collections
+import datetime
+import json
+import os
+import tempfile
+import typing as t
+
+from . import _timings
+from ._timings import PHASES, Timings
+
+
+def codepoint(char: str) -> str:
+    return f"U+{ord(char):04X}"
+
+
+class MeasuredFixer:
+    """
+    A line fixer which counts the lines changed, and the characters replaced, by
+    another line fixer.
+
+    Replaced characters can only be counted for fixers which provide
+    `replacement_spans`. The wrapped fixer's `triggers` are kept, so that files are
+    skipped just as they would be without measurement.
+    """
+
+    def __init__(self, hook_name: str, line_fixer: t.Callable[[str], str]) -> None:
+        self.hook_name = hook_name
+        self.line_fixer = line_fixer
+        self.triggers = getattr(line_fixer, "triggers", None)
+
+    def __call__(self, line: str) -> str:
+        newline = self.line_fixer(line)
+        stats = _timings.current()
+        if stats is None:
+            return newline
+        stats.lines_seen += 1
+        # a fixer which only strips the line ending has not changed the line
+        if newline != line and newline != line.rstrip("\n"):
+            stats.lines["changed", self.hook_name] += 1
+            replacement_spans = getattr(self.line_fixer, "replacement_spans", None)
+            if replacement_spans is not None:
+                for start, end, _, _ in replacement_spans(line):
+                    for char in line[start:end]:
+                        stats.findings[self.hook_name, char] += 1
+        return newline
+
+
+class MeasuredContentFixer(MeasuredFixer):
+    """
+    A MeasuredFixer for a content fixer, which also counts the lines changed, and
+    the characters replaced, when it fixes the whole content of a file at once.
+    """
+
+    def replacements(self, content: str) -> list[tuple[int, int, str]]:
+        replacements = self.line_fixer.replacements(content)  # type: ignore[attr-defined]
+        stats = _timings.current()
+        if stats is None:
+            return replacements
+        stats.lines_seen += content.count("\n") + (not content.endswith("\n"))
+        # the replacements are in order, so each changed line is counted once by
+        # tracking the last line counted
+        lineno, counted_to, last_changed = 0, 0, -1
+        for start, end, replacement in replacements:
+            if content[start:end] == replacement:
+                continue
+            lineno += content.count("\n", counted_to, start)
+            counted_to = start
+            last_line = lineno + content.count("\n", start, max(start, end - 1))
+            stats.lines["changed", self.hook_name] += last_line - max(
+                lineno - 1, last_changed
+            )
+            last_changed = last_line
+            for char in content[start:end]:
+                stats.findings[self.hook_name, char] += 1
+        return replacements
+
+
+class MeasuredChecker:
+    """
+    A line checker which counts the lines failed by another line checker, and, if
+    it declares `triggers`, the characters found on those lines.
+    """
+
+    def __init__(self, hook_name: str, line_checker: t.Callable[[str], bool]) -> None:
+        self.hook_name = hook_name
+        self.line_checker = line_checker
+        self.triggers = getattr(line_checker, "triggers", None)
+
+    def __call__(self, line: str) -> bool:
+        ok = self.line_checker(line)
+        stats = _timings.current()
+        if stats is None:
+            return ok
+        stats.lines_seen += 1
+        if not ok:
+            stats.lines["failed", self.hook_name] += 1
+            if self.triggers is not None:
+                for match in self.triggers.pattern.findall(line):
+                    for char in match:
+                        stats.findings[self.hook_name, char] += 1
+        return ok
+
+
+class Metrics:
+    """
+    Metrics for a run of one or more hooks, summed from the stats of each file.
+
+    :param path: The file to which the metrics are written.
+    :param format: "json" or "prometheus". By default, files named "*.prom" are
+        written in the Prometheus text format, and others as JSON.
+    """
+
+    def __init__(self, path: str, format: str | None = None) -> None:
+        self.path = path
+        if format is None:
+            format = "prometheus" if path.endswith(".prom") else "json"
+        self.format = format
+
+    def collect(self, timings: Timings) -> dict[str, t.Any]:
+        lines: collections.Counter[tuple[str, str]] = collections.Counter()
+        findings: collections.Counter[tuple[str, str]] = collections.Counter()
+        for _, stats in timings.files:
+            lines.update(stats.lines)
+            findings.update(stats.findings)
+
+        by_hook: dict[str, dict[str, int]] = {}
+        for (hook, char), count in sorted(findings.items()):
+            by_hook.setdefault(hook, {})[codepoint(char)] = count
+        return {
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "files_discovered": len(timings.files) + timings.cached,
+            "files_skipped": sum(stats.lines_seen == 0 for _, stats in timings.files),
+            "cache_hits": timings.cached,
+            "bytes_scanned": sum(stats.bytes_read for _, stats in timings.files),
+            "bytes_written": sum(stats.bytes_written for _, stats in timings.files),
+            "lines_changed": {
+                hook: count
+                for (kind, hook), count in sorted(lines.items())
+                if kind == "changed"
+            },
+            "lines_failed": {
+                hook: count
+                for (kind, hook), count in sorted(lines.items())
+                if kind == "failed"
+            },
+            "findings": by_hook,
+            "phase_seconds": {
+                name: {"wall": wall, "cpu": cpu}
+                for name, (wall, cpu) in timings.phases.items()
+            },
+            "elapsed_seconds": {"wall": timings.wall, "cpu": timings.cpu},
+        }
+
+    def write(self, timings: Timings) -> None:
+        """Write the metrics for a run. The file is replaced atomically, so that a
+        collector never reads a partial file."""
+        metrics = self.collect(timings)
+        if self.format == "prometheus":
+            content = format_prometheus(metrics)
+        else:
+            content = json.dumps(metrics, indent=2) + "\n"
+
+        directory = os.path.dirname(self.path) or "."
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with open(fd, "w", encoding="utf-8") as f:
+                f.write(content)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+
+def _label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_prometheus(metrics: dict[str, t.Any]) -> str:
+    """Format metrics in the Prometheus text format, for the textfile collector."""
+    out: list[str] = []
+
+    def metric(
+        name: str, description: str, samples: t.Iterable[tuple[str, float]]
+    ) -> None:
+        out.append(f"# HELP texthooks_{name} {description}")
+        out.append(f"# TYPE texthooks_{name} gauge")
+        for labels, value in samples:
+            out.append(f"texthooks_{name}{labels} {value}")
+
+    def labels(**kwargs: str) -> str:
+        pairs = ",".join(f'{k}="{_label_value(v)}"' for k, v in kwargs.items())
+        return "{" + pairs + "}"
+
+    for name, description in (
+        ("files_discovered", "Files found to be checked."),
+        ("files_skipped", "Files with no lines which needed to be checked."),
+        ("cache_hits", "Files skipped because they were cached as clean."),
+        ("bytes_scanned", "Bytes read from files."),
+        ("bytes_written", "Bytes written to files."),
+    ):
+        metric(name, description, [("", metrics[name])])
+    metric(
+        "lines_changed",
+        "Lines changed by each fixer.",
+        [(labels(hook=k), v) for k, v in metrics["lines_changed"].items()],
+    )
+    metric(
+        "lines_failed",
+        "Lines failed by each checker.",
+        [(labels(hook=k), v) for k, v in metrics["lines_failed"].items()],
+    )
+    metric(
+        "findings",
+        "Characters replaced or found by each hook.",
+        [
+            (labels(hook=hook, codepoint=cp), count)
+            for hook, counts in metrics["findings"].items()
+            for cp, count in counts.items()
+        ],
+    )
+    metric(
+        "phase_seconds",
+        "Time spent in each phase of the run, summed over files.",
+        [
+            (labels(phase=name, clock=clock), metrics["phase_seconds"][name][clock])
+            for name in PHASES
+            for clock in ("wall", "cpu")
+        ],
+    )
+    metric(
+        "elapsed_seconds",
+        "Time taken by the whole run.",
+        [(labels(clock=k), v) for k, v in metrics["elapsed_seconds"].items()],
+    )
+    timestamp = datetime.datetime.fromisoformat(metrics["timestamp"]).timestamp()
+    metric("last_run_timestamp_seconds", "When the run finished.", [("", timestamp)])
+    return "\n".join(out) + "\n"
@@ -1,16 +1,34 @@
 from __future__ import annotations
 
+import array
 import codecs
 import collections
-import difflib
+import functools
+import io
+import itertools
+import mmap
+import os
+import pickle
+import re
 import sys
+import threading
 import typing as t
 
-from ._common import colorize
+from . import _cache, _timings
+from ._common import DEFAULT_STREAM_THRESHOLD, TriggerSet, colorize
+
+# modules which are only needed for some options are imported when they are used,
+# so that each hook starts quickly
+if t.TYPE_CHECKING:
+    from ._events import EventStream
+    from ._metrics import Metrics
+    from ._timings import Timings
 
 
 def create_comparison_lines(old: str, new: str) -> list[str]:
     """Compare two lines to make diff output to show changes."""
+    import difflib
+
     differ = difflib.Differ()
     return [_clean_q(line).rstrip("\n") for line in differ.compare([old], [new])]
 
@@ -22,6 +40,173 @@ def _clean_q(s: str) -> str:
     return s
 
 
+# the replacements made in a line, as (start, end) offsets in the original line
+# followed by (start, end) offsets in the updated line
+Spans = t.List[t.Tuple[int, int, int, int]]
+
+# the replacements made in a whole text, as (start, end) offsets of each replaced
+# section of the original text, followed by its replacement
+Replacements = t.List[t.Tuple[int, int, str]]
+
+# a line which failed a check, and its line number; the line is either its text,
+# or the (1-based) column and text of each trigger in it, for lines which are too
+# large to decode
+_Failure = t.Tuple[t.Union[str, t.List[t.Tuple[int, str]]], int]
+
+
+class ContentFixer(t.Protocol):
+    """A line fixer which can also fix the whole content of a file at once, by
+    finding the replacements to make in it, in order and without overlaps."""
+
+    def __call__(self, line: str) -> str: ...
+
+    def replacements(self, content: str) -> Replacements: ...
+
+
+# lines longer than this are shown truncated around their changes, with this many
+# characters of context on either side of each change
+_MAX_RENDERED_LINE = 200
+_RENDER_CONTEXT = 40
+# and at most this many of the changes in a long line are shown
+_MAX_RENDERED_SPANS = 20
+_ELLIPSIS = "..."
+
+
+def _get_replacement_spans(func: t.Callable, line: str) -> Spans | None:
+    replacement_spans = getattr(func, "replacement_spans", None)
+    if replacement_spans is None:
+        return None
+    return replacement_spans(line)
+
+
+def display_width(c: str) -> int:
+    """The number of terminal columns which a character takes up: two for wide East
+    Asian characters, none for combining marks and format characters, and one for
+    anything else."""
+    import unicodedata
+
+    if unicodedata.combining(c) or unicodedata.category(c) in ("Me", "Cf"):
+        return 0
+    return 2 if unicodedata.east_asian_width(c) in ("W", "F") else 1
+
+
+def _truncate_equal(text: str, first: bool, last: bool) -> str:
+    # shorten an unchanged section of a long line, keeping context next to changes
+    context = _RENDER_CONTEXT
+    if first and last:
+        return text if len(text) <= 2 * context else text[:context] + _ELLIPSIS
+    if first:
+        return text if len(text) <= context else _ELLIPSIS + text[-context:]
+    if last:
+        return text if len(text) <= context else text[:context] + _ELLIPSIS
+    if len(text) <= 2 * context + len(_ELLIPSIS):
+        return text
+    return text[:context] + _ELLIPSIS + text[-context:]
+
+
+def _compare_multiline(original: str, updated: str) -> list[str]:
+    # show a change to several lines as the lines removed and added, without change
+    # markers, which could not be placed under the lines
+    return [
+        *(f"- {line}".rstrip("\n") for line in _splitlines(original)),
+        *(f"+ {line}".rstrip("\n") for line in _splitlines(updated)),
+    ]
+
+
+def render_comparison_lines(
+    original: str,
+    updated: str,
+    spans: Spans,
+    charwidth: t.Callable[[str], int] | None = None,
+) -> list[str]:
+    """Show the changes to a line, given the spans which were replaced, in the same
+    format as `create_comparison_lines`, but in linear time.
+
+    Lines which are mostly changed are shown without change markers, as `Differ`
+    does. Long lines are truncated around the changes. If `charwidth` is given, it
+    sets the number of columns used to mark each character."""
+    changed_length = sum(end - start for start, end, _, _ in spans)
+    total_length = len(original) + len(updated)
+    # Differ only marks changes within lines which are at least 75% similar
+    similar = not total_length or (
+        2.0 * (len(original) - changed_length) / total_length >= 0.75
+    )
+    original = original[:-1] if original.endswith("\n") else original
+    updated = updated[:-1] if updated.endswith("\n") else updated
+
+    truncate = len(original) > _MAX_RENDERED_LINE
+    omitted_spans = truncate and len(spans) > _MAX_RENDERED_SPANS
+    if omitted_spans:
+        # show the unchanged text up to the first change which is not shown
+        end = spans[_MAX_RENDERED_SPANS][0]
+        spans = spans[:_MAX_RENDERED_SPANS]
+    else:
+        end = len(original)
+
+    # split the line into sections, alternating unchanged and changed text
+    segments: list[tuple[str, str | None]] = []
+    position = 0
+    for a_start, a_end, b_start, b_end in spans:
+        segments.append((original[position:a_start], None))
+        segments.append((original[a_start:a_end], updated[b_start:b_end]))
+        position = a_end
+    segments.append((original[position:end], None))
+
+    def width(text: str) -> int:
+        if charwidth is None:
+            return len(text)
+        return sum(charwidth(c) for c in text)
+
+    def blank(text: str) -> str:
+        # tags for unchanged text keep whitespace as is, so that tabs still align
+        if charwidth is None:
+            return re.sub(r"\S", " ", text)
+        return "".join(c if c.isspace() else " " * charwidth(c) for c in text)
+
+    a_parts, b_parts, a_tags, b_tags = [], [], [], []
+    for i, (a_text, b_text) in enumerate(segments):
+        if b_text is None:
+            if truncate:
+                a_text = _truncate_equal(a_text, i == 0, i == len(segments) - 1)
+            a_parts.append(a_text)
+            b_parts.append(a_text)
+            a_tags.append(blank(a_text))
+            b_tags.append(blank(a_text))
+        else:
+            a_parts.append(a_text)
+            b_parts.append(b_text)
+            a_tags.append(("^" if b_text else "-") * width(a_text))
+            b_tags.append(("^" if a_text else "+") * width(b_text))
+    if omitted_spans and not a_parts[-1].endswith(_ELLIPSIS):
+        a_parts.append(_ELLIPSIS)
+        b_parts.append(_ELLIPSIS)
+
+    comparison = ["- " + "".join(a_parts)]
+    if similar and (tags := "".join(a_tags).rstrip()):
+        comparison.append("  " + tags)
+    comparison.append("+ " + "".join(b_parts))
+    if similar and (tags := "".join(b_tags).rstrip()):
+        comparison.append("  " + tags)
+    return comparison
+
+
+def compare_lines(
+    original: str,
+    updated: str,
+    spans: Spans | None,
+    charwidth: t.Callable[[str], int] | None = None,
+) -> list[str]:
+    """Show the changes to a line, from the replaced spans if they are known."""
+    if spans is None:
+        # without spans, short lines are compared with `Differ`, and long lines are
+        # treated as one change, from the first changed character to the last
+        if len(original) <= _MAX_RENDERED_LINE:
+            return create_comparison_lines(original, updated)
+        start, end = _changed_columns(original, updated)
+        spans = [(start, end, start, end + len(updated) - len(original))]
+    return render_comparison_lines(original, updated, spans, charwidth)
+
+
 def colorize_comparison(comparison: list[str]) -> list[str]:
     result = []
     for line in comparison:
@@ -49,75 +234,1398 @@ def _determine_encoding() -> str:
     return encoding
 
 
-def _readlines(filename: str, encoding: str) -> t.List[str]:
-    with open(filename, encoding=encoding) as f:
-        return f.readlines()
+def _read(filename: str, encoding: str) -> str:
+    # the file is read as bytes and decoded, translating line endings to "\n" as
+    # text mode would, so that the bytes can be fingerprinted for the cache
+    content = _read_bytes(filename).decode(encoding)
+    if "\r" in content:
+        content = content.replace("\r\n", "\n").replace("\r", "\n")
+    return content
+
+
+def _splitlines(content: str) -> t.List[str]:
+    # split on "\n" only, exactly as `readlines()` would, rather than on all of the
+    # line boundaries which `str.splitlines` recognizes
+    return io.StringIO(content).readlines()
+
+
+def _get_triggers(func: t.Callable) -> TriggerSet | None:
+    return getattr(func, "triggers", None)
+
+
+def _read_bytes(filename: str) -> bytes:
+    with _timings.io_phase("read"), open(filename, "rb") as f:
+        data = f.read()
+    _timings.add_bytes(read=len(data))
+    _cache.note_read(data)
+    return data
+
+
+def _write(filename: str, encoding: str, content: str) -> None:
+    with _timings.io_phase("write"), open(filename, "w", encoding=encoding) as f:
+        f.write(content)
+        if _timings.current() is not None:
+            f.flush()
+            _timings.add_bytes(written=os.fstat(f.fileno()).st_size)
+
+
+def _write_bytes(filename: str, data: bytes) -> None:
+    with _timings.io_phase("write"), open(filename, "wb") as f:
+        f.write(data)
+    _timings.add_bytes(written=len(data))
+
+
+def _iter_trigger_lines(
+    data: str | bytes | mmap.mmap, triggers: TriggerSet
+) -> t.Iterator[tuple[int, int, int]]:
+    """Find the lines of text or UTF-8 data which contain a trigger, yielding the
+    line number, start offset, and end offset of each line.
+
+    The whole of the data is searched for triggers in one pass, and then for the
+    surrounding newlines, so line numbers are only computed when a trigger is
+    found."""
+    buf: t.Any = data
+    pattern: re.Pattern[t.Any]
+    newline: t.Any
+    if isinstance(data, str):
+        pattern, newline = triggers.pattern, "\n"
+    else:
+        pattern, newline = triggers.byte_pattern, b"\n"
+    lineno, counted_to, pos = 1, 0, 0
+    while (match := pattern.search(buf, pos)) is not None:
+        start = buf.rfind(newline, 0, match.start()) + 1
+        end = buf.find(newline, match.start())
+        end = len(buf) if end == -1 else end + 1
+        lineno += _count_newlines(buf, counted_to, start)
+        counted_to = start
+        yield lineno, start, end
+        pos = end
+
+
+# the size of the slices of a memory map in which newlines are counted
+_COUNT_CHUNK_SIZE = 1024 * 1024
+
+
+def _count_newlines(data: str | bytes | mmap.mmap, start: int, end: int) -> int:
+    if isinstance(data, mmap.mmap):
+        # a memory map has no `count()`, so it is counted in bounded slices
+        return sum(
+            data[pos : min(pos + _COUNT_CHUNK_SIZE, end)].count(b"\n")
+            for pos in range(start, end, _COUNT_CHUNK_SIZE)
+        )
+    if isinstance(data, str):
+        return data.count("\n", start, end)
+    return data.count(b"\n", start, end)
+
+
+def _count_chars(data: mmap.mmap, start: int, end: int) -> int:
+    # count the characters in a section of UTF-8 data, as the bytes which do not
+    # continue a multi-byte sequence, in bounded slices as for newlines
+    return sum(
+        len(data[pos : min(pos + _COUNT_CHUNK_SIZE, end)].translate(None, _UTF8_TAILS))
+        for pos in range(start, end, _COUNT_CHUNK_SIZE)
+    )
+
+
+_UTF8_TAILS = bytes(range(0x80, 0xC0))
+
+
+def _decode_line(raw: bytes) -> tuple[str, bytes]:
+    # decode a line of UTF-8, normalizing the line ending to "\n" as text mode would
+    # do; the original line ending is returned so that it can be restored
+    # undecodable bytes are kept as surrogates, so that they are written back as
+    # they were
+    for ending in (b"\r\n", b"\n"):
+        if raw.endswith(ending):
+            text = raw[: -len(ending)].decode("utf-8", "surrogateescape")
+            return text + "\n", ending
+    return raw.decode("utf-8", "surrogateescape"), b""
+
+
+def _encode_line(line: str, ending: bytes) -> bytes:
+    if ending and line.endswith("\n"):
+        line = line[:-1]
+    return line.encode("utf-8", "surrogateescape") + ending
+
+
+def _line_function(line_fixer: t.Callable[[str], str]) -> t.Callable[[str], str]:
+    # fixers such as TranslationFixer provide a cheaper function to call per line
+    line_function = getattr(line_fixer, "line_function", None)
+    return line_fixer if line_function is None else line_function()
+
+
+def _apply_line_fixer(line_fixer: t.Callable[[str], str], line: str) -> str:
+    newline = line_fixer(line)
+    # re-add newline if it was stripped by the fixer
+    if line.endswith("\n") and not newline.endswith("\n"):
+        newline += "\n"
+    return newline
+
+
+def _start_rewrite(
+    filename: str, encoding: str | None, copy_lines: int
+) -> tuple[t.IO[t.Any], str]:
+    # open a temp file next to the original, so that it can be moved over it, and
+    # copy the leading lines which were unchanged into it
+    # `filename` is the file itself, not a symlink to it, as the symlink would be
+    # replaced by the file
+    import tempfile
+
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(filename) or ".",
+        prefix=f".{os.path.basename(filename)}.",
+        suffix=".tmp",
+    )
+    mode = "b" if encoding is None else ""
+    out = open(fd, "w" + mode, encoding=encoding)
+    with open(filename, "r" + mode, encoding=encoding) as original:
+        out.writelines(itertools.islice(original, copy_lines))
+    return out, tmp_path
+
+
+def _finish_rewrite(tmp_path: str, filename: str) -> None:
+    # move the rewritten temp file over the original, keeping its mode, owner, and
+    # group; a file with other hardlinks is instead overwritten with the temp file,
+    # as replacing it would separate it from them
+    import shutil
+
+    stat = os.stat(filename)
+    if stat.st_nlink > 1:
+        with open(tmp_path, "rb") as src, open(filename, "r+b") as dst:
+            shutil.copyfileobj(src, dst)
+            dst.truncate()
+        os.remove(tmp_path)
+        return
+    shutil.copymode(filename, tmp_path)
+    if hasattr(os, "chown"):
+        try:
+            os.chown(tmp_path, stat.st_uid, stat.st_gid)
+        except OSError:
+            # only root can give a file to another user
+            pass
+    os.replace(tmp_path, filename)
+
+
+def _stream_lines(
+    filename: str,
+    encoding: str | None,
+    triggers: TriggerSet | None,
+    run_line: t.Callable[[int, str], str],
+) -> None:
+    """Run a function on each line of a file, holding only one line in memory.
+
+    With an encoding, the file is read as text. Without one, it is read as UTF-8
+    bytes, and only lines containing triggers are decoded. If `run_line` changes
+    any line, the output is written to a temp file which replaces the original,
+    or the file which it links to."""
+    out: t.IO[t.Any] | None = None
+    tmp_path = ""
+    target = filename
+    try:
+        with open(filename, "r" if encoding else "rb", encoding=encoding) as f:
+            if _timings.current() is not None:
+                _timings.add_bytes(read=os.fstat(f.fileno()).st_size)
+            for lineno, line in enumerate(f, 1):
+                newline = line
+                if triggers is None or triggers.search(line):
+                    if encoding:
+                        newline = run_line(lineno, line)
+                    else:
+                        text, ending = _decode_line(line)
+                        newtext = run_line(lineno, text)
+                        if newtext != text:
+                            newline = _encode_line(newtext, ending)
+                if out is None and newline != line:
+                    target = os.path.realpath(filename)
+                    out, tmp_path = _start_rewrite(target, encoding, lineno - 1)
+                if out is not None:
+                    out.write(newline)
+        if out is not None:
+            out.close()
+            if _timings.current() is not None:
+                _timings.add_bytes(written=os.stat(tmp_path).st_size)
+            _finish_rewrite(tmp_path, target)
+    except BaseException:
+        if out is not None:
+            out.close()
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+        raise
+
+
+def _stream_encoding(
+    encoding: str, utf8_bytes: bool, triggers: TriggerSet | None
+) -> str | None:
+    # streams are read as UTF-8 bytes, indicated by an encoding of None, under the
+    # same conditions as whole files are
+    return None if utf8_bytes and triggers is not None else encoding
+
+
+def _is_utf8(encoding: str) -> bool:
+    return codecs.lookup(encoding).name == "utf-8"
+
+
+# the number of bytes around a trigger found in a memory map which are decoded and
+# passed to the checker
+_MAPPED_WINDOW = 256
+
+
+def _check_mapped(
+    line_checker: t.Callable[[str], bool], triggers: TriggerSet, filename: str
+) -> list[_Failure] | None:
+    """Check a UTF-8 file through a read-only memory map.
+
+    The mapped bytes are searched for triggers without being copied or decoded, so
+    files larger than memory can be checked. Lines are never decoded whole, as
+    they may be as large as the file: the checker is passed the text around each
+    trigger, and a failing line is recorded as the column and text of each
+    trigger in it.
+
+    Returns None if the file cannot be mapped."""
+    with open(filename, "rb") as f:
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, OverflowError, ValueError):
+            # empty files cannot be mapped, nor can files larger than the address
+            # space
+            return None
+    _timings.add_bytes(read=len(mapped))
+    with mapped:
+        if hasattr(mmap, "MADV_SEQUENTIAL"):
+            mapped.madvise(mmap.MADV_SEQUENTIAL)
+        failures: list[_Failure] = []
+        for lineno, start, end in _iter_trigger_lines(mapped, triggers):
+            hits = _mapped_hits(line_checker, triggers, mapped, start, end)
+            if hits is not None:
+                failures.append((hits, lineno))
+        return failures
+
+
+def _mapped_hits(
+    line_checker: t.Callable[[str], bool],
+    triggers: TriggerSet,
+    mapped: mmap.mmap,
+    start: int,
+    end: int,
+) -> list[tuple[int, str]] | None:
+    # find the column and text of each trigger in a mapped line, if the line fails
+    # the check; columns are counted as the decoder would, for valid UTF-8
+    hits = []
+    failed = False
+    column, counted_to = 1, start
+    for match in triggers.byte_pattern.finditer(mapped, start, end):
+        column += _count_chars(mapped, counted_to, match.start())
+        counted_to = match.start()
+        hits.append((column, match.group().decode("utf-8")))
+        window = mapped[
+            max(start, match.start() - _MAPPED_WINDOW) : min(
+                end, match.end() + _MAPPED_WINDOW
+            )
+        ]
+        if not failed and not line_checker(window.decode("utf-8", "surrogateescape")):
+            failed = True
+    return hits if failed else None
+
+
+def _should_stream(filename: str, stream_threshold: int | None) -> bool:
+    return stream_threshold is not None and (
+        os.stat(filename).st_size >= stream_threshold
+    )
+
+
+# the per-file functions below do all of the reading, fixing, and writing for a
+# file, and return the results to be recorded
+# they are module-level functions so that they can be sent to worker processes
+
+
+def _fix_file(
+    line_fixer: t.Callable[[str], str],
+    encoding: str,
+    utf8_bytes: bool,
+    stream_threshold: int | None,
+    filename: str,
+) -> list[tuple[str, str, int]]:
+    triggers = _get_triggers(line_fixer)
+    line_fixer = _line_function(line_fixer)
+    if _should_stream(filename, stream_threshold):
+        changes = []
+
+        def run_line(lineno: int, line: str) -> str:
+            newline = _apply_line_fixer(line_fixer, line)
+            if newline != line:
+                changes.append((line, newline, lineno))
+            return newline
+
+        _stream_lines(
+            filename,
+            _stream_encoding(encoding, utf8_bytes, triggers),
+            triggers,
+            run_line,
+        )
+        return changes
+
+    if utf8_bytes and triggers is not None:
+        return _fix_utf8_bytes(line_fixer, triggers, filename)
+    return _fix_text(line_fixer, triggers, encoding, filename)
+
+
+def _fix_text(
+    line_fixer: t.Callable[[str], str],
+    triggers: TriggerSet | None,
+    encoding: str,
+    filename: str,
+) -> list[tuple[str, str, int]]:
+    content = _read(filename, encoding)
+    if triggers is not None and not triggers.search(content):
+        return []
+
+    changes = []
+    newcontent = []
+    for lineno, line in enumerate(_splitlines(content), 1):
+        newline = _apply_line_fixer(line_fixer, line)
+        newcontent.append(newline)
+        if newline != line:
+            changes.append((line, newline, lineno))
+
+    if changes:
+        _write(filename, encoding, "".join(newcontent))
+    return changes
+
+
+def _fix_utf8_bytes(
+    line_fixer: t.Callable[[str], str], triggers: TriggerSet, filename: str
+) -> list[tuple[str, str, int]]:
+    data = _read_bytes(filename)
+    if not triggers.search(data):
+        return []
+
+    # only the lines containing triggers are decoded and fixed, everything else
+    # is copied through as bytes
+    changes = []
+    pieces: list[bytes] = []
+    copied_to = 0
+    for lineno, start, end in _iter_trigger_lines(data, triggers):
+        line, ending = _decode_line(data[start:end])
+        newline = _apply_line_fixer(line_fixer, line)
+        if newline != line:
+            changes.append((line, newline, lineno))
+            pieces.extend((data[copied_to:start], _encode_line(newline, ending)))
+            copied_to = end
+
+    if changes:
+        pieces.append(data[copied_to:])
+        _write_bytes(filename, b"".join(pieces))
+    return changes
+
+
+def _fix_content(
+    content_fixer: ContentFixer,
+    encoding: str,
+    utf8_bytes: bool,
+    stream_threshold: int | None,
+    filename: str,
+) -> list[tuple[str, str, int]]:
+    if _should_stream(filename, stream_threshold):
+        # files too large to be read into memory are fixed one line at a time
+        return _fix_file(
+            content_fixer, encoding, utf8_bytes, stream_threshold, filename
+        )
+
+    triggers = _get_triggers(content_fixer)
+    if not utf8_bytes:
+        content = _read(filename, encoding)
+        if triggers is not None and not triggers.search(content):
+            return []
+        newcontent, changes = _apply_replacements(
+            content, content_fixer.replacements(content)
+        )
+        if changes:
+            _write(filename, encoding, newcontent)
+        return changes
+
+    data = _read_bytes(filename)
+    if triggers is not None and not triggers.search(data):
+        return []
+    # undecodable bytes and line endings are kept as they are, so that the parts
+    # of the file which are not replaced are written back unchanged
+    content = data.decode("utf-8", "surrogateescape")
+    newcontent, changes = _apply_replacements(
+        content, content_fixer.replacements(content)
+    )
+    if changes:
+        _write_bytes(filename, newcontent.encode("utf-8", "surrogateescape"))
+    # as in the other modes, changes are recorded with "\n" line endings
+    return [
+        (original.replace("\r\n", "\n"), updated.replace("\r\n", "\n"), lineno)
+        for original, updated, lineno in changes
+    ]
+
+
+def _apply_replacements(
+    content: str, replacements: Replacements
+) -> tuple[str, list[tuple[str, str, int]]]:
+    """Apply replacements to a whole text, returning the new text and the changes
+    made, as a line fixer's changes would be recorded. A replacement which spans
+    lines is recorded as one change to all of them, along with any other
+    replacements in those lines."""
+    # group the replacements by the lines which they touch, as the (start, end)
+    # offsets of the lines, and the replacements in them
+    groups: list[tuple[int, int, Replacements]] = []
+    for start, end, replacement in replacements:
+        line_start = content.rfind("\n", 0, start) + 1
+        line_end = content.find("\n", max(start, end - 1)) + 1 or len(content)
+        if groups and line_start < groups[-1][1]:
+            group_start, group_end, group = groups[-1]
+            groups[-1] = (group_start, max(group_end, line_end), group)
+            group.append((start, end, replacement))
+        else:
+            groups.append((line_start, line_end, [(start, end, replacement)]))
+
+    changes = []
+    pieces: list[str] = []
+    copied_to = 0
+    lineno = 1
+    for line_start, line_end, group in groups:
+        lineno += content.count("\n", copied_to, line_start)
+        updated_pieces: list[str] = []
+        position = line_start
+        for start, end, replacement in group:
+            updated_pieces.extend((content[position:start], replacement))
+            position = end
+        updated_pieces.append(content[position:line_end])
+        original, updated = content[line_start:line_end], "".join(updated_pieces)
+        if updated != original:
+            changes.append((original, updated, lineno))
+        pieces.extend((content[copied_to:line_start], updated))
+        lineno += original.count("\n")
+        copied_to = line_end
+
+    if not changes:
+        return content, changes
+    pieces.append(content[copied_to:])
+    return "".join(pieces), changes
+
+
+def _failed_lines(
+    line_checker: t.Callable[[str], bool], lines: t.Iterable[tuple[str, int]]
+) -> list[_Failure]:
+    return [(line, lineno) for line, lineno in lines if not line_checker(line)]
+
+
+def _check_file(
+    line_checker: t.Callable[[str], bool],
+    encoding: str,
+    utf8_bytes: bool,
+    stream_threshold: int | None,
+    filename: str,
+) -> list[_Failure]:
+    triggers = _get_triggers(line_checker)
+    if _should_stream(filename, stream_threshold):
+        if triggers is not None and (utf8_bytes or _is_utf8(encoding)):
+            mapped_failures = _check_mapped(line_checker, triggers, filename)
+            if mapped_failures is not None:
+                return mapped_failures
+
+        failures: list[_Failure] = []
+
+        def run_line(lineno: int, line: str) -> str:
+            if not line_checker(line):
+                failures.append((line, lineno))
+            return line
+
+        _stream_lines(
+            filename,
+            _stream_encoding(encoding, utf8_bytes, triggers),
+            triggers,
+            run_line,
+        )
+        return failures
+
+    if utf8_bytes and triggers is not None:
+        data = _read_bytes(filename)
+        if not triggers.search(data):
+            return []
+        return _failed_lines(
+            line_checker,
+            (
+                (_decode_line(data[start:end])[0], lineno)
+                for lineno, start, end in _iter_trigger_lines(data, triggers)
+            ),
+        )
+
+    content = _read(filename, encoding)
+    if triggers is None:
+        return _failed_lines(
+            line_checker,
+            ((line, lineno) for lineno, line in enumerate(_splitlines(content), 1)),
+        )
+    if not triggers.search(content):
+        return []
+    return _failed_lines(
+        line_checker,
+        (
+            (content[start:end], lineno)
+            for lineno, start, end in _iter_trigger_lines(content, triggers)
+        ),
+    )
+
+
+# the results of a composite run on a file: the changes made by each fixer, and the
+# failing lines for each checker
+_CompositeResult = tuple[list[list[tuple[str, str, int]]], list[list[_Failure]]]
+
+
+def _run_composite_file(
+    line_fixers: t.Sequence[t.Callable[[str], str]],
+    line_checkers: t.Sequence[t.Callable[[str], bool]],
+    triggers: TriggerSet | None,
+    encoding: str,
+    utf8_bytes: bool,
+    stream_threshold: int | None,
+    filename: str,
+) -> _CompositeResult:
+    changes: list[list[tuple[str, str, int]]] = [[] for _ in line_fixers]
+    failures: list[list[_Failure]] = [[] for _ in line_checkers]
+    line_fixers = [_line_function(line_fixer) for line_fixer in line_fixers]
+
+    def run_line(lineno: int, line: str) -> str:
+        for fixer_changes, line_fixer in zip(changes, line_fixers):
+            newline = _apply_line_fixer(line_fixer, line)
+            if newline != line:
+                fixer_changes.append((line, newline, lineno))
+            line = newline
+        for checker_failures, line_checker in zip(failures, line_checkers):
+            if not line_checker(line):
+                checker_failures.append((line, lineno))
+        return line
+
+    if _should_stream(filename, stream_threshold):
+        _stream_lines(
+            filename,
+            _stream_encoding(encoding, utf8_bytes, triggers),
+            triggers,
+            run_line,
+        )
+        return changes, failures
+
+    if utf8_bytes and triggers is not None:
+        data = _read_bytes(filename)
+        if not triggers.search(data):
+            return changes, failures
+
+        pieces: list[bytes] = []
+        copied_to = 0
+        for lineno, start, end in _iter_trigger_lines(data, triggers):
+            line, ending = _decode_line(data[start:end])
+            newline = run_line(lineno, line)
+            if newline != line:
+                pieces.extend((data[copied_to:start], _encode_line(newline, ending)))
+                copied_to = end
+
+        if pieces:
+            pieces.append(data[copied_to:])
+            _write_bytes(filename, b"".join(pieces))
+        return changes, failures
+
+    content = _read(filename, encoding)
+    if triggers is not None and not triggers.search(content):
+        return changes, failures
+
+    changed = False
+    newcontent = []
+    for lineno, line in enumerate(_splitlines(content), 1):
+        newline = run_line(lineno, line)
+        changed = changed or newline != line
+        newcontent.append(newline)
+
+    if changed:
+        _write(filename, encoding, "".join(newcontent))
+    return changes, failures
+
+
+# the changes or failures found in a file, as sent back by the worker which found
+# them: the first few, to be recorded in detail, and the number of all of them
+_Compacted = tuple[list[t.Any], int]
+# for changes without the text of their lines, the range of columns changed in
+# each line is sent back too
+_CompactedChanges = tuple[list[tuple[str, str, int]], int, list[tuple[int, int]] | None]
+
+
+def _compact_changes(
+    keep_lines: bool, limit: int | None, changes: list[tuple[str, str, int]]
+) -> _CompactedChanges:
+    # the text of the lines is dropped unless it will be recorded, so that it is
+    # not sent back from worker processes for nothing
+    kept = changes if limit is None else changes[:limit]
+    if keep_lines:
+        return kept, len(changes), None
+    columns = [_changed_columns(original, updated) for original, updated, _ in kept]
+    return [("", "", lineno) for _, _, lineno in kept], len(changes), columns
+
+
+def _compact_failures(
+    keep_lines: bool, limit: int | None, failures: list[_Failure]
+) -> _Compacted:
+    kept = failures if limit is None else failures[:limit]
+    if not keep_lines:
+        kept = [("", lineno) for _, lineno in kept]
+    return kept, len(failures)
+
+
+def _changes_compactor(
+    options: RunOptions,
+) -> t.Callable[[list[tuple[str, str, int]]], _CompactedChanges]:
+    # events are written for every change, with the text of its line
+    if options.events is not None:
+        return functools.partial(_compact_changes, True, None)
+    return functools.partial(
+        _compact_changes, options.record_lines, options.max_records_per_file
+    )
+
+
+def _failures_compactor(
+    options: RunOptions,
+) -> t.Callable[[list[_Failure]], _Compacted]:
+    # only line numbers are recorded, but events are written for every failure,
+    # with the text of its line
+    if options.events is not None:
+        return functools.partial(_compact_failures, True, None)
+    return functools.partial(_compact_failures, False, options.max_records_per_file)
+
+
+def _compact_composite(
+    compact_changes: t.Callable[[list[tuple[str, str, int]]], _CompactedChanges],
+    compact_failures: t.Callable[[list[_Failure]], _Compacted],
+    result: _CompositeResult,
+) -> tuple[list[_CompactedChanges], list[_Compacted]]:
+    changes, failures = result
+    return [compact_changes(x) for x in changes], [
+        compact_failures(x) for x in failures
+    ]
+
+
+def _compacted(
+    work: t.Callable[[str], t.Any],
+    compact: t.Callable[[t.Any], t.Any],
+    filename: str,
+) -> t.Any:
+    return compact(work(filename))
+
+
+_R = t.TypeVar("_R")
+
+# when the number of jobs is not given, small batches of files are processed in the
+# current process, as starting workers would cost more than it saves
+_MIN_FILES_FOR_DEFAULT_JOBS = 32
+
+
+# threads are cheap to start, so they are used for smaller batches
+_MIN_FILES_FOR_DEFAULT_THREADS = 8
+
+
+def _gil_enabled() -> bool:
+    # free-threaded builds of CPython (3.13+) may run with the GIL disabled, in
+    # which case threads work on files in parallel, without the cost of starting
+    # worker processes and sending work and results between them
+    is_gil_enabled = getattr(sys, "_is_gil_enabled", None)
+    return is_gil_enabled is None or bool(is_gil_enabled())
+
+
+def _default_jobs() -> int:
+    cpu_count = getattr(os, "process_cpu_count", os.cpu_count)()
+    return cpu_count or 1
+
+
+def _map_files(
+    work: t.Callable[[str], _R],
+    filenames: list[str],
+    jobs: int | None,
+    io_concurrency: int | None = None,
+) -> t.Iterator[_R]:
+    """Apply `work` to each file, yielding results in the order of `filenames`.
+
+    With more than one job, files are distributed over a pool of worker processes.
+    Work which cannot be sent to a worker process is always done serially. On
+    builds of Python running without the GIL, the jobs are threads instead. With an
+    `io_concurrency`, files are worked on by a pool of threads in the current
+    process, and `jobs` is ignored."""
+    if io_concurrency is not None and filenames:
+        return _map_files_on_event_loop(work, filenames, io_concurrency)
+    threads = not _gil_enabled()
+    if jobs is None:
+        if len(filenames) < (
+            _MIN_FILES_FOR_DEFAULT_THREADS if threads else _MIN_FILES_FOR_DEFAULT_JOBS
+        ):
+            return map(work, filenames)
+        jobs = _default_jobs()
+    jobs = min(jobs, len(filenames))
+    if jobs <= 1:
+        return map(work, filenames)
+    if threads:
+        # a few files are queued for each thread, so that threads are not left
+        # idle while the results of the first file in the window are recorded
+        return _map_files_in_threads(work, filenames, jobs, window=jobs * 4)
+    try:
+        pickle.dumps(work)
+    except (pickle.PicklingError, AttributeError, TypeError):
+        return map(work, filenames)
+    return _map_files_in_processes(work, filenames, jobs)
+
+
+def _map_files_in_processes(
+    work: t.Callable[[str], _R], filenames: list[str], jobs: int
+) -> t.Iterator[_R]:
+    from concurrent.futures import ProcessPoolExecutor
+
+    # several chunks per worker keeps the workers evenly loaded, while amortizing
+    # the cost of sending work and results between processes
+    chunksize = max(1, min(64, len(filenames) // (jobs * 4)))
+    executor = ProcessPoolExecutor(max_workers=jobs)
+    try:
+        yield from executor.map(work, filenames, chunksize=chunksize)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _map_files_on_event_loop(
+    work: t.Callable[[str], _R], filenames: list[str], concurrency: int
+) -> t.Iterator[_R]:
+    # an event loop drives a window of files through a pool of threads: while one
+    # thread waits on a read or a write, others work on the next files, and at most
+    # `concurrency` files are in memory at once. Results are taken from the front
+    # of the window, so they come out in order, and each taken result starts work
+    # on another file
+    # The work returns its results rather than recording them, so the recorders
+    # are only used by the thread which takes the results, and need no locking
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+
+    loop = asyncio.new_event_loop()
+    executor = ThreadPoolExecutor(
+        max_workers=concurrency, thread_name_prefix="texthooks-io"
+    )
+    remaining = iter(filenames)
+    window: collections.deque[asyncio.Future[_R]] = collections.deque()
+
+    def start_next() -> None:
+        filename = next(remaining, None)
+        if filename is not None:
+            window.append(loop.run_in_executor(executor, work, filename))
+
+    try:
+        for _ in range(concurrency):
+            start_next()
+        while window:
+            result = loop.run_until_complete(window.popleft())
+            start_next()
+            yield result
+    finally:
+        for future in window:
+            # retrieve the errors of any finished files, so that they are not
+            # reported as unhandled
+            if not future.cancel():
+                future.exception()
+        executor.shutdown(wait=True, cancel_futures=True)
+        loop.close()
+
+
+def _map_files_in_threads(
+    work: t.Callable[[str], _R], filenames: list[str], workers: int, window: int
+) -> t.Iterator[_R]:
+    # as on the event loop, a window of files is moved through a pool of threads,
+    # with results taken from its front; without the loop, which costs tens of
+    # microseconds per file, so that CPU-bound jobs on many small files scale
+    from concurrent.futures import Future, ThreadPoolExecutor
+
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="texthooks")
+    remaining = iter(filenames)
+    pending: collections.deque[Future[_R]] = collections.deque(
+        executor.submit(work, filename)
+        for filename in itertools.islice(remaining, window)
+    )
+    try:
+        while pending:
+            result = pending.popleft().result()
+            for filename in itertools.islice(remaining, 1):
+                pending.append(executor.submit(work, filename))
+            yield result
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+# the number of changes or failures which are recorded in detail for each file
+DEFAULT_MAX_RECORDS_PER_FILE = 1000
+
+
+class RunOptions:
+    """
+    Options which control how the recorders read, process, and write files.
+
+    :param utf8_bytes: Read files as UTF-8 bytes. For fixers and checkers which
+        declare `triggers`, only the lines which contain a trigger are decoded, and
+        files without any are never decoded at all.
+    :param jobs: The number of worker processes to use, or of threads, on builds of
+        Python running without the GIL. By default, the CPU count is used for large
+        batches of files, and small batches are processed serially.
+    :param io_concurrency: The number of files to work on at once in threads of the
+        current process, so that waiting on their reads and writes overlaps. This is
+        for filesystems with high latency, such as network filesystems, and
+        overrides `jobs`. By default, threads are not used.
+    :param cache_dir: A directory in which to cache the files found to be clean, so
+        that they can be skipped on later runs. By default, no cache is used.
+    :param record_lines: Record the text of changed lines, which is needed to show
+        the changes. If False, only line numbers and column ranges are recorded.
+    :param max_records_per_file: The number of changed lines, or failing line numbers,
+        to record in detail for each file. Any more are only counted. None records
+        all of them.
+    :param stream_threshold: The size in bytes at which files are processed one line
+        at a time, rather than being read into memory, with changes written to a
+        temp file which replaces the original (or is copied over it, if it has
+        other hardlinks). None disables streaming.
+    :param timings: Timings to which the time spent on each phase of the run, and on
+        each file, are added. By default, nothing is timed.
+    :param profile_path: A path to which `instrument()` writes `cProfile` stats.
+    :param metrics: Metrics which `instrument()` writes at the end of the run. The
+        hooks are measured, which requires `timings`.
+    :param events: An event stream to which results are written as each file is
+        recorded, rather than being kept by the recorders to be printed.
+    """
+
+    def __init__(
+        self,
+        *,
+        utf8_bytes: bool = False,
+        jobs: int | None = None,
+        io_concurrency: int | None = None,
+        cache_dir: str | None = None,
+        record_lines: bool = True,
+        max_records_per_file: int | None = DEFAULT_MAX_RECORDS_PER_FILE,
+        stream_threshold: int | None = DEFAULT_STREAM_THRESHOLD,
+        timings: Timings | None = None,
+        profile_path: str | None = None,
+        metrics: Metrics | None = None,
+        events: EventStream | None = None,
+    ) -> None:
+        self.utf8_bytes = utf8_bytes
+        self.jobs = jobs
+        self.io_concurrency = io_concurrency
+        self.cache_dir = cache_dir
+        self.record_lines = record_lines
+        self.max_records_per_file = max_records_per_file
+        self.stream_threshold = stream_threshold
+        self.timings = timings
+        self.profile_path = profile_path
+        self.metrics = metrics
+        self.events = events
+
+    @classmethod
+    def from_args(cls, args: t.Any) -> RunOptions:
+        trace_memory = getattr(args, "trace_memory", False)
+        report = getattr(args, "timings", False) or trace_memory
+        metrics = None
+        if getattr(args, "metrics_file", None) is not None:
+            from ._metrics import Metrics
+
+            metrics = Metrics(args.metrics_file, args.metrics_format)
+        timings = None
+        if report or metrics is not None:
+            from ._timings import Timings
+
+            timings = Timings(trace_memory=trace_memory, report=report)
+        events = None
+        if getattr(args, "format", "text") == "ndjson":
+            from ._events import EventStream
+
+            events = EventStream()
+        # memory is traced, and profiles are collected, only in the current
+        # process, so all of the work is done there
+        jobs = getattr(args, "jobs", None)
+        io_concurrency = getattr(args, "io_concurrency", None)
+        if trace_memory or getattr(args, "profile", None) is not None:
+            jobs = 1
+        if getattr(args, "profile", None) is not None:
+            # the profiler only sees the main thread
+            io_concurrency = None
+        return cls(
+            utf8_bytes=getattr(args, "utf8_bytes", False),
+            jobs=jobs,
+            io_concurrency=io_concurrency,
+            cache_dir=None if getattr(args, "no_cache", True) else args.cache_dir,
+            record_lines=getattr(args, "show_changes", True),
+            stream_threshold=getattr(
+                args, "stream_threshold", DEFAULT_STREAM_THRESHOLD
+            ),
+            timings=timings,
+            profile_path=getattr(args, "profile", None),
+            metrics=metrics,
+            events=events,
+        )
+
+    def instrument(self) -> t.ContextManager[None]:
+        """Instrument a run with these options, printing the timings and writing the
+        metrics at its end."""
+        return _timings.instrument(
+            self.timings,
+            self.profile_path,
+            None if self.metrics is None else self.metrics.write,
+        )
+
+    def measure_fixer(
+        self, hook_name: str | None, line_fixer: t.Callable[[str], str]
+    ) -> t.Callable[[str], str]:
+        """Wrap a line fixer to measure it, if metrics are being collected."""
+        if self.metrics is None or self.timings is None:
+            return line_fixer
+        from ._metrics import MeasuredFixer
+
+        return MeasuredFixer(hook_name or "line-fixer", line_fixer)
+
+    def measure_content_fixer(
+        self, hook_name: str | None, content_fixer: ContentFixer
+    ) -> ContentFixer:
+        """Wrap a content fixer to measure it, if metrics are being collected, both
+        line by line and when it fixes the whole content of a file."""
+        if self.metrics is None or self.timings is None:
+            return content_fixer
+        from ._metrics import MeasuredContentFixer
+
+        return MeasuredContentFixer(hook_name or "content-fixer", content_fixer)
+
+    def measure_checker(
+        self, hook_name: str | None, line_checker: t.Callable[[str], bool]
+    ) -> t.Callable[[str], bool]:
+        """Wrap a line checker to measure it, if metrics are being collected."""
+        if self.metrics is None or self.timings is None:
+            return line_checker
+        from ._metrics import MeasuredChecker
+
+        return MeasuredChecker(hook_name or "line-checker", line_checker)
 
 
 class _VPrinter:
+    # messages are written whole, under a lock shared by all printers, so that
+    # messages printed from different threads are not interleaved
+    _lock = threading.Lock()
+
     def __init__(self, verbosity: int) -> None:
         self.verbosity = verbosity
 
     def out(self, message: str, verbosity: int = 1, end: str = "\n") -> None:
         if not self.verbosity >= verbosity:
             return
-        print(message, end=end)
+        message += end
+        with self._lock:
+            try:
+                sys.stdout.write(message)
+            except UnicodeEncodeError:
+                # lines read as UTF-8 bytes keep undecodable bytes as surrogates,
+                # which are shown escaped if stdout cannot write them
+                encoding = sys.stdout.encoding or "utf-8"
+                message = message.encode(encoding, "backslashreplace").decode(encoding)
+                sys.stdout.write(message)
+
+
+def _run_files(
+    work: t.Callable[[str], _R],
+    filenames: t.Iterable[str],
+    options: RunOptions,
+    printer: _VPrinter,
+    record: t.Callable[[str, t.Any], bool],
+    compact: t.Callable[[_R], t.Any] | None = None,
+) -> bool:
+    """Apply `work` to each file, possibly in parallel, and pass the results to
+    `record` in the order the files were given. `record` returns True if the file
+    had changes or failures.
+
+    If `compact` is given, it is applied to each result where the work is done
+    (e.g. in a worker process), and `record` receives its result.
+
+    If a cache is in use, files which were clean on a previous run of the same work
+    are skipped without being read, and files which are clean on this run are added
+    to the cache.
+
+    Returns True if any file had changes or failures, False otherwise"""
+    timings = options.timings
+    with _timings.phase(timings, "discovery"):
+        filenames = list(filenames)
+    cache = None
+    if options.cache_dir is not None:
+        cache = _cache.ResultCache.open(options.cache_dir, work)
+
+    mapped_work: t.Callable[[str], t.Any] = work
+    if compact is not None:
+        mapped_work = functools.partial(_compacted, work, compact)
+    cached = [False] * len(filenames)
+    if cache is not None:
+        mapped_work = functools.partial(_cache.fingerprinted, mapped_work)
+        cached = cache.find_clean(filenames)
+    if timings is not None:
+        mapped_work = functools.partial(_timings.timed, mapped_work)
+    results = _map_files(
+        mapped_work,
+        [filename for filename, hit in zip(filenames, cached) if not hit],
+        options.jobs,
+        options.io_concurrency,
+    )
+
+    found = False
+    try:
+        for filename, hit in zip(filenames, cached):
+            printer.out(f"checking {filename}...", end="", verbosity=2)
+            if hit:
+                printer.out("ok", verbosity=2)
+                if timings is not None:
+                    timings.cached += 1
+                continue
+            try:
+                result = next(results)
+            except FileNotFoundError:
+                printer.out(f"fail, FileNotFound: {filename}", verbosity=1)
+                raise
+            if timings is not None:
+                result, stats = result
+                timings.add_file(filename, stats)
+            fingerprint = None
+            if cache is not None:
+                result, fingerprint = result
+            with _timings.phase(timings, "process"):
+                failed = record(filename, result)
+            if failed:
+                printer.out("fail", verbosity=2)
+                found = True
+            else:
+                printer.out("ok", verbosity=2)
+                if cache is not None and fingerprint is not None:
+                    cache.add_clean(filename, fingerprint)
+    finally:
+        if cache is not None:
+            cache.save()
+    return found
+
+
+def _common_prefix_length(a: str, b: str) -> int:
+    # binary search over slice comparisons, which run in C, rather than comparing
+    # the (possibly very long) strings one character at a time
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        mid = (low + high + 1) // 2
+        if a[:mid] == b[:mid]:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+
+def _changed_columns(original: str, updated: str) -> tuple[int, int]:
+    """Find the range of columns in `original` which differ from `updated`, as a
+    half-open range of 0-based offsets."""
+    start = _common_prefix_length(original, updated)
+    suffix = _common_prefix_length(original[start:][::-1], updated[start:][::-1])
+    return start, len(original) - suffix
+
+
+def format_linenos(linenos: t.Iterable[int]) -> str:
+    """Format line numbers as a comma-separated list, collapsing runs of three or
+    more consecutive numbers into ranges, e.g. "1-4,7,8"."""
+    parts = []
+    run: list[int] = []
+    for lineno in linenos:
+        if run and lineno == run[-1] + 1:
+            run.append(lineno)
+            continue
+        parts.append(_format_run(run))
+        run = [lineno]
+    parts.append(_format_run(run))
+    return ",".join(x for x in parts if x)
+
+
+def _format_run(run: list[int]) -> str:
+    if len(run) >= 3:
+        return f"{run[0]}-{run[-1]}"
+    return ",".join(str(x) for x in run)
+
+
+class FileChanges:
+    """
+    The changes made to a file: the number of each changed line, the range of
+    columns changed in it, and optionally the text of the line before and after.
+
+    Only the first `limit` changes are recorded in detail, the rest are counted.
+    Iterating yields `(original, updated, lineno)` for each change recorded with
+    its text.
+    """
+
+    __slots__ = ("linenos", "columns", "lines", "count", "limit")
+
+    def __init__(self, keep_lines: bool, limit: int | None) -> None:
+        self.linenos = array.array("L")
+        # start and end offsets, in pairs
+        self.columns = array.array("L")
+        self.lines: list[tuple[str, str, Spans | None]] | None = (
+            [] if keep_lines else None
+        )
+        self.count = 0
+        self.limit = limit
+
+    def add(
+        self,
+        original: str,
+        updated: str,
+        lineno: int,
+        spans: Spans | None = None,
+        columns: tuple[int, int] | None = None,
+    ) -> None:
+        """Record a change. The changed columns are found from the spans or the
+        text of the line, unless they are given."""
+        self.count += 1
+        if self.limit is not None and len(self.linenos) >= self.limit:
+            return
+        self.linenos.append(lineno)
+        if columns is None:
+            if spans:
+                columns = (spans[0][0], spans[-1][1])
+            else:
+                columns = _changed_columns(original, updated)
+        self.columns.extend(columns)
+        if self.lines is not None:
+            self.lines.append((original, updated, spans))
+
+    def add_omitted(self, count: int) -> None:
+        """Count changes which are not recorded in detail."""
+        self.count += count
+
+    @property
+    def omitted(self) -> int:
+        """The number of changes which were counted, but not recorded in detail."""
+        return self.count - len(self.linenos)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __iter__(self) -> t.Iterator[tuple[str, str, int]]:
+        for (original, updated, _), lineno in zip(self.lines or (), self.linenos):
+            yield original, updated, lineno
+
+    def with_spans(self) -> t.Iterator[tuple[str, str, int, Spans | None]]:
+        """Iterate over `(original, updated, lineno, spans)` for each change recorded
+        with its text. `spans` is None if the fixer did not report them."""
+        for (original, updated, spans), lineno in zip(self.lines or (), self.linenos):
+            yield original, updated, lineno, spans
+
+
+class FileFailures:
+    """
+    The lines of a file which failed a check. Only the first `limit` line numbers
+    are recorded, the rest are counted.
+    """
+
+    __slots__ = ("linenos", "count", "limit")
+
+    def __init__(self, limit: int | None) -> None:
+        self.linenos = array.array("L")
+        self.count = 0
+        self.limit = limit
+
+    def add(self, lineno: int) -> None:
+        self.count += 1
+        if self.limit is None or len(self.linenos) < self.limit:
+            self.linenos.append(lineno)
+
+    def add_omitted(self, count: int) -> None:
+        self.count += count
+
+    @property
+    def omitted(self) -> int:
+        return self.count - len(self.linenos)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __iter__(self) -> t.Iterator[int]:
+        return iter(self.linenos)
 
 
 class DiffRecorder:
-    def __init__(self, verbosity: int) -> None:
-        self._printer = _VPrinter(verbosity)
+    def __init__(
+        self,
+        verbosity: int,
+        options: RunOptions | None = None,
+        *,
+        hook_name: str | None = None,
+    ) -> None:
+        self._options = options or RunOptions()
+        # when results are streamed as events, nothing else is written to stdout
+        self._printer = _VPrinter(0 if self._options.events else verbosity)
+        self.hook_name = hook_name
+        # the number of files with results which were streamed, rather than kept
+        self.streamed = 0
         # in py3.6+ the dict builtin maintains order, but being explicit is
         # slightly safer since we're being explicit about the fact that we want
         # to retain key order
-        self.by_fname: t.MutableMapping[str, list[tuple[str, str, int]]] = (
-            collections.OrderedDict()
-        )
+        self.by_fname: t.MutableMapping[str, FileChanges] = collections.OrderedDict()
         self._file_encoding = _determine_encoding()
 
-    def add(self, fname: str, original: str, updated: str, lineno: int) -> None:
+    def _changes(self, fname: str) -> FileChanges:
         if fname not in self.by_fname:
-            self.by_fname[fname] = []
-        self.by_fname[fname].append((original, updated, lineno))
+            self.by_fname[fname] = FileChanges(
+                self._options.record_lines, self._options.max_records_per_file
+            )
+        return self.by_fname[fname]
+
+    def add(
+        self,
+        fname: str,
+        original: str,
+        updated: str,
+        lineno: int,
+        spans: Spans | None = None,
+        columns: tuple[int, int] | None = None,
+    ) -> None:
+        self._changes(fname).add(original, updated, lineno, spans, columns)
+
+    def add_fixed(
+        self,
+        fname: str,
+        line_fixer: t.Callable[[str], str],
+        changes: t.Sequence[tuple[str, str, int]],
+        count: int | None = None,
+        columns: t.Sequence[tuple[int, int]] | None = None,
+    ) -> None:
+        """Record the changes made to a file by a line-fixer. If the text of the
+        lines is recorded, the spans replaced by the fixer are too. `count` is the
+        number of changes made, if only the first of them are given, and `columns`
+        are the columns changed in each line, if the text of the lines is not
+        given."""
+        if self._options.events is not None:
+            self._stream_fixed(self._options.events, fname, line_fixer, changes)
+            return
+        for i, (original, updated, lineno) in enumerate(changes):
+            spans = None
+            if self._options.record_lines:
+                spans = _get_replacement_spans(line_fixer, original)
+            self.add(
+                fname,
+                original,
+                updated,
+                lineno,
+                spans,
+                None if columns is None else columns[i],
+            )
+        if count is not None and count > len(changes):
+            self._changes(fname).add_omitted(count - len(changes))
+
+    def _stream_fixed(
+        self,
+        events: EventStream,
+        fname: str,
+        line_fixer: t.Callable[[str], str],
+        changes: t.Iterable[tuple[str, str, int]],
+    ) -> None:
+        count = 0
+        for original, updated, lineno in changes:
+            count += 1
+            spans = _get_replacement_spans(line_fixer, original)
+            if spans is not None:
+                events.change(self.hook_name, fname, original, updated, lineno, spans)
+                continue
+            # without spans, the change is reported as the changed section of the
+            # line, without its line ending
+            original, updated = original.rstrip("\n"), updated.rstrip("\n")
+            start, end = _changed_columns(original, updated)
+            spans = [(start, end, start, end + len(updated) - len(original))]
+            events.change(
+                self.hook_name,
+                fname,
+                original,
+                updated,
+                lineno,
+                spans,
+                replacements=False,
+            )
+        if count:
+            self.streamed += 1
+            events.file(self.hook_name, fname, "changed", count)
 
     def hasdiff(self, fname: str) -> bool:
         return bool(self.by_fname.get(fname))
 
     def __bool__(self) -> bool:
-        return bool(self.by_fname)
+        return bool(self.by_fname) or bool(self.streamed)
 
-    def items(self) -> t.Iterable[tuple[str, list[tuple[str, str, int]]]]:
+    def items(self) -> t.Iterable[tuple[str, FileChanges]]:
         return self.by_fname.items()
 
     def run_line_fixer(self, line_fixer: t.Callable[[str], str], filename: str) -> bool:
         """Given a filename, replace content and write *if* changes were made, using a
         line-fixer function which takes lines as input and produces lines as output.
 
+        If the line-fixer declares `triggers`, files which contain none of them are
+        skipped without being split into lines.
+
         Returns True if changes were made, False if none were made"""
-        self._printer.out(f"checking {filename}...", end="", verbosity=2)
-        try:
-            content = _readlines(filename, self._file_encoding)
-        except FileNotFoundError:
-            self._printer.out(f"fail, FileNotFound: {filename}", verbosity=1)
-            raise
-
-        newcontent = []
-        for lineno, line in enumerate(content, 1):
-            newline = line_fixer(line)
-            # re-add newline if it was stripped by the fixer
-            if line.endswith("\n") and not newline.endswith("\n"):
-                newline += "\n"
-            newcontent.append(newline)
-            if newline != line:
-                self.add(filename, line, newline, lineno)
+        return self.run_line_fixer_on_files(line_fixer, [filename])
+
+    def run_line_fixer_on_files(
+        self, line_fixer: t.Callable[[str], str], filenames: t.Iterable[str]
+    ) -> bool:
+        """Run a line-fixer on many files, possibly in parallel. The results are
+        recorded in the order the files were given.
 
-        if self.hasdiff(filename):
-            self._printer.out("fail", verbosity=2)
-            with open(filename, "w", encoding=self._file_encoding) as f:
-                f.write("".join(newcontent))
-            return True
-        self._printer.out("ok", verbosity=2)
-        return False
+        Returns True if changes were made to any file, False if none were made"""
+        work = functools.partial(
+            _fix_file,
+            self._options.measure_fixer(self.hook_name, line_fixer),
+            self._file_encoding,
+            self._options.utf8_bytes,
+            self._options.stream_threshold,
+        )
+
+        def record(filename: str, result: _CompactedChanges) -> bool:
+            changes, count, columns = result
+            self.add_fixed(filename, line_fixer, changes, count, columns)
+            return bool(count)
+
+        return _run_files(
+            work,
+            filenames,
+            self._options,
+            self._printer,
+            record,
+            _changes_compactor(self._options),
+        )
+
+    def run_content_fixer_on_files(
+        self, content_fixer: ContentFixer, filenames: t.Iterable[str]
+    ) -> bool:
+        """Run a content-fixer on many files, possibly in parallel, fixing the whole
+        content of each file at once, rather than line by line. Files at or above
+        the stream threshold are fixed line by line, so that they are not read into
+        memory. The results are recorded in the order the files were given.
+
+        Returns True if changes were made to any file, False if none were made"""
+        work = functools.partial(
+            _fix_content,
+            self._options.measure_content_fixer(self.hook_name, content_fixer),
+            self._file_encoding,
+            self._options.utf8_bytes,
+            self._options.stream_threshold,
+        )
+
+        def record(filename: str, result: _CompactedChanges) -> bool:
+            changes, count, columns = result
+            self.add_fixed(filename, content_fixer, changes, count, columns)
+            return bool(count)
+
+        return _run_files(
+            work,
+            filenames,
+            self._options,
+            self._printer,
+            record,
+            _changes_compactor(self._options),
+        )
 
     def print_changes(
         self,
@@ -125,8 +1633,29 @@ class DiffRecorder:
         ansi_colors: bool,
         *,
         charwidth: t.Callable[[str], int] | None = None,
+        hook_name: str | None = None,
     ) -> None:
-        self._printer.out("Changes were made in these files:")
+        """Print the files which were changed, and optionally the changes made to
+        them. `charwidth` sets the number of columns used to mark each character
+        under a change, e.g. `display_width`. By default, each character is marked
+        with one column."""
+        # streamed results were written as they were recorded
+        if self._options.events is not None:
+            return
+        with _timings.phase(self._options.timings, "report"):
+            self._print_changes(show_changes, ansi_colors, charwidth, hook_name)
+
+    def _print_changes(
+        self,
+        show_changes: bool,
+        ansi_colors: bool,
+        charwidth: t.Callable[[str], int] | None,
+        hook_name: str | None,
+    ) -> None:
+        if hook_name:
+            self._printer.out(f"Changes were made by {hook_name} in these files:")
+        else:
+            self._printer.out("Changes were made in these files:")
         for filename, changeset in self.items():
             if ansi_colors:
                 filename_c = colorize(filename, color="yellow")
@@ -134,49 +1663,126 @@ class DiffRecorder:
                 filename_c = filename
             self._printer.out(f"  {filename_c}")
             if show_changes:
-                for original, updated, lineno in changeset:
-                    comparison = create_comparison_lines(original, updated)
+                for original, updated, lineno, spans in changeset.with_spans():
+                    # a change made to the whole content of a file may span lines
+                    last_lineno = lineno + original.count("\n", 0, -1)
+                    if last_lineno > lineno:
+                        comparison = _compare_multiline(original, updated)
+                        label = f"lines {lineno}-{last_lineno}"
+                    else:
+                        comparison = compare_lines(original, updated, spans, charwidth)
+                        label = f"line {lineno}"
                     if ansi_colors:
                         comparison = colorize_comparison(comparison)
-                    self._printer.out(f"  line {lineno}:")
+                    self._printer.out(f"  {label}:")
                     for line in comparison:
                         self._printer.out(f"    {line}")
+                if changeset.lines is None:
+                    self._printer.out(
+                        f"  line numbers: {format_linenos(changeset.linenos)}"
+                    )
+                if changeset.omitted:
+                    self._printer.out(
+                        f"  ...and {changeset.omitted} more changed lines"
+                    )
 
 
 class CheckRecorder:
-    def __init__(self, verbosity: int) -> None:
-        self._printer = _VPrinter(verbosity)
-        self.by_fname: t.MutableMapping[str, list[int]] = collections.OrderedDict()
+    def __init__(
+        self,
+        verbosity: int,
+        options: RunOptions | None = None,
+        *,
+        hook_name: str | None = None,
+    ) -> None:
+        self._options = options or RunOptions()
+        self._printer = _VPrinter(0 if self._options.events else verbosity)
+        self.hook_name = hook_name
+        self.streamed = 0
+        self.by_fname: t.MutableMapping[str, FileFailures] = collections.OrderedDict()
         self._file_encoding = _determine_encoding()
 
-    def add(self, fname: str, lineno: int) -> None:
+    def _failures(self, fname: str) -> FileFailures:
         if fname not in self.by_fname:
-            self.by_fname[fname] = []
-        self.by_fname[fname].append(lineno)
+            self.by_fname[fname] = FileFailures(self._options.max_records_per_file)
+        return self.by_fname[fname]
+
+    def add(self, fname: str, lineno: int) -> None:
+        self._failures(fname).add(lineno)
+
+    def add_failed(
+        self,
+        fname: str,
+        line_checker: t.Callable[[str], bool],
+        failures: t.Sequence[_Failure],
+        count: int | None = None,
+    ) -> None:
+        """Record the lines of a file which failed a line-checker. `count` is the
+        number of failing lines, if only the first of them are given."""
+        events = self._options.events
+        if events is None:
+            for _, lineno in failures:
+                self.add(fname, lineno)
+            if count is not None and count > len(failures):
+                self._failures(fname).add_omitted(count - len(failures))
+            return
+        count = 0
+        for line, lineno in failures:
+            count += 1
+            events.failure(
+                self.hook_name, fname, line, lineno, _get_triggers(line_checker)
+            )
+        if count:
+            self.streamed += 1
+            events.file(self.hook_name, fname, "failed", count)
 
     def __bool__(self) -> bool:
-        return bool(self.by_fname)
+        return bool(self.by_fname) or bool(self.streamed)
 
-    def items(self) -> t.Iterable[tuple[str, list[int]]]:
+    def items(self) -> t.Iterable[tuple[str, FileFailures]]:
         return self.by_fname.items()
 
     def run_line_checker(
         self, line_checker: t.Callable[[str], bool], filename: str
     ) -> bool:
-        self._printer.out(f"checking {filename}...", end="", verbosity=2)
-        content = _readlines(filename, self._file_encoding)
+        return self.run_line_checker_on_files(line_checker, [filename])
 
-        for lineno, line in enumerate(content, 1):
-            if not line_checker(line):
-                self.add(filename, lineno)
+    def run_line_checker_on_files(
+        self, line_checker: t.Callable[[str], bool], filenames: t.Iterable[str]
+    ) -> bool:
+        """Run a line-checker on many files, possibly in parallel. The results are
+        recorded in the order the files were given.
 
-        if filename in self.by_fname:
-            self._printer.out("fail", verbosity=2)
-            return True
-        self._printer.out("ok", verbosity=2)
-        return False
+        Returns True if any check failed, False otherwise"""
+        work = functools.partial(
+            _check_file,
+            self._options.measure_checker(self.hook_name, line_checker),
+            self._file_encoding,
+            self._options.utf8_bytes,
+            self._options.stream_threshold,
+        )
+
+        def record(filename: str, result: _Compacted) -> bool:
+            failures, count = result
+            self.add_failed(filename, line_checker, failures, count)
+            return bool(count)
+
+        return _run_files(
+            work,
+            filenames,
+            self._options,
+            self._printer,
+            record,
+            _failures_compactor(self._options),
+        )
 
     def print_failures(self, checkname: str, ansi_colors: bool) -> None:
+        if self._options.events is not None:
+            return
+        with _timings.phase(self._options.timings, "report"):
+            self._print_failures(checkname, ansi_colors)
+
+    def _print_failures(self, checkname: str, ansi_colors: bool) -> None:
         self._printer.out(f"These files failed the {checkname} check:")
         for filename, linenos in self.items():
             if ansi_colors:
@@ -184,9 +1790,129 @@ class CheckRecorder:
             else:
                 filename_c = filename
             self._printer.out(f"  {filename_c}")
-            commasep_linenos = ",".join(str(x) for x in linenos)
             if len(linenos) == 1:
                 prefix = "lineno"
             else:
                 prefix = "line numbers"
-            self._printer.out(f"  {prefix}: {commasep_linenos}")
+            message = f"  {prefix}: {format_linenos(linenos)}"
+            if linenos.omitted:
+                message += f" ...and {linenos.omitted} more"
+            self._printer.out(message)
+
+
+class CompositeRecorder:
+    """
+    Run several line fixers and line checkers over files in a single pass.
+
+    Each file is read once, every fixer is applied in order to each line, and the
+    checkers are run on the fixed line. The file is written at most once.
+    Results are recorded per hook, in a DiffRecorder or CheckRecorder for each.
+    """
+
+    def __init__(
+        self,
+        verbosity: int,
+        fixers: t.Sequence[tuple[str, t.Callable[[str], str]]],
+        checkers: t.Sequence[tuple[str, t.Callable[[str], bool]]],
+        options: RunOptions | None = None,
+    ) -> None:
+        self._options = options or RunOptions()
+        self._printer = _VPrinter(0 if self._options.events else verbosity)
+        self.fixers = [
+            (name, fixer, DiffRecorder(verbosity, self._options, hook_name=name))
+            for name, fixer in fixers
+        ]
+        self.checkers = [
+            (name, checker, CheckRecorder(verbosity, self._options, hook_name=name))
+            for name, checker in checkers
+        ]
+        self._file_encoding = _determine_encoding()
+
+        # the composite can only skip files if every fixer and checker declares its
+        # triggers
+        self.triggers: TriggerSet | None = TriggerSet(())
+        funcs: list[t.Callable] = [f for _, f in fixers] + [c for _, c in checkers]
+        for func in funcs:
+            func_triggers = _get_triggers(func)
+            if self.triggers is None or func_triggers is None:
+                self.triggers = None
+            else:
+                self.triggers |= func_triggers
+
+    def __bool__(self) -> bool:
+        return any(recorder for _, _, recorder in self.fixers) or any(
+            recorder for _, _, recorder in self.checkers
+        )
+
+    def run(self, filename: str) -> bool:
+        """Given a filename, run all fixers and checkers on its content and write
+        the fixed content *if* changes were made.
+
+        Returns True if changes were made or a check failed, False otherwise"""
+        return self.run_on_files([filename])
+
+    def run_on_files(self, filenames: t.Iterable[str]) -> bool:
+        """Run all fixers and checkers on many files, possibly in parallel. The
+        results are recorded in the order the files were given.
+
+        Returns True if changes were made or a check failed, False otherwise"""
+        work = functools.partial(
+            _run_composite_file,
+            [
+                self._options.measure_fixer(name, fixer)
+                for name, fixer, _ in self.fixers
+            ],
+            [
+                self._options.measure_checker(name, checker)
+                for name, checker, _ in self.checkers
+            ],
+            self.triggers,
+            self._file_encoding,
+            self._options.utf8_bytes,
+            self._options.stream_threshold,
+        )
+
+        def record(
+            filename: str, result: tuple[list[_CompactedChanges], list[_Compacted]]
+        ) -> bool:
+            changes, failures = result
+            for (_, fixer, diff_recorder), (fixer_changes, count, columns) in zip(
+                self.fixers, changes
+            ):
+                diff_recorder.add_fixed(filename, fixer, fixer_changes, count, columns)
+            for (_, checker, check_recorder), (checker_failures, count) in zip(
+                self.checkers, failures
+            ):
+                check_recorder.add_failed(filename, checker, checker_failures, count)
+            return any(count for _, count, _ in changes) or any(
+                count for _, count in failures
+            )
+
+        compact = functools.partial(
+            _compact_composite,
+            _changes_compactor(self._options),
+            _failures_compactor(self._options),
+        )
+        return _run_files(
+            work, filenames, self._options, self._printer, record, compact
+        )
+
+    def print_results(
+        self,
+        show_changes: bool,
+        ansi_colors: bool,
+        charwidths: t.Mapping[str, t.Callable[[str], int]] | None = None,
+    ) -> None:
+        """Print the changes and failures of each hook. `charwidths` maps the names
+        of fixers to the `charwidth` used to print their changes."""
+        for name, _, diff_recorder in self.fixers:
+            if diff_recorder:
+                diff_recorder.print_changes(
+                    show_changes,
+                    ansi_colors,
+                    hook_name=name,
+                    charwidth=(charwidths or {}).get(name),
+                )
+        for name, _, check_recorder in self.checkers:
+            if check_recorder:
+                check_recorder.print_failures(name, ansi_colors)
@@ -0,0 +1,244 @@
+#
+# instrumentation for `--timings`, `--trace-memory`, `--profile`, and
+# `--metrics-file`
+#
+# The work on each file is measured where it runs, which may be in a worker
+# process, and the measurements are returned along with its results. Reads and
+# writes are measured as they happen, by looking up the stats of the file being
+# worked on in the current thread, so that the functions which do them need no
+# extra arguments.
+#
+from __future__ import annotations
+
+import collections
+import contextlib
+import sys
+import threading
+import time
+import typing as t
+
+_R = t.TypeVar("_R")
+
+PHASES = ("discovery", "read", "process", "write", "report")
+
+
+class FileStats:
+    """
+    The measurements for a file: the wall and CPU time spent on it, and the number
+    of bytes read and written. The time spent reading (and decoding) and writing is
+    also recorded separately, as [wall, cpu] pairs.
+
+    If the hooks are measured, `lines_seen` counts the lines passed to them,
+    `lines` counts the lines each hook changed or failed, keyed by ("changed",
+    hook) or ("failed", hook), and `findings` counts the characters each hook
+    replaced or found, keyed by (hook, character).
+    """
+
+    __slots__ = (
+        "wall",
+        "cpu",
+        "read",
+        "write",
+        "bytes_read",
+        "bytes_written",
+        "lines_seen",
+        "lines",
+        "findings",
+    )
+
+    def __init__(self) -> None:
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.read = [0.0, 0.0]
+        self.write = [0.0, 0.0]
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.lines_seen = 0
+        self.lines: collections.Counter[tuple[str, str]] = collections.Counter()
+        self.findings: collections.Counter[tuple[str, str]] = collections.Counter()
+
+
+# the stats for the file being worked on in each thread, if it is being measured
+_local = threading.local()
+
+
+def current() -> FileStats | None:
+    """Get the stats for the file being worked on, if it is being measured."""
+    return t.cast("FileStats | None", getattr(_local, "stats", None))
+
+
+def timed(work: t.Callable[[str], _R], filename: str) -> tuple[_R, FileStats]:
+    """Apply `work` to a file, returning its result along with its stats."""
+    stats = _local.stats = FileStats()
+    # CPU time is counted for the current thread, as other threads may be working
+    # on other files at the same time
+    wall, cpu = time.perf_counter(), time.thread_time()
+    try:
+        result = work(filename)
+    finally:
+        _local.stats = None
+        stats.wall = time.perf_counter() - wall
+        stats.cpu = time.thread_time() - cpu
+    return result, stats
+
+
+@contextlib.contextmanager
+def io_phase(phase: t.Literal["read", "write"]) -> t.Iterator[None]:
+    """Time a read or a write of the file being worked on, if it is being
+    measured."""
+    stats = current()
+    if stats is None:
+        yield
+        return
+    wall, cpu = time.perf_counter(), time.thread_time()
+    try:
+        yield
+    finally:
+        totals = getattr(stats, phase)
+        totals[0] += time.perf_counter() - wall
+        totals[1] += time.thread_time() - cpu
+
+
+def add_bytes(read: int = 0, written: int = 0) -> None:
+    """Count bytes read or written for the file being worked on, if it is being
+    measured."""
+    stats = current()
+    if stats is not None:
+        stats.bytes_read += read
+        stats.bytes_written += written
+
+
+def _format_bytes(n: int) -> str:
+    if n < 1024 * 1024:
+        return f"{n / 1024:.1f}K"
+    return f"{n / (1024 * 1024):.1f}M"
+
+
+class Timings:
+    """
+    The wall and CPU time spent in each phase of a run, and on each file.
+
+    Reading, processing, and writing files may be done in worker processes, so
+    their times are summed over files, and may add up to more than the total.
+
+    :param trace_memory: Trace memory allocations, to report the peak.
+    :param report: Print a summary at the end of the run.
+    """
+
+    def __init__(self, trace_memory: bool = False, report: bool = True) -> None:
+        self.trace_memory = trace_memory
+        self.report = report
+        self.phases = {name: [0.0, 0.0] for name in PHASES}
+        self.files: list[tuple[str, FileStats]] = []
+        self.cached = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.peak_memory: int | None = None
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> t.Iterator[None]:
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            totals = self.phases[name]
+            totals[0] += time.perf_counter() - wall
+            totals[1] += time.thread_time() - cpu
+
+    def add_file(self, filename: str, stats: FileStats) -> None:
+        self.files.append((filename, stats))
+        process = self.phases["process"]
+        for name in ("read", "write"):
+            wall, cpu = getattr(stats, name)
+            self.phases[name][0] += wall
+            self.phases[name][1] += cpu
+            process[0] -= wall
+            process[1] -= cpu
+        process[0] += stats.wall
+        process[1] += stats.cpu
+
+    def print_summary(self, top: int = 10, file: t.TextIO | None = None) -> None:
+        file = file or sys.stderr
+        print("timings:", file=file)
+        print(f"  {'phase':<10} {'wall (s)':>9} {'cpu (s)':>9}", file=file)
+        for name, (wall, cpu) in self.phases.items():
+            print(f"  {name:<10} {wall:>9.3f} {cpu:>9.3f}", file=file)
+        print(f"  {'total':<10} {self.wall:>9.3f} {self.cpu:>9.3f}", file=file)
+        bytes_read = _format_bytes(sum(x.bytes_read for _, x in self.files))
+        bytes_written = _format_bytes(sum(x.bytes_written for _, x in self.files))
+        print(
+            f"  files: {len(self.files) + self.cached} ({self.cached} cached), "
+            f"read: {bytes_read}, written: {bytes_written}",
+            file=file,
+        )
+        if self.peak_memory is not None:
+            print(f"  peak memory: {_format_bytes(self.peak_memory)}", file=file)
+
+        slowest = sorted(self.files, key=lambda x: x[1].wall, reverse=True)[:top]
+        if not slowest:
+            return
+        print("slowest files:", file=file)
+        print(
+            f"  {'wall (s)':>9} {'cpu (s)':>9} {'read':>8} {'written':>8}  filename",
+            file=file,
+        )
+        for filename, x in slowest:
+            print(
+                f"  {x.wall:>9.3f} {x.cpu:>9.3f} {_format_bytes(x.bytes_read):>8} "
+                f"{_format_bytes(x.bytes_written):>8}  {filename}",
+                file=file,
+            )
+
+
+def phase(timings: Timings | None, name: str) -> t.ContextManager[None]:
+    """Time a phase of a run, if it is being timed."""
+    if timings is None:
+        return contextlib.nullcontext()
+    return timings.phase(name)
+
+
+@contextlib.contextmanager
+def instrument(
+    timings: Timings | None,
+    profile_path: str | None = None,
+    on_finish: t.Callable[[Timings], None] | None = None,
+) -> t.Iterator[None]:
+    """Instrument a run of a hook. The total time is added to `timings`, which are
+    printed to stderr at the end of the run if they are to be reported, and passed
+    to `on_finish`. A `cProfile` dump is written to `profile_path` if one is
+    given."""
+    # the profiler and tracemalloc are imported only when they are used, so that
+    # uninstrumented runs start quickly
+    profiler = None
+    if profile_path is not None:
+        import cProfile
+
+        profiler = cProfile.Profile()
+    tracing = timings is not None and timings.trace_memory
+    if tracing:
+        import tracemalloc
+
+        tracemalloc.start()
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profiler is not None:
+                profiler.disable()
+        if timings is not None:
+            timings.wall = time.perf_counter() - wall
+            timings.cpu = time.process_time() - cpu
+            if tracing:
+                timings.peak_memory = tracemalloc.get_traced_memory()[1]
+            if timings.report:
+                timings.print_summary()
+            if on_finish is not None:
+                on_finish(timings)
+    finally:
+        if tracing:
+            tracemalloc.stop()
+        if profiler is not None and profile_path is not None:
+            profiler.dump_stats(profile_path)
@@ -14,7 +14,7 @@ import sys
 import typing as t
 
 from ._common import parse_cli_args
-from ._recorders import DiffRecorder
+from ._recorders import DiffRecorder, RunOptions
 
 GITLAB_SECTION_TITLE_PATTERN = re.compile(r"\^?\[[^\]]+\]")
 GITLAB_SECTION_N_APPROVALS_PATTERN = re.compile(r"\[\d+\]")
@@ -25,7 +25,7 @@ def main(*, argv: list[str] | None = None) -> int:
         __doc__,
         fixer=True,
         argv=argv,
-        disable_args=["files"],
+        disable_args=["files", "--exclude", "--discovery", "--untracked"],
         modify_parser=_add_args,
     )
     filenames = args.files
@@ -34,18 +34,22 @@ def main(*, argv: list[str] | None = None) -> int:
 
     line_fixer = make_line_fixer(args.dialect)
 
-    recorder = DiffRecorder(args.verbosity)
-    missing_file = False
-    for fn in filenames:
-        try:
-            recorder.run_line_fixer(line_fixer, fn)
-        except FileNotFoundError:
-            missing_file = True
-    if recorder or missing_file:
-        if recorder:
-            recorder.print_changes(args.show_changes, args.color)
-        return 1
-    return 0
+    options = RunOptions.from_args(args)
+    with options.instrument():
+        recorder = DiffRecorder(
+            args.verbosity, options, hook_name="alphabetize-codeowners"
+        )
+        missing_file = False
+        for fn in filenames:
+            try:
+                recorder.run_line_fixer(line_fixer, fn)
+            except FileNotFoundError:
+                missing_file = True
+        if recorder or missing_file:
+            if recorder:
+                recorder.print_changes(args.show_changes, args.color)
+            return 1
+        return 0
 
 
 def _add_args(parser: argparse.ArgumentParser) -> None:
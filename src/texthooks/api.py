@@ -0,0 +1,236 @@
+"""
+Fix and check text in memory, without files or subprocesses.
+
+    >>> import texthooks
+    >>> texthooks.fix_text("“quoted”—text")
+    ('"quoted"--text', [Change(hook='fix-smartquotes', line=1, column=1, ...), ...])
+    >>> texthooks.check_text("x‮y")
+    [Finding(hook='forbid-bidi-controls', line=1, column=2, codepoint='U+202E')]
+
+The hooks are the character-level fixers and checkers which the `texthooks` hook
+runs, with their default codepoints. Each hook is built on first use, and reused
+by every later call.
+"""
+
+from __future__ import annotations
+
+import functools
+import typing as t
+
+from . import (
+    fix_ligatures,
+    fix_smartquotes,
+    fix_spaces,
+    fix_unicode_dashes,
+    forbid_bidi_controls,
+)
+from ._common import CharacterChecker, TranslationFixer, TriggerSet
+from ._metrics import codepoint
+from ._recorders import _iter_trigger_lines
+from .combined import CHECKER_NAMES, FIXER_NAMES
+
+__all__ = (
+    "FIXER_NAMES",
+    "CHECKER_NAMES",
+    "Change",
+    "Finding",
+    "fix_text",
+    "fix_texts",
+    "check_text",
+    "check_texts",
+)
+
+
+class Change(t.NamedTuple):
+    """A replacement made by a fixer. `column` is 1-based, and is a position in
+    the line as it was when the fixer was applied."""
+
+    hook: str
+    line: int
+    column: int
+    original: str
+    replacement: str
+
+
+class Finding(t.NamedTuple):
+    """A character found by a checker. `column` is 1-based."""
+
+    hook: str
+    line: int
+    column: int
+    codepoint: str
+
+
+_FIXER_FACTORIES: dict[str, t.Callable[[], t.Callable[[str], str]]] = {
+    "fix-smartquotes": lambda: fix_smartquotes.gen_line_fixer(
+        fix_smartquotes.DEFAULT_SINGLE_QUOTE_CODEPOINTS,
+        fix_smartquotes.DEFAULT_DOUBLE_QUOTE_CODEPOINTS,
+    ),
+    "fix-unicode-dashes": lambda: fix_unicode_dashes.gen_line_fixer(
+        fix_unicode_dashes.DEFAULT_SINGLE_HYPHEN_CODEPOINTS,
+        fix_unicode_dashes.DEFAULT_DOUBLE_HYPHEN_CODEPOINTS,
+    ),
+    "fix-spaces": lambda: fix_spaces.gen_line_fixer(
+        fix_spaces.DEFAULT_SEPARATOR_CODEPOINTS
+    ),
+    "fix-ligatures": lambda: fix_ligatures.LIGATURE_FIXER,
+}
+_CHECKERS: dict[str, CharacterChecker] = {
+    "forbid-bidi-controls": forbid_bidi_controls.BIDI_CHECKER,
+}
+
+
+def _hook_names(
+    hooks: t.Iterable[str] | None, known: tuple[str, ...], kind: str
+) -> tuple[str, ...]:
+    if hooks is None:
+        return known
+    if isinstance(hooks, str):
+        hooks = (hooks,)
+    names = tuple(hooks)
+    for name in names:
+        if name not in known:
+            raise ValueError(
+                f"Unknown {kind}: {name!r}. Choose from: {', '.join(known)}"
+            )
+    return names
+
+
+@functools.lru_cache(maxsize=None)
+def _build_fixer(name: str) -> TranslationFixer:
+    return t.cast(TranslationFixer, _FIXER_FACTORIES[name]())
+
+
+@functools.lru_cache(maxsize=None)
+def _fixers(
+    names: tuple[str, ...],
+) -> tuple[list[tuple[str, TranslationFixer]], TriggerSet]:
+    fixers = [(name, _build_fixer(name)) for name in names]
+    triggers = TriggerSet(())
+    for _, fixer in fixers:
+        triggers |= fixer.triggers
+    return fixers, triggers
+
+
+@functools.lru_cache(maxsize=None)
+def _checkers(
+    names: tuple[str, ...],
+) -> tuple[list[tuple[str, CharacterChecker]], TriggerSet]:
+    checkers = [(name, _CHECKERS[name]) for name in names]
+    triggers = TriggerSet(())
+    for _, checker in checkers:
+        triggers |= checker.triggers
+    return checkers, triggers
+
+
+def fix_text(
+    text: str, hooks: t.Iterable[str] | None = None
+) -> tuple[str, list[Change]]:
+    """
+    Apply fixers to text, returning the fixed text and the changes made.
+
+    :param text: The text to fix.
+    :param hooks: The names of the fixers to apply, in order. Defaults to all of
+        `FIXER_NAMES`.
+    :raises ValueError: If a hook is not one of `FIXER_NAMES`.
+    """
+    fixers, triggers = _fixers(_hook_names(hooks, FIXER_NAMES, "fixer"))
+    return _fix(fixers, triggers, text)
+
+
+def fix_texts(
+    items: t.Iterable[tuple[str, str]], hooks: t.Iterable[str] | None = None
+) -> t.Iterator[tuple[str, str, list[Change]]]:
+    """
+    Apply fixers to many texts, given as `(name, text)` pairs, yielding a
+    `(name, fixed_text, changes)` triple for each of them as it is fixed.
+
+    :param items: The names and texts to fix.
+    :param hooks: The names of the fixers to apply, as for `fix_text`.
+    """
+    fixers, triggers = _fixers(_hook_names(hooks, FIXER_NAMES, "fixer"))
+    for name, text in items:
+        yield (name, *_fix(fixers, triggers, text))
+
+
+def check_text(text: str, hooks: t.Iterable[str] | None = None) -> list[Finding]:
+    """
+    Check text, returning the characters found by the checkers.
+
+    :param text: The text to check.
+    :param hooks: The names of the checkers to run. Defaults to all of
+        `CHECKER_NAMES`.
+    :raises ValueError: If a hook is not one of `CHECKER_NAMES`.
+    """
+    checkers, triggers = _checkers(_hook_names(hooks, CHECKER_NAMES, "checker"))
+    return _check(checkers, triggers, text)
+
+
+def check_texts(
+    items: t.Iterable[tuple[str, str]], hooks: t.Iterable[str] | None = None
+) -> t.Iterator[tuple[str, list[Finding]]]:
+    """
+    Check many texts, given as `(name, text)` pairs, yielding a `(name, findings)`
+    pair for each of them as it is checked.
+
+    :param items: The names and texts to check.
+    :param hooks: The names of the checkers to run, as for `check_text`.
+    """
+    checkers, triggers = _checkers(_hook_names(hooks, CHECKER_NAMES, "checker"))
+    for name, text in items:
+        yield name, _check(checkers, triggers, text)
+
+
+def _fix(
+    fixers: list[tuple[str, TranslationFixer]], triggers: TriggerSet, text: str
+) -> tuple[str, list[Change]]:
+    if not triggers.search(text):
+        return text, []
+
+    # as when fixing files, only the lines which contain a trigger are fixed, and
+    # the rest of the text is copied through
+    changes = []
+    pieces: list[str] = []
+    copied_to = 0
+    for lineno, start, end in _iter_trigger_lines(text, triggers):
+        original = line = text[start:end]
+        for name, fixer in fixers:
+            newline = fixer(line)
+            if newline == line:
+                continue
+            for old_start, old_end, new_start, new_end in fixer.replacement_spans(line):
+                changes.append(
+                    Change(
+                        name,
+                        lineno,
+                        old_start + 1,
+                        line[old_start:old_end],
+                        newline[new_start:new_end],
+                    )
+                )
+            line = newline
+        if line != original:
+            pieces.extend((text[copied_to:start], line))
+            copied_to = end
+
+    if not pieces:
+        return text, changes
+    pieces.append(text[copied_to:])
+    return "".join(pieces), changes
+
+
+def _check(
+    checkers: list[tuple[str, CharacterChecker]], triggers: TriggerSet, text: str
+) -> list[Finding]:
+    if not triggers.search(text):
+        return []
+
+    findings = []
+    for lineno, start, end in _iter_trigger_lines(text, triggers):
+        line = text[start:end]
+        for name, checker in checkers:
+            for match in checker.pattern.finditer(line):
+                findings.append(
+                    Finding(name, lineno, match.start() + 1, codepoint(match.group()))
+                )
+    return findings
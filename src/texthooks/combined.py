@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+A combined fixer and checker script which runs the character-level texthooks
+over text files in a single pass.
+
+Each file is read once, all of the enabled fixers and checks are applied to it,
+and it is written at most once. Changes and failures are still reported per hook.
+
+The following hooks are run, in order:
+
+    fix-smartquotes
+    fix-unicode-dashes
+    fix-spaces
+    fix-ligatures
+    forbid-bidi-controls
+
+Use '--disable' to skip any of them. The codepoint options of the individual
+fixers are also accepted.
+"""
+
+import argparse
+import sys
+import typing as t
+
+from . import (
+    fix_ligatures,
+    fix_smartquotes,
+    fix_spaces,
+    fix_unicode_dashes,
+    forbid_bidi_controls,
+)
+from ._common import all_filenames, all_filenames_from_args, parse_cli_args
+from ._recorders import CompositeRecorder, RunOptions, display_width
+
+FIXER_NAMES = (
+    "fix-smartquotes",
+    "fix-unicode-dashes",
+    "fix-spaces",
+    "fix-ligatures",
+)
+CHECKER_NAMES = ("forbid-bidi-controls",)
+# the widths used to mark changed characters, for the hooks which print their
+# changes with a width of their own when run on their own
+CHARWIDTHS: dict[str, t.Callable[[str], int]] = {"fix-ligatures": display_width}
+
+
+def gen_fixers(args: t.Any) -> list[tuple[str, t.Callable[[str], str]]]:
+    fixers: list[tuple[str, t.Callable[[str], str]]] = []
+    if "fix-smartquotes" not in args.disable:
+        fixers.append(
+            (
+                "fix-smartquotes",
+                fix_smartquotes.gen_line_fixer(
+                    args.single_quote_codepoints, args.double_quote_codepoints
+                ),
+            )
+        )
+    if "fix-unicode-dashes" not in args.disable:
+        fixers.append(
+            (
+                "fix-unicode-dashes",
+                fix_unicode_dashes.gen_line_fixer(
+                    args.single_hyphen_codepoints, args.double_hyphen_codepoints
+                ),
+            )
+        )
+    if "fix-spaces" not in args.disable:
+        fixers.append(
+            (
+                "fix-spaces",
+                fix_spaces.gen_line_fixer(args.separator_codepoints),
+            )
+        )
+    if "fix-ligatures" not in args.disable:
+        fixers.append(("fix-ligatures", fix_ligatures.LIGATURE_FIXER))
+    return fixers
+
+
+def gen_checkers(args: t.Any) -> list[tuple[str, t.Callable[[str], bool]]]:
+    checkers: list[tuple[str, t.Callable[[str], bool]]] = []
+    if "forbid-bidi-controls" not in args.disable:
+        checkers.append(("forbid-bidi-controls", forbid_bidi_controls.BIDI_CHECKER))
+    return checkers
+
+
+def do_all(
+    files: t.Iterable[str] | None,
+    fixers: t.Sequence[tuple[str, t.Callable[[str], str]]],
+    checkers: t.Sequence[tuple[str, t.Callable[[str], bool]]],
+    verbosity: int,
+    options: RunOptions | None = None,
+) -> CompositeRecorder:
+    """Run all fixers and checkers over a set of filenames, and return a recorder
+    holding the changes and failures for each hook."""
+    recorder = CompositeRecorder(verbosity, fixers, checkers, options)
+    recorder.run_on_files(all_filenames(files))
+    return recorder
+
+
+def modify_cli_parser(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--disable",
+        action="append",
+        default=[],
+        choices=FIXER_NAMES + CHECKER_NAMES,
+        metavar="HOOK",
+        help=(
+            "Disable one of the hooks. May be given multiple times. "
+            f"choices: {','.join(FIXER_NAMES + CHECKER_NAMES)}"
+        ),
+    )
+    fix_smartquotes.modify_cli_parser(parser)
+    fix_unicode_dashes.modify_cli_parser(parser)
+    fix_spaces.modify_cli_parser(parser)
+
+
+def postprocess_cli_args(args: t.Any) -> t.Any:
+    if "fix-smartquotes" not in args.disable:
+        args = fix_smartquotes.postprocess_cli_args(args)
+    if "fix-unicode-dashes" not in args.disable:
+        args = fix_unicode_dashes.postprocess_cli_args(args)
+    if "fix-spaces" not in args.disable:
+        args = fix_spaces.postprocess_cli_args(args)
+    return args
+
+
+def parse_args(argv: list[str] | None) -> t.Any:
+    return parse_cli_args(
+        __doc__,
+        fixer=True,
+        argv=argv,
+        modify_parser=modify_cli_parser,
+        postprocess=postprocess_cli_args,
+    )
+
+
+def main(*, argv: list[str] | None = None) -> int:
+    args = parse_args(argv)
+    options = RunOptions.from_args(args)
+    with options.instrument():
+        results = do_all(
+            all_filenames_from_args(args),
+            gen_fixers(args),
+            gen_checkers(args),
+            args.verbosity,
+            options,
+        )
+        if results:
+            results.print_results(args.show_changes, args.color, CHARWIDTHS)
+            return 1
+        return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
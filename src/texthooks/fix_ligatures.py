@@ -14,8 +14,14 @@ import re
 import sys
 import typing as t
 
-from ._common import all_filenames, codepoint2char, parse_cli_args
-from ._recorders import DiffRecorder
+from ._common import (
+    TranslationFixer,
+    all_filenames,
+    all_filenames_from_args,
+    codepoint2char,
+    parse_cli_args,
+)
+from ._recorders import DiffRecorder, RunOptions, display_width
 
 # map unicode codepoints to non-ligature versions of those chars
 CODEPOINT_MAP = {
@@ -28,29 +34,29 @@ CODEPOINT_MAP = {
 CHAR_MAP = {  # remap in terms of chars
     codepoint2char(k): v for k, v in CODEPOINT_MAP.items()
 }
+LIGATURE_FIXER = TranslationFixer(CHAR_MAP)
+# no longer used by the fixer, but kept for callers of the previous API
 REPLACEMENT_PATTERN = re.compile("(" + "|".join(CHAR_MAP.keys()) + ")")
 
 
-def _re_subfunc(match: re.Match) -> str:
-    x = match.group(0)
-    return CHAR_MAP.get(x, x)
-
-
 def charwidth(c: str) -> int:
     return len(CHAR_MAP.get(c, c))
 
 
 def replace_ligatures_str(s: str) -> str:
-    return REPLACEMENT_PATTERN.sub(_re_subfunc, s)
+    return LIGATURE_FIXER(s)
 
 
-def do_all_replacements(files: t.Iterable[str] | None, verbosity: int) -> DiffRecorder:
+def do_all_replacements(
+    files: t.Iterable[str] | None,
+    verbosity: int,
+    options: RunOptions | None = None,
+) -> DiffRecorder:
     """Do replacements over a set of filenames, and return a list of filenames
     where changes were made."""
-    recorder = DiffRecorder(verbosity)
+    recorder = DiffRecorder(verbosity, options, hook_name="fix-ligatures")
 
-    for fn in all_filenames(files):
-        recorder.run_line_fixer(replace_ligatures_str, fn)
+    recorder.run_line_fixer_on_files(LIGATURE_FIXER, all_filenames(files))
     return recorder
 
 
@@ -60,11 +66,19 @@ def parse_args(argv: list[str] | None) -> t.Any:
 
 def main(*, argv: list[str] | None = None) -> int:
     args = parse_args(argv)
-    changes = do_all_replacements(all_filenames(args.files), args.verbosity)
-    if changes:
-        changes.print_changes(args.show_changes, args.color, charwidth=charwidth)
-        return 1
-    return 0
+    options = RunOptions.from_args(args)
+    with options.instrument():
+        changes = do_all_replacements(
+            all_filenames_from_args(args),
+            args.verbosity,
+            options,
+        )
+        if changes:
+            changes.print_changes(
+                args.show_changes, args.color, charwidth=display_width
+            )
+            return 1
+        return 0
 
 
 if __name__ == "__main__":
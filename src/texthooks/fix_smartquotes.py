@@ -26,11 +26,19 @@ import re
 import sys
 import typing as t
 
-from ._common import all_filenames, codepoints2chars, parse_cli_args
-from ._recorders import DiffRecorder
+from ._common import (
+    all_filenames,
+    all_filenames_from_args,
+    codepoints2chars,
+    codepoints2map,
+    parse_cli_args,
+    translation_fixer,
+)
+from ._recorders import DiffRecorder, RunOptions
 
 
 def codepoints2regex(codepoints: t.Sequence[str]) -> re.Pattern:
+    # no longer used by the fixer, but kept for callers of the previous API
     return re.compile("(" + "|".join(codepoints2chars(codepoints)) + ")")
 
 
@@ -66,32 +74,17 @@ DEFAULT_SINGLE_QUOTE_CODEPOINTS = (
 def gen_line_fixer(
     single_quote_codepoints: t.Sequence[str], double_quote_codepoints: t.Sequence[str]
 ) -> t.Callable[[str], str]:
-    single_quote_regex = (
-        codepoints2regex(single_quote_codepoints) if single_quote_codepoints else None
-    )
-    double_quote_regex = (
-        codepoints2regex(double_quote_codepoints) if double_quote_codepoints else None
-    )
-
-    if single_quote_regex and double_quote_regex:
-
-        def line_fixer(line: str) -> str:
-            return single_quote_regex.sub("'", double_quote_regex.sub('"', line))
-
-    elif single_quote_regex:
-
-        def line_fixer(line: str) -> str:
-            return single_quote_regex.sub("'", line)
-
-    elif double_quote_regex:
-
-        def line_fixer(line: str) -> str:
-            return double_quote_regex.sub("'", line)
-
-    else:
+    if not (single_quote_codepoints or double_quote_codepoints):
         raise NotImplementedError("Both replacement modes were disabled.")
 
-    return line_fixer
+    # double quotes are applied last, so they take precedence if a codepoint is
+    # given in both lists
+    return translation_fixer(
+        {
+            **codepoints2map(single_quote_codepoints, "'"),
+            **codepoints2map(double_quote_codepoints, '"'),
+        }
+    )
 
 
 def do_all_replacements(
@@ -99,13 +92,13 @@ def do_all_replacements(
     single_quote_codepoints: t.Sequence[str],
     double_quote_codepoints: t.Sequence[str],
     verbosity: int,
+    options: RunOptions | None = None,
 ) -> DiffRecorder:
     """Do replacements over a set of filenames, and return a list of filenames
     where changes were made."""
-    recorder = DiffRecorder(verbosity)
+    recorder = DiffRecorder(verbosity, options, hook_name="fix-smartquotes")
     line_fixer = gen_line_fixer(single_quote_codepoints, double_quote_codepoints)
-    for fn in all_filenames(files):
-        recorder.run_line_fixer(line_fixer, fn)
+    recorder.run_line_fixer_on_files(line_fixer, all_filenames(files))
     return recorder
 
 
@@ -169,17 +162,19 @@ def parse_args(argv: list[str] | None) -> t.Any:
 
 def main(*, argv: list[str] | None = None) -> int:
     args = parse_args(argv)
-
-    changes = do_all_replacements(
-        all_filenames(args.files),
-        args.single_quote_codepoints,
-        args.double_quote_codepoints,
-        args.verbosity,
-    )
-    if changes:
-        changes.print_changes(args.show_changes, args.color)
-        return 1
-    return 0
+    options = RunOptions.from_args(args)
+    with options.instrument():
+        changes = do_all_replacements(
+            all_filenames_from_args(args),
+            args.single_quote_codepoints,
+            args.double_quote_codepoints,
+            args.verbosity,
+            options,
+        )
+        if changes:
+            changes.print_changes(args.show_changes, args.color)
+            return 1
+        return 0
 
 
 if __name__ == "__main__":
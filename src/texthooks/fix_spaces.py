@@ -15,15 +15,24 @@ failed. This makes the script suitable as a pre-commit fixer.
 """
 
 import argparse
+import functools
 import re
 import sys
 import typing as t
 
-from ._common import all_filenames, codepoints2chars, parse_cli_args
-from ._recorders import DiffRecorder
+from ._common import (
+    all_filenames,
+    all_filenames_from_args,
+    codepoints2chars,
+    codepoints2map,
+    parse_cli_args,
+    translation_fixer,
+)
+from ._recorders import DiffRecorder, RunOptions
 
 
 def codepoints2regex(codepoints: t.Sequence[str]) -> re.Pattern:
+    # no longer used by the fixer, but kept for callers of the previous API
     return re.compile("(" + "|".join(codepoints2chars(codepoints)) + ")")
 
 
@@ -50,22 +59,26 @@ DEFAULT_SEPARATOR_CODEPOINTS = (
 )
 
 
-def gen_line_fixer(separator_regex: re.Pattern) -> t.Callable[[str], str]:
-    def line_fixer(line: str) -> str:
-        return separator_regex.sub(" ", line)
-
-    return line_fixer
+def gen_line_fixer(
+    separator_codepoints: t.Sequence[str] | re.Pattern,
+) -> t.Callable[[str], str]:
+    if isinstance(separator_codepoints, re.Pattern):
+        # a compiled pattern, as taken by the previous API
+        return functools.partial(separator_codepoints.sub, " ")
+    return translation_fixer(codepoints2map(separator_codepoints, " "))
 
 
 def do_all_replacements(
-    files: t.Iterable[str] | None, separator_regex: re.Pattern, verbosity: int
+    files: t.Iterable[str] | None,
+    separator_codepoints: t.Sequence[str] | re.Pattern,
+    verbosity: int,
+    options: RunOptions | None = None,
 ) -> DiffRecorder:
     """Do replacements over a set of filenames, and return a list of filenames
     where changes were made."""
-    recorder = DiffRecorder(verbosity)
-    line_fixer = gen_line_fixer(separator_regex)
-    for fn in all_filenames(files):
-        recorder.run_line_fixer(line_fixer, fn)
+    recorder = DiffRecorder(verbosity, options, hook_name="fix-spaces")
+    line_fixer = gen_line_fixer(separator_codepoints)
+    recorder.run_line_fixer_on_files(line_fixer, all_filenames(files))
     return recorder
 
 
@@ -102,16 +115,18 @@ def parse_args(argv: list[str] | None) -> t.Any:
 
 def main(*, argv: list[str] | None = None) -> int:
     args = parse_args(argv)
-
-    separator_regex = codepoints2regex(args.separator_codepoints)
-
-    changes = do_all_replacements(
-        all_filenames(args.files), separator_regex, verbosity=args.verbosity
-    )
-    if changes:
-        changes.print_changes(args.show_changes, args.color)
-        return 1
-    return 0
+    options = RunOptions.from_args(args)
+    with options.instrument():
+        changes = do_all_replacements(
+            all_filenames_from_args(args),
+            args.separator_codepoints,
+            verbosity=args.verbosity,
+            options=options,
+        )
+        if changes:
+            changes.print_changes(args.show_changes, args.color)
+            return 1
+        return 0
 
 
 if __name__ == "__main__":
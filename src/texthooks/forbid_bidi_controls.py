@@ -10,8 +10,14 @@ other sources
 import sys
 import typing as t
 
-from ._common import all_filenames, codepoint2char, parse_cli_args
-from ._recorders import CheckRecorder
+from ._common import (
+    CharacterChecker,
+    all_filenames,
+    all_filenames_from_args,
+    codepoint2char,
+    parse_cli_args,
+)
+from ._recorders import CheckRecorder, RunOptions
 
 # see: http://www.unicode.org/reports/tr9/#Directional_Formatting_Characters
 BIDI_CONTROL_CHARS = {
@@ -28,20 +34,21 @@ BIDI_CONTROL_CHARS = {
     codepoint2char("200F"),  # RLM
     codepoint2char("061C"),  # ALM
 }
+BIDI_CHECKER = CharacterChecker(BIDI_CONTROL_CHARS)
 
 
 def check_bidi_str(line: str) -> bool:
-    for c in line:
-        if c in BIDI_CONTROL_CHARS:
-            return False
-    return True
+    return BIDI_CHECKER(line)
 
 
-def do_all_checks(files: t.Iterable[str] | None, verbosity: int) -> CheckRecorder:
-    recorder = CheckRecorder(verbosity)
+def do_all_checks(
+    files: t.Iterable[str] | None,
+    verbosity: int,
+    options: RunOptions | None = None,
+) -> CheckRecorder:
+    recorder = CheckRecorder(verbosity, options, hook_name="forbid-bidi-controls")
 
-    for fn in all_filenames(files):
-        recorder.run_line_checker(check_bidi_str, fn)
+    recorder.run_line_checker_on_files(BIDI_CHECKER, all_filenames(files))
     return recorder
 
 
@@ -51,11 +58,17 @@ def parse_args(argv: list[str] | None) -> t.Any:
 
 def main(*, argv: list[str] | None = None) -> int:
     args = parse_args(argv)
-    findings = do_all_checks(all_filenames(args.files), args.verbosity)
-    if findings:
-        findings.print_failures("forbid-bidi-controls", args.color)
-        return 1
-    return 0
+    options = RunOptions.from_args(args)
+    with options.instrument():
+        findings = do_all_checks(
+            all_filenames_from_args(args),
+            args.verbosity,
+            options,
+        )
+        if findings:
+            findings.print_failures("forbid-bidi-controls", args.color)
+            return 1
+        return 0
 
 
 if __name__ == "__main__":
@@ -13,14 +13,34 @@ For example, if you want a macro of the form
 in markdown, then specify
 
    --macro 'issue:' '[texthooks#$VALUE](https://github.com/sirosen/texthooks/issues/$VALUE)'
+
+Many macros can be read from a file with `--macro-file`. Each line of the file is a
+prefix, then whitespace, then a format, which runs to the end of the line. Blank
+lines, and lines starting with '#', are ignored.
+
+All of the macros are expanded in a single scan of each line. Where more than one
+prefix matches at the same place, the longest is used, and the text of an expansion
+is not expanded again. If a prefix is given more than once, `--macro` arguments
+take precedence over macro files, and earlier macros over later ones.
+
+With `--whole-file`, the scan covers the whole content of each file instead, and a
+value may continue over a backslash at the end of a line, which is removed from it.
 """  # noqa: B950
 
 import argparse
+import functools
 import re
+import sys
 import typing as t
 
-from ._common import all_filenames, parse_cli_args
-from ._recorders import DiffRecorder
+from ._common import (
+    TriggerSet,
+    all_filenames,
+    all_filenames_from_args,
+    parse_cli_args,
+    trie_pattern,
+)
+from ._recorders import DiffRecorder, RunOptions
 
 
 def macroexpand(content: str, prefix: str, fmt: str) -> str:
@@ -29,29 +49,131 @@ def macroexpand(content: str, prefix: str, fmt: str) -> str:
     return re.sub(match_pattern, replace_pattern, content)
 
 
-def gen_line_fixer(macro_list: list[tuple[str, str]] | None) -> t.Callable[[str], str]:
-    def line_fixer(line: str) -> str:
-        if macro_list is None:
-            return line
+# a backslash at the end of a line
+_CONTINUATION = r"\\\r?\n"
+
+
+def _parse_format(fmt: str) -> list[str]:
+    # split a format into the text around each `$VALUE`. Formats are `re.sub`
+    # templates, so backslash escapes in them are interpreted
+    return [
+        re.sub("^", piece, "") if "\\" in piece else piece
+        for piece in fmt.split("$VALUE")
+    ]
+
+
+class MacroExpander:
+    """
+    A line fixer which expands a list of macros.
+
+    The macros are compiled into a single pattern, with the prefixes in a trie, and
+    a table mapping each prefix to its parsed format, so that each line is scanned
+    once, and the work done at each position depends on the length of the prefixes
+    rather than on how many there are. The prefixes are its `triggers`, so that
+    files without any of them are skipped.
+    """
+
+    def __init__(self, macro_list: t.Iterable[tuple[str, str]]) -> None:
+        # a repeated prefix keeps its first format
+        self.formats: dict[str, list[str]] = {}
+        for prefix, fmt in macro_list:
+            self.formats.setdefault(prefix, _parse_format(fmt))
+        # an empty prefix matches before every word, so no line can be skipped
+        if "" not in self.formats:
+            self.triggers = TriggerSet(self.formats)
+
+    @functools.cached_property
+    def pattern(self) -> re.Pattern[str]:
+        # as in `macroexpand`, a prefix starts the text or follows a non-word
+        # character, and its value runs to the end of the word which follows it
+        return re.compile(rf"(?<!\w)({trie_pattern(self.formats)})(\w+)")
+
+    @functools.cached_property
+    def content_pattern(self) -> re.Pattern[str]:
+        # in whole content, a value may continue over a backslash at the end of a
+        # line, onto the start of the next
+        return re.compile(
+            rf"(?<!\w)({trie_pattern(self.formats)})(\w+(?:{_CONTINUATION}\w+)*)"
+        )
+
+    def __getstate__(self) -> dict[str, t.Any]:
+        # as for TranslationFixer, the patterns are not pickled
+        return {
+            k: v
+            for k, v in self.__dict__.items()
+            if k not in ("pattern", "content_pattern")
+        }
+
+    def _expand(self, match: re.Match[str]) -> str:
+        prefix, value = match.groups()
+        return value.join(self.formats[prefix])
+
+    def __call__(self, line: str) -> str:
+        return self.pattern.sub(self._expand, line)
+
+    def replacements(self, content: str) -> list[tuple[int, int, str]]:
+        """Find the expansions in the whole content of a file, in one scan, as the
+        start and end offsets of each macro and its expansion. Line continuations
+        are removed from values which span them."""
+        return [
+            (
+                match.start(),
+                match.end(),
+                re.sub(_CONTINUATION, "", match.group(2)).join(
+                    self.formats[match.group(1)]
+                ),
+            )
+            for match in self.content_pattern.finditer(content)
+        ]
 
-        for macro in macro_list:
-            line = macroexpand(line, macro[0], macro[1])
-        return line
 
-    return line_fixer
+def gen_line_fixer(macro_list: list[tuple[str, str]] | None) -> t.Callable[[str], str]:
+    return MacroExpander(macro_list or ())
+
+
+def read_macro_file(path: str) -> list[tuple[str, str]]:
+    """Read the macros in a file, as (prefix, format) pairs."""
+    macros = []
+    try:
+        with open(path, encoding="utf-8") as f:
+            for lineno, line in enumerate(f, start=1):
+                line = line.rstrip("\r\n")
+                if not line.strip() or line.startswith("#"):
+                    continue
+                parts = line.split(None, 1)
+                if len(parts) != 2:
+                    print(
+                        f"{path}, line {lineno}: expected a prefix and a format, "
+                        f"separated by whitespace: {line!r}",
+                        file=sys.stderr,
+                    )
+                    raise SystemExit(2)
+                macros.append((parts[0], parts[1]))
+    except (OSError, UnicodeDecodeError) as e:
+        print(f"Could not read macro file {path}: {e}", file=sys.stderr)
+        raise SystemExit(2)
+    return macros
 
 
 def do_all_replacements(
     files: t.Iterable[str] | None,
     macro_list: list[tuple[str, str]] | None,
     verbosity: int,
+    options: RunOptions | None = None,
+    *,
+    whole_file: bool = False,
 ) -> DiffRecorder:
     """Do replacements over a set of filenames, and return a list of filenames
-    where changes were made."""
-    recorder = DiffRecorder(verbosity)
-    line_fixer = gen_line_fixer(macro_list)
-    for fn in all_filenames(files):
-        recorder.run_line_fixer(line_fixer, fn)
+    where changes were made.
+
+    With `whole_file`, the whole content of each file is expanded at once, rather
+    than each line."""
+    recorder = DiffRecorder(verbosity, options, hook_name="macro-expand")
+    expander = MacroExpander(macro_list or ())
+    if whole_file:
+        recorder.run_content_fixer_on_files(expander, all_filenames(files))
+    else:
+        recorder.run_line_fixer_on_files(expander, all_filenames(files))
     return recorder
 
 
@@ -59,6 +181,22 @@ def modify_cli_parser(parser: argparse.ArgumentParser) -> None:
     parser.add_argument(
         "--macro", nargs=2, action="append", metavar=("PREFIX", "FORMAT")
     )
+    parser.add_argument(
+        "--macro-file",
+        action="append",
+        metavar="FILE",
+        help="Read macros from FILE, one per line, as a prefix and a format",
+    )
+    parser.add_argument(
+        "--whole-file",
+        action="store_true",
+        default=False,
+        help=(
+            "Expand macros in the whole content of each file at once, rather than "
+            "line by line. Values may then continue over a backslash at the end of "
+            "a line"
+        ),
+    )
 
 
 def parse_args(argv: list[str] | None) -> t.Any:
@@ -72,11 +210,22 @@ def parse_args(argv: list[str] | None) -> t.Any:
 
 def main(*, argv: list[str] | None = None) -> int:
     args = parse_args(argv)
-    changes = do_all_replacements(all_filenames(args.files), args.macro, args.verbosity)
-    if changes:
-        changes.print_changes(args.show_changes, args.color)
-        return 1
-    return 0
+    macro_list = list(args.macro or ())
+    for path in args.macro_file or ():
+        macro_list.extend(read_macro_file(path))
+    options = RunOptions.from_args(args)
+    with options.instrument():
+        changes = do_all_replacements(
+            all_filenames_from_args(args),
+            macro_list,
+            args.verbosity,
+            options,
+            whole_file=args.whole_file,
+        )
+        if changes:
+            changes.print_changes(args.show_changes, args.color)
+            return 1
+        return 0
 
 
 if __name__ == "__main__":
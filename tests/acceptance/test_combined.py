@@ -0,0 +1,161 @@
+import json
+from textwrap import dedent as d
+
+from texthooks._common import strip_ansi
+from texthooks.combined import main as combined_main
+
+
+def test_combined_no_changes(runner):
+    result = runner(combined_main, "foo")
+    assert result.exit_code == 0
+    assert result.file_data == "foo"
+
+
+def test_combined_applies_all_fixers(runner):
+    result = runner(
+        combined_main,
+        """
+        “conﬁg” foo—bar
+        """,
+    )
+    assert result.exit_code == 1
+    assert result.file_data == d("""
+        "config" foo--bar
+        """)
+
+
+def test_combined_reports_changes_per_hook(runner):
+    result = runner(
+        combined_main,
+        """
+        don＇t
+        foo–bar
+        """,
+        add_args=["--show-changes", "--color=off"],
+    )
+    assert result.exit_code == 1
+    assert result.file_data == d("""
+        don't
+        foo-bar
+        """)
+    assert strip_ansi(result.stdout) == d(f"""\
+        Changes were made by fix-smartquotes in these files:
+          {result.filename}
+          line 2:
+            - don＇t
+                 ^
+            + don't
+                 ^
+        Changes were made by fix-unicode-dashes in these files:
+          {result.filename}
+          line 3:
+            - foo–bar
+                 ^
+            + foo-bar
+                 ^
+        """)
+
+
+def test_combined_marks_ligatures_as_fix_ligatures_does(runner):
+    result = runner(
+        combined_main,
+        "設定 conﬁg\n",
+        add_args=["--show-changes", "--color=off"],
+    )
+    assert result.exit_code == 1
+    assert strip_ansi(result.stdout) == d(f"""\
+        Changes were made by fix-ligatures in these files:
+          {result.filename}
+          line 1:
+            - 設定 conﬁg
+                      ^
+            + 設定 config
+                      ^^
+        """)
+
+
+def test_combined_runs_checks(runner):
+    result = runner(combined_main, "“x‏”\n")
+    assert result.exit_code == 1
+    assert result.file_data == '"x‏"\n'
+    assert strip_ansi(result.stdout) == d(f"""\
+        Changes were made by fix-smartquotes in these files:
+          {result.filename}
+        These files failed the forbid-bidi-controls check:
+          {result.filename}
+          lineno: 1
+        """)
+
+
+def test_combined_can_disable_hooks(runner):
+    result = runner(
+        combined_main,
+        "“foo—bar”\n",
+        add_args=["--disable", "fix-smartquotes"],
+    )
+    assert result.exit_code == 1
+    assert result.file_data == "“foo--bar”\n"
+
+    result = runner(
+        combined_main,
+        "“foo—bar”\n",
+        add_args=["--disable", "fix-smartquotes", "--disable", "fix-unicode-dashes"],
+    )
+    assert result.exit_code == 0
+    assert result.file_data == "“foo—bar”\n"
+
+
+def test_combined_accepts_fixer_codepoint_options(runner):
+    result = runner(
+        combined_main,
+        "foo—bar–baz\n",
+        add_args=[
+            "--single-hyphen-codepoints",
+            "2013",
+            "--double-hyphen-codepoints",
+            "",
+        ],
+    )
+    assert result.exit_code == 1
+    assert result.file_data == "foo—bar-baz\n"
+
+
+def test_combined_utf8_bytes(runner):
+    result = runner(
+        combined_main,
+        """
+        plain
+        “conﬁg” foo—bar
+        """,
+        add_args=["--utf8-bytes"],
+    )
+    assert result.exit_code == 1
+    assert result.file_data == d("""
+        plain
+        "config" foo--bar
+        """)
+
+
+def test_combined_ndjson(runner):
+    result = runner(combined_main, "ok\n“a” b\u200f\n", add_args=["--format", "ndjson"])
+    assert result.exit_code == 1
+    assert result.file_data == 'ok\n"a" b\u200f\n'
+    events = [json.loads(line) for line in result.stdout.splitlines()]
+    assert [(e["event"], e["hook"]) for e in events] == [
+        ("change", "fix-smartquotes"),
+        ("change", "fix-smartquotes"),
+        ("file", "fix-smartquotes"),
+        ("failure", "forbid-bidi-controls"),
+        ("file", "forbid-bidi-controls"),
+    ]
+    assert events[0] == {
+        "event": "change",
+        "hook": "fix-smartquotes",
+        "path": result.filename,
+        "line": 2,
+        "column": 1,
+        "original": "“",
+        "codepoint": "U+201C",
+        "replacement": '"',
+    }
+    assert events[3]["column"] == 6
@@ -58,3 +58,21 @@ def test_fix_ligature_showchanges_nocolor(runner):
             + config config
                  ^^     ^^
         """)
+
+
+def test_fix_ligature_showchanges_aligns_after_wide_characters(runner):
+    result = runner(
+        fix_ligatures_main,
+        "設定 conﬁg\n",
+        add_args=["--show-changes", "--color=off"],
+    )
+    assert result.exit_code == 1
+    assert result.stdout == d(f"""\
+        Changes were made in these files:
+          {result.filename}
+          line 1:
+            - 設定 conﬁg
+                      ^
+            + 設定 config
+                      ^^
+        """)
@@ -94,3 +94,54 @@ def test_fix_smartquotes_can_have_a_rule_disabled(runner):
         add_args=["--double-quote-codepoints", ""],
     )
     assert result.exit_code == 0
+
+
+def test_fix_smartquotes_double_quotes_only(runner):
+    result = runner(
+        fix_smartquotes_main,
+        """
+        “some data” don＇t
+        """,
+        add_args=["--single-quote-codepoints", ""],
+    )
+    assert result.exit_code == 1
+    assert result.file_data == d("""
+        "some data" don＇t
+        """)
+
+
+def test_fix_smartquotes_utf8_bytes_showchanges(runner):
+    result = runner(
+        fix_smartquotes_main,
+        """
+        foo
+        “some data”
+        """,
+        add_args=["--utf8-bytes", "--show-changes", "--color=off"],
+    )
+    assert result.exit_code == 1
+    assert result.file_data == d("""
+        foo
+        "some data"
+        """)
+    assert result.stdout == d(f"""\
+        Changes were made in these files:
+          {result.filename}
+          line 3:
+            - “some data”
+              ^         ^
+            + "some data"
+              ^         ^
+        """)
+
+
+def test_fix_smartquotes_caches_clean_files(runner, tmp_path):
+    result = runner(fix_smartquotes_main, "foo\n")
+    assert result.exit_code == 0
+    assert (tmp_path / ".cache" / "texthooks").is_dir()
+
+
+def test_fix_smartquotes_no_cache(runner, tmp_path):
+    result = runner(fix_smartquotes_main, "foo\n", add_args=["--no-cache"])
+    assert result.exit_code == 0
+    assert not (tmp_path / ".cache").exists()
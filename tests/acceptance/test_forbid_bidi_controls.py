@@ -1,3 +1,4 @@
+import json
 from textwrap import dedent as d
 
 from texthooks._common import strip_ansi
@@ -38,3 +39,81 @@ def test_forbid_bidi_controls_multiline(runner):
           {result.filename}
           line numbers: 2,3
         """)
+
+
+def test_forbid_bidi_controls_utf8_bytes(runner):
+    result = runner(
+        forbid_bidi_controls_main,
+        """
+        ok
+        s = "x‏" * 100
+        ok
+        s = "x‏" * 100
+        """,
+        add_args=["--utf8-bytes"],
+    )
+    assert result.exit_code == 1
+    assert strip_ansi(result.stdout) == d(f"""\
+        These files failed the forbid-bidi-controls check:
+          {result.filename}
+          line numbers: 3,5
+        """)
+
+
+def test_forbid_bidi_controls_collapses_runs_of_lines(runner):
+    result = runner(
+        forbid_bidi_controls_main,
+        "x‏\n" * 4 + "ok\n" + "x‏\n",
+    )
+    assert result.exit_code == 1
+    assert strip_ansi(result.stdout) == d(f"""\
+        These files failed the forbid-bidi-controls check:
+          {result.filename}
+          line numbers: 1-4,6
+        """)
+
+
+def test_forbid_bidi_controls_timings(runner, tmp_path):
+    profile = tmp_path / "profile.out"
+    result = runner(
+        forbid_bidi_controls_main,
+        "clean\n",
+        add_args=["--timings", "--trace-memory", "--profile", str(profile)],
+    )
+    assert result.exit_code == 0
+    assert result.stdout == ""
+    assert "discovery" in result.stderr
+    assert "peak memory:" in result.stderr
+    assert "file.txt" in result.stderr
+    assert profile.exists()
+
+
+def test_forbid_bidi_controls_ndjson(runner):
+    result = runner(
+        forbid_bidi_controls_main,
+        "ok\nx\u200fy\u202e\n",
+        add_args=["--format", "ndjson", "-vv"],
+    )
+    assert result.exit_code == 1
+    events = [json.loads(line) for line in result.stdout.splitlines()]
+    hook = "forbid-bidi-controls"
+    path = result.filename
+    assert events == [
+        {
+            "event": "failure",
+            "hook": hook,
+            "path": path,
+            "line": 2,
+            "column": 2,
+            "codepoint": "U+200F",
+        },
+        {
+            "event": "failure",
+            "hook": hook,
+            "path": path,
+            "line": 2,
+            "column": 4,
+            "codepoint": "U+202E",
+        },
+        {"event": "file", "hook": hook, "path": path, "result": "failed", "lines": 1},
+    ]
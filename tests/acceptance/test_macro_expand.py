@@ -1,3 +1,7 @@
+import json
+
+import pytest
+
 from texthooks.macro_expand import main as macro_expand_main
 
 
@@ -19,3 +23,70 @@ def test_macro_expand_value_appears_twice(runner):
     )
     assert result.exit_code == 1
     assert result.file_data == "l(bar) - bar"
+
+
+def test_macro_expand_ndjson(runner):
+    result = runner(
+        macro_expand_main,
+        "see f:bar\n",
+        add_args=["--macro", "f:", "f($VALUE)", "--format", "ndjson"],
+    )
+    assert result.exit_code == 1
+    events = [json.loads(line) for line in result.stdout.splitlines()]
+    # macro-expand does not report its replacements, so the changed section of the
+    # line is reported instead
+    assert events[0] == {
+        "event": "change",
+        "hook": "macro-expand",
+        "path": result.filename,
+        "line": 1,
+        "column": 6,
+        "original": ":bar",
+        "codepoint": None,
+        "replacement": "(bar)",
+    }
+    assert events[1]["event"] == "file"
+
+
+def test_macro_expand_macro_file(runner, tmp_path):
+    macro_file = tmp_path / "macros.txt"
+    macro_file.write_text(
+        "# project keys\n"
+        "\n"
+        "ABC-  [ABC-$VALUE](https://tracker.example.com/ABC-$VALUE)\n"
+        "f:    file: $VALUE\n"
+    )
+    result = runner(
+        macro_expand_main,
+        "ABC-12 and f:x and g:y",
+        add_args=["--macro", "f:", "f($VALUE)", "--macro-file", str(macro_file)],
+    )
+    assert result.exit_code == 1
+    # --macro arguments take precedence over macro files
+    assert result.file_data == (
+        "[ABC-12](https://tracker.example.com/ABC-12) and f(x) and g:y"
+    )
+
+
+def test_macro_expand_invalid_macro_file(runner, tmp_path):
+    macro_file = tmp_path / "macros.txt"
+    macro_file.write_text("ABC- [ABC-$VALUE]\nno-format\n")
+    with pytest.raises(SystemExit) as excinfo:
+        runner(macro_expand_main, "ABC-1", add_args=["--macro-file", str(macro_file)])
+    assert excinfo.value.code == 2
+
+
+def test_macro_expand_whole_file(runner):
+    result = runner(
+        macro_expand_main,
+        """\
+        see issue:1 issue:2,
+        and issue:12\\
+        34 across lines
+        """,
+        add_args=["--macro", "issue:", "#$VALUE", "--whole-file", "--show-changes"],
+    )
+    assert result.exit_code == 1
+    assert result.file_data == "see #1 #2,\nand #1234 across lines\n"
+    assert "line 1:" in result.stdout
+    assert "lines 2-3:" in result.stdout
@@ -0,0 +1,65 @@
+import pytest
+
+import texthooks
+from texthooks import api
+
+
+def test_fix_text_applies_fixers_in_order():
+    text, changes = texthooks.fix_text("“quoted”—text\nok\nﬁne\n")
+    assert text == '"quoted"--text\nok\nfine\n'
+    assert changes == [
+        texthooks.Change("fix-smartquotes", 1, 1, "“", '"'),
+        texthooks.Change("fix-smartquotes", 1, 8, "”", '"'),
+        texthooks.Change("fix-unicode-dashes", 1, 9, "—", "--"),
+        texthooks.Change("fix-ligatures", 3, 1, "ﬁ", "fi"),
+    ]
+
+
+def test_fix_text_with_selected_hooks():
+    text, changes = texthooks.fix_text("“a”—b", hooks=["fix-unicode-dashes"])
+    assert text == "“a”--b"
+    assert [change.hook for change in changes] == ["fix-unicode-dashes"]
+
+
+def test_fix_text_without_changes_returns_the_same_text():
+    text = "nothing to do\n" * 10
+    assert texthooks.fix_text(text) == (text, [])
+
+
+def test_check_text():
+    assert texthooks.check_text("ok\nx‏y‮\n") == [
+        texthooks.Finding("forbid-bidi-controls", 2, 2, "U+200F"),
+        texthooks.Finding("forbid-bidi-controls", 2, 4, "U+202E"),
+    ]
+    assert texthooks.check_text("ok\n") == []
+
+
+def test_batch_forms_yield_results_by_name():
+    items = iter([("a", "‘x’"), ("b", "plain")])
+    results = list(texthooks.fix_texts(items, hooks=["fix-smartquotes"]))
+    assert [(name, text) for name, text, _ in results] == [("a", "'x'"), ("b", "plain")]
+    assert results[1][2] == []
+
+    findings = dict(texthooks.check_texts([("a", "ok"), ("b", "‮")]))
+    assert findings["a"] == []
+    assert [f.codepoint for f in findings["b"]] == ["U+202E"]
+
+
+def test_fixers_are_built_once():
+    texthooks.fix_text("“a”")
+    builds = api._build_fixer.cache_info().misses
+    texthooks.fix_text("“b”")
+    list(texthooks.fix_texts([("c", "“c”")]))
+    assert api._build_fixer.cache_info().misses == builds
+
+
+@pytest.mark.parametrize(
+    "func, hook",
+    [
+        (texthooks.fix_text, "forbid-bidi-controls"),
+        (texthooks.check_text, "fix-smartquotes"),
+    ],
+)
+def test_unknown_hooks_are_rejected(func, hook):
+    with pytest.raises(ValueError, match="Unknown"):
+        func("text", hooks=[hook])
@@ -0,0 +1,201 @@
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+from texthooks import fix_smartquotes
+from texthooks._cache import _git_index_blob_ids, git_blob_id, package_fingerprint
+from texthooks._recorders import CheckRecorder, DiffRecorder, RunOptions
+
+SMARTQUOTES = fix_smartquotes.gen_line_fixer(
+    fix_smartquotes.DEFAULT_SINGLE_QUOTE_CODEPOINTS,
+    fix_smartquotes.DEFAULT_DOUBLE_QUOTE_CODEPOINTS,
+)
+
+
+def _age(path, seconds=60):
+    # move the mtime into the past, so that the file is not considered to have been
+    # modified too recently to be cached by path
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns - seconds * 10**9))
+
+
+def _forbid_reads(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("file was read")
+
+    monkeypatch.setattr("texthooks._recorders._read", fail)
+    monkeypatch.setattr("texthooks._recorders._read_bytes", fail)
+
+
+def test_git_blob_id_matches_git():
+    # the well-known id of the empty blob, and of "hello\n"
+    assert git_blob_id(b"") == "e69de29bb2d1d6434b8b29ae775ad8c2e48c5391"
+    assert git_blob_id(b"hello\n") == "ce013625030ba8dba906f756967f9e9ca394464a"
+
+
+def test_clean_files_are_skipped_on_later_runs(tmp_path, monkeypatch):
+    path = tmp_path / "file.txt"
+    path.write_text("clean\n")
+    _age(path)
+    options = RunOptions(cache_dir=str(tmp_path / "cache"))
+
+    assert DiffRecorder(0, options).run_line_fixer(SMARTQUOTES, str(path)) is False
+    assert (tmp_path / "cache" / ".gitignore").exists()
+
+    with monkeypatch.context() as m:
+        _forbid_reads(m)
+        assert DiffRecorder(0, options).run_line_fixer(SMARTQUOTES, str(path)) is False
+
+    # a modified file is checked again
+    path.write_text("“lean\n")
+    recorder = DiffRecorder(0, options)
+    assert recorder.run_line_fixer(SMARTQUOTES, str(path)) is True
+    assert path.read_text() == '"lean\n'
+
+
+def test_cache_is_per_configuration(tmp_path):
+    path = tmp_path / "file.txt"
+    path.write_text("don’t\n")
+    _age(path)
+    options = RunOptions(cache_dir=str(tmp_path / "cache"))
+
+    # clean for a fixer which only handles double quotes...
+    double_only = fix_smartquotes.gen_line_fixer([], ["201C"])
+    assert DiffRecorder(0, options).run_line_fixer(double_only, str(path)) is False
+    # ...but not for one which handles single quotes
+    assert DiffRecorder(0, options).run_line_fixer(SMARTQUOTES, str(path)) is True
+    assert path.read_text() == "don't\n"
+
+
+def test_changed_and_failing_files_are_not_cached(tmp_path, monkeypatch):
+    path = tmp_path / "file.txt"
+    path.write_text("“x”\n")
+    _age(path)
+    options = RunOptions(cache_dir=str(tmp_path / "cache"))
+
+    def checker(line):
+        return "x" not in line
+
+    assert CheckRecorder(0, options).run_line_checker(checker, str(path)) is True
+    assert CheckRecorder(0, options).run_line_checker(checker, str(path)) is True
+
+    assert DiffRecorder(0, options).run_line_fixer(SMARTQUOTES, str(path)) is True
+    # the rewritten file is fixed, and found clean, on the next run
+    assert DiffRecorder(0, options).run_line_fixer(SMARTQUOTES, str(path)) is False
+
+
+@pytest.mark.skipif(shutil.which("git") is None, reason="requires git")
+def test_cache_hits_by_git_blob_id_in_a_fresh_checkout(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    subprocess.run(["git", "init", "-q"], check=True)
+    with open("file.txt", "w") as f:
+        f.write("clean\n")
+    subprocess.run(["git", "add", "file.txt"], check=True)
+    options = RunOptions(cache_dir="cache")
+
+    assert DiffRecorder(0, options).run_line_fixer(SMARTQUOTES, "file.txt") is False
+
+    # rewriting the same content gives new stat info, as a fresh checkout would
+    os.remove("file.txt")
+    with open("file.txt", "w") as f:
+        f.write("clean\n")
+    with monkeypatch.context() as m:
+        _forbid_reads(m)
+        assert DiffRecorder(0, options).run_line_fixer(SMARTQUOTES, "file.txt") is False
+
+
+@pytest.mark.skipif(shutil.which("git") is None, reason="requires git")
+def test_index_lookup_skips_files_which_git_converts(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    subprocess.run(["git", "init", "-q"], check=True)
+    with open(".gitattributes", "w") as f:
+        f.write("crlf.txt text eol=crlf\nfiltered.txt filter=strip\nbinary.txt -text\n")
+    for name in ("plain.txt", "crlf.txt", "filtered.txt", "binary.txt"):
+        with open(name, "w") as f:
+            f.write("content\n")
+    subprocess.run(["git", "add", "."], check=True)
+    paths = ["plain.txt", "crlf.txt", "filtered.txt", "binary.txt"]
+
+    # the index holds what these files are stored as, not what is in the work tree
+    assert set(_git_index_blob_ids(paths)) == {"plain.txt", "binary.txt"}
+    subprocess.run(["git", "config", "core.autocrlf", "true"], check=True)
+    assert _git_index_blob_ids(paths) == {}
+
+
+def test_cache_key_is_stable_across_processes():
+    code = (
+        "from texthooks._cache import config_key;"
+        "from texthooks.fix_smartquotes import *;"
+        "print(config_key(gen_line_fixer("
+        "DEFAULT_SINGLE_QUOTE_CODEPOINTS, DEFAULT_DOUBLE_QUOTE_CODEPOINTS)))"
+    )
+    keys = {
+        subprocess.run(
+            [sys.executable, "-c", code],
+            env={**os.environ, "PYTHONHASHSEED": str(seed)},
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout
+        for seed in (1, 2, 3)
+    }
+    assert len(keys) == 1
+
+
+def test_files_are_read_once_when_cached(tmp_path, monkeypatch):
+    path = tmp_path / "file.txt"
+    path.write_text("clean\n")
+    _age(path)
+    options = RunOptions(cache_dir=str(tmp_path / "cache"))
+
+    opened = []
+    real_open = open
+
+    def counting_open(file, *args, **kwargs):
+        if file == str(path):
+            opened.append(file)
+        return real_open(file, *args, **kwargs)
+
+    monkeypatch.setattr("builtins.open", counting_open)
+    assert DiffRecorder(0, options).run_line_fixer(SMARTQUOTES, str(path)) is False
+    assert len(opened) == 1
+
+    with monkeypatch.context() as m:
+        _forbid_reads(m)
+        assert DiffRecorder(0, options).run_line_fixer(SMARTQUOTES, str(path)) is False
+
+
+def test_streamed_files_are_not_cached(tmp_path):
+    path = tmp_path / "file.txt"
+    path.write_text("clean\n" * 10)
+    _age(path)
+    options = RunOptions(cache_dir=str(tmp_path / "cache"), stream_threshold=1)
+
+    assert DiffRecorder(0, options).run_line_fixer(SMARTQUOTES, str(path)) is False
+    assert not (tmp_path / "cache").exists()
+
+
+def test_package_fingerprint_reads_the_source_only_when_it_changes(monkeypatch):
+    fingerprint = package_fingerprint()
+
+    def fail(*args, **kwargs):
+        raise AssertionError("source was read")
+
+    with monkeypatch.context() as m:
+        m.setattr("builtins.open", fail)
+        assert package_fingerprint() == fingerprint
+
+
+def test_index_lookup_is_limited_to_the_given_paths(monkeypatch):
+    calls = []
+    monkeypatch.setattr(
+        "texthooks._cache._git_lines", lambda *args, **kwargs: calls.append(args) or []
+    )
+    _git_index_blob_ids(["a.txt", "-b.txt"])
+    assert calls == [
+        ("ls-files", "-z", "-m", "--", "a.txt", "-b.txt"),
+        ("ls-files", "-z", "-s", "--", "a.txt", "-b.txt"),
+    ]
@@ -0,0 +1,192 @@
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+
+import pytest
+
+from texthooks import _daemon
+
+BIDI_CONTENT = "ok\nx‮y\n"
+
+
+@pytest.fixture
+def socket_path(monkeypatch):
+    # socket paths are limited to around 100 bytes, which pytest's temp directories
+    # may exceed
+    directory = tempfile.mkdtemp(prefix="th-")
+    path = os.path.join(directory, "daemon.sock")
+    monkeypatch.setenv("TEXTHOOKS_SOCKET", path)
+    monkeypatch.delenv("TEXTHOOKS_NO_DAEMON", raising=False)
+    yield path
+    shutil.rmtree(directory)
+
+
+@pytest.fixture
+def daemon(socket_path):
+    daemon = _daemon.Daemon(socket_path)
+    thread = threading.Thread(target=daemon.serve, daemon=True)
+    thread.start()
+    for _ in range(100):
+        if daemon.running and os.path.exists(socket_path):
+            break
+        time.sleep(0.01)
+    yield daemon
+    if daemon.running:
+        assert _daemon.daemon_main(argv=["stop"]) == 0
+    thread.join(timeout=5)
+    assert not thread.is_alive()
+    assert not os.path.exists(socket_path)
+
+
+def test_hooks_run_in_the_daemon(daemon, tmp_path, capsys):
+    path = tmp_path / "file.txt"
+    path.write_text(BIDI_CONTENT, encoding="utf-8")
+
+    assert _daemon.run_hook("forbid-bidi-controls", ["--color", "off", str(path)]) == 1
+    assert daemon.served == 1
+    assert capsys.readouterr().out == (
+        "These files failed the forbid-bidi-controls check:\n"
+        f"  {path}\n"
+        "  lineno: 2\n"
+    )
+
+
+def test_daemon_runs_hooks_in_the_client_directory(daemon, socket_path, tmp_path):
+    (tmp_path / "file.txt").write_text(BIDI_CONTENT, encoding="utf-8")
+    cwd = os.getcwd()
+    request = {
+        "hook": "forbid-bidi-controls",
+        "argv": ["file.txt"],
+        "cwd": str(tmp_path),
+        "env": dict(os.environ),
+    }
+
+    output = []
+    sent, response = _daemon._request(socket_path, request, output.append)
+    assert sent
+    assert response["exit_code"] == 1
+    assert "file.txt" in "".join(output)
+    assert os.getcwd() == cwd
+
+
+def test_daemon_reports_usage_errors(daemon, capsys):
+    assert _daemon.run_hook("fix-smartquotes", ["--no-such-option"]) == 2
+    assert daemon.served == 1
+    assert "unrecognized arguments" in capsys.readouterr().err
+
+
+def test_hooks_run_in_process_without_a_daemon(socket_path, tmp_path, capsys):
+    path = tmp_path / "file.txt"
+    path.write_text(BIDI_CONTENT, encoding="utf-8")
+    assert _daemon.forward("forbid-bidi-controls", [str(path)]) is None
+    assert _daemon.run_hook("forbid-bidi-controls", [str(path)]) == 1
+    assert "lineno: 2" in capsys.readouterr().out
+
+
+def test_daemon_declines_runs_after_the_package_changes(daemon, tmp_path):
+    daemon.fingerprint = "an older version"
+    path = tmp_path / "file.txt"
+    path.write_text(BIDI_CONTENT, encoding="utf-8")
+    assert _daemon.forward("forbid-bidi-controls", [str(path)]) is None
+    for _ in range(100):
+        if not daemon.running:
+            break
+        time.sleep(0.01)
+    assert daemon.reload
+    assert daemon.served == 0
+
+
+def test_daemon_status(daemon, capsys):
+    assert _daemon.daemon_main(argv=["status"]) == 0
+    assert f"pid: {os.getpid()}" in capsys.readouterr().out
+    assert _daemon.daemon_main(argv=["start"]) == 1
+    assert "already running" in capsys.readouterr().err
+
+
+def test_daemon_runs_hooks_in_the_client_environment(daemon, socket_path, tmp_path):
+    (tmp_path / "file.txt").write_text(BIDI_CONTENT, encoding="utf-8")
+    request = {
+        "hook": "forbid-bidi-controls",
+        "argv": ["file.txt"],
+        "cwd": str(tmp_path),
+        "env": {**os.environ, "GIT_DIR": "elsewhere"},
+    }
+    assert _daemon._request(socket_path, request)[1]["exit_code"] == 1
+    assert "GIT_DIR" not in os.environ
+
+    # runs with other locale settings are left to the client
+    request["env"] = {**os.environ, "LC_ALL": "C", "PYTHONUTF8": "0"}
+    assert _daemon._request(socket_path, request)[1]["exit_code"] is None
+    del request["env"]
+    assert _daemon._request(socket_path, request)[1]["exit_code"] is None
+    assert daemon.served == 1
+
+
+def test_hooks_do_not_trust_a_socket_in_a_shared_directory(daemon, socket_path):
+    os.chmod(os.path.dirname(socket_path), 0o777)
+    assert _daemon.forward("forbid-bidi-controls", []) is None
+    assert _daemon.daemon_main(argv=["status"]) == 1
+    os.chmod(os.path.dirname(socket_path), 0o700)
+    assert daemon.served == 0
+
+
+def test_hooks_fail_when_the_daemon_stops_answering(socket_path, monkeypatch, capsys):
+    monkeypatch.setattr(_daemon, "_RESPONSE_TIMEOUT", 0.1)
+    # a socket which accepts connections, but never answers them; the run is not
+    # repeated in-process, as the daemon may still be working on the files
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+        server.bind(socket_path)
+        server.listen()
+        assert _daemon.forward("forbid-bidi-controls", []) == 1
+    assert "stopped answering" in capsys.readouterr().err
+
+
+@pytest.mark.parametrize(
+    "request_",
+    (
+        [],
+        {"hook": ["texthooks"]},
+        {"hook": "texthooks"},
+        {"hook": "texthooks", "argv": "x", "cwd": "/", "env": {}},
+        {"hook": "texthooks", "argv": [], "cwd": None, "env": {}},
+        {"hook": "texthooks", "argv": [], "cwd": "/no/such/dir", "env": {}},
+        {"hook": "texthooks", "argv": [], "cwd": "/\0", "env": {}},
+        {"hook": "texthooks", "argv": [], "cwd": "/", "env": {"A": 1}},
+    ),
+)
+def test_daemon_declines_malformed_requests(daemon, socket_path, request_):
+    if isinstance(request_, dict) and isinstance(request_.get("env"), dict):
+        request_["env"] = {**os.environ, **request_["env"]}
+    assert _daemon._request(socket_path, request_) == (True, {"exit_code": None})
+    assert daemon.running
+    assert daemon.served == 0
+
+
+def test_daemon_streams_output(daemon, socket_path, tmp_path):
+    for name in ("a.txt", "b.txt"):
+        (tmp_path / name).write_text(BIDI_CONTENT, encoding="utf-8")
+    request = {
+        "hook": "forbid-bidi-controls",
+        "argv": ["--format", "ndjson", "a.txt", "b.txt"],
+        "cwd": str(tmp_path),
+        "env": dict(os.environ),
+    }
+    output = []
+    sent, response = _daemon._request(socket_path, request, output.append)
+    assert response["exit_code"] == 1
+    # each event is sent as it is written
+    assert len(output) == 4
+    assert all(chunk.startswith('{"event": ') for chunk in output)
+
+
+def test_daemon_output_with_undecodable_bytes(daemon, tmp_path, capsys):
+    path = tmp_path / "file.txt"
+    path.write_bytes(b"\xe2\x80\x9cquoted\xe2\x80\x9d \xff\n")
+    argv = ["--utf8-bytes", "--show-changes", "--color", "off", str(path)]
+    assert _daemon.run_hook("fix-smartquotes", argv) == 1
+    assert daemon.served == 1
+    # the captured stdout cannot write the byte, so it is shown escaped
+    assert '+ "quoted" \\udcff' in capsys.readouterr().out
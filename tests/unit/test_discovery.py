@@ -0,0 +1,126 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from texthooks._common import all_filenames
+from texthooks._discovery import walk_text_files
+
+
+@pytest.fixture
+def tree(tmp_path):
+    files = {
+        "a.txt": b"text\n",
+        "src/b.py": b"print('b')\n",
+        "src/deep/c.md": b"# c\n",
+        "noext": b"plain text\n",
+        "data.bin": b"\x00\x01\x02",
+        "image.png": b"not really a png\n",
+        ".hidden.txt": b"hidden\n",
+        ".git/config": b"[core]\n",
+        ".tox/py/lib.py": b"x\n",
+        "node_modules/pkg/index.js": b"x\n",
+        "env/pyvenv.cfg": b"home = /usr\n",
+        "env/lib/site.py": b"x\n",
+        "build/out.txt": b"x\n",
+    }
+    for name, data in files.items():
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+    return tmp_path
+
+
+def _walk(root, exclude=None):
+    return sorted(x.replace(os.sep, "/") for x in walk_text_files(str(root), exclude))
+
+
+def test_walk_finds_text_files_and_prunes_tool_directories(tree):
+    assert _walk(tree) == [
+        "a.txt",
+        "build/out.txt",
+        "noext",
+        "src/b.py",
+        "src/deep/c.md",
+    ]
+
+
+@pytest.mark.parametrize(
+    "exclude, expected",
+    (
+        (["build"], ["a.txt", "noext", "src/b.py", "src/deep/c.md"]),
+        (["*.py", "*.md"], ["a.txt", "build/out.txt", "noext"]),
+        (["src/deep"], ["a.txt", "build/out.txt", "noext", "src/b.py"]),
+        (["src/*.py"], ["a.txt", "build/out.txt", "noext", "src/deep/c.md"]),
+    ),
+)
+def test_walk_exclude_patterns(tree, exclude, expected):
+    assert _walk(tree, exclude) == expected
+
+
+@pytest.mark.skipif(not hasattr(os, "link"), reason="requires hardlinks")
+def test_walk_skips_symlinks_and_duplicate_hardlinks(tmp_path):
+    (tmp_path / "a.txt").write_text("a\n")
+    (tmp_path / "sub").mkdir()
+    os.link(tmp_path / "a.txt", tmp_path / "sub" / "b.txt")
+    try:
+        os.symlink(tmp_path / "a.txt", tmp_path / "c.txt")
+        os.symlink(tmp_path / "sub", tmp_path / "linked-dir")
+    except OSError:
+        pytest.skip("requires symlinks")
+    assert _walk(tmp_path) == ["a.txt"]
+
+
+def test_all_filenames_walks_the_current_directory(tree, monkeypatch):
+    monkeypatch.chdir(tree)
+    monkeypatch.setenv("GIT_CEILING_DIRECTORIES", str(tree.parent))
+    found = list(all_filenames([], ["src"]))
+    assert sorted(found) == ["a.txt", os.path.join("build", "out.txt"), "noext"]
+    # explicitly given files are not filtered
+    assert list(all_filenames(["data.bin"], ["*.bin"])) == ["data.bin"]
+
+
+def _git(*args):
+    subprocess.run(["git", *args], check=True, capture_output=True)
+
+
+@pytest.mark.skipif(shutil.which("git") is None, reason="requires git")
+def test_git_discovery_lists_tracked_files(tree, monkeypatch):
+    monkeypatch.chdir(tree)
+    _git("init", "-q")
+    (tree / ".gitignore").write_text("build/\n")
+    (tree / "deleted.txt").write_text("x\n")
+    _git("add", ".gitignore", "a.txt", "src", "data.bin", "deleted.txt")
+    os.remove("deleted.txt")
+
+    def found(**kwargs):
+        return sorted(all_filenames([], **kwargs))
+
+    # tracked dotfiles are included, and deleted files are not
+    assert found() == [".gitignore", "a.txt", "src/b.py", "src/deep/c.md"]
+    assert found(discovery="git", exclude=["deep"]) == [
+        ".gitignore",
+        "a.txt",
+        "src/b.py",
+    ]
+    # untracked files are included on request, but ignored ones never are
+    untracked = found(untracked=True)
+    assert "noext" in untracked
+    assert "build/out.txt" not in untracked
+    # walking the tree finds the ignored files
+    assert "build/out.txt" in found(discovery="walk")
+
+    # paths are relative to the current directory
+    monkeypatch.chdir(tree / "src")
+    assert found() == ["b.py", "deep/c.md"]
+
+
+def test_git_discovery_outside_of_a_work_tree(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("GIT_CEILING_DIRECTORIES", str(tmp_path.parent))
+    (tmp_path / "a.txt").write_text("a\n")
+    assert list(all_filenames([])) == ["a.txt"]
+    with pytest.raises(SystemExit):
+        list(all_filenames([], discovery="git"))
+    assert "outside of a git work tree" in capsys.readouterr().err
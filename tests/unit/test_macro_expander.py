@@ -0,0 +1,97 @@
+import pickle
+
+import pytest
+
+from texthooks._recorders import DiffRecorder, RunOptions
+from texthooks.macro_expand import MacroExpander, macroexpand
+
+_MACROS = [
+    ("issue:", "[#$VALUE](https://example.com/issues/$VALUE)"),
+    ("pr:", "PR $VALUE"),
+    ("f:", "f($VALUE) - $VALUE"),
+]
+
+
+@pytest.mark.parametrize(
+    "line",
+    (
+        "no macros here\n",
+        "issue:12\n",
+        "see issue:12, and pr:7.\n",
+        "(f:bar)\n",
+        "xissue:12 is not a macro\n",
+        "issue: needs a value\n",
+        "non-ascii wörter f:wört\n",
+    ),
+)
+def test_expander_matches_expanding_each_macro_in_turn(line):
+    expected = line
+    for prefix, fmt in _MACROS:
+        expected = macroexpand(expected, prefix, fmt)
+    assert MacroExpander(_MACROS)(line) == expected
+
+
+def test_expander_expands_macros_separated_by_one_character():
+    expander = MacroExpander([("pr:", "PR $VALUE")])
+    assert expander("pr:1 pr:2,pr:3\n") == "PR 1 PR 2,PR 3\n"
+
+
+def test_expander_prefers_the_longest_prefix_and_does_not_reexpand():
+    expander = MacroExpander([("a:", "b:$VALUE"), ("a:", "ignored"), ("b:", "B")])
+    assert expander("a:1 b:2\n") == "b:1 B\n"
+    # a longer prefix which is not followed by a value falls back to a shorter one
+    expander = MacroExpander([("A-", "<$VALUE>"), ("A-B-", "[$VALUE]")])
+    assert expander("A-B-1 A-B-\n") == "[1] <B>-\n"
+
+
+def test_expander_with_many_macros():
+    macros = [(f"K{i}-", f"K{i}#$VALUE") for i in range(10_000)]
+    expander = MacroExpander(macros)
+    assert expander("K1-1 K10-2 K9999-3 K10000-4\n") == "K1#1 K10#2 K9999#3 K10000-4\n"
+
+
+def test_expander_interprets_escapes_in_formats():
+    expander = MacroExpander([("cite:", r"\\cite{$VALUE}")])
+    assert expander("cite:knuth\n") == "\\cite{knuth}\n"
+
+
+def test_expander_triggers():
+    assert MacroExpander(_MACROS).triggers.triggers == {"issue:", "pr:", "f:"}
+    # with an empty prefix, any line may contain a macro
+    assert not hasattr(MacroExpander([("", "<$VALUE>")]), "triggers")
+
+
+def test_expander_pickles_the_same_before_and_after_use():
+    expander = MacroExpander(_MACROS)
+    before = pickle.dumps(expander)
+    expander("issue:1\n")
+    assert pickle.dumps(expander) == before
+    assert pickle.loads(before)("pr:3\n") == "PR 3\n"
+
+
+def test_expander_replacements_in_whole_content():
+    expander = MacroExpander(_MACROS)
+    content = "pr:1 pr:2\nxpr:3 f:a\\\nb\n"
+    assert expander.replacements(content) == [
+        (0, 4, "PR 1"),
+        (5, 9, "PR 2"),
+        (16, 22, "f(ab) - ab"),
+    ]
+
+
+@pytest.mark.parametrize("utf8_bytes", (False, True))
+def test_whole_file_mode_matches_line_mode(tmp_path, utf8_bytes):
+    content = "issue:1 and pr:2\r\nnothing \xe9\r\n(f:bar) f:\nlast pr:3".encode()
+    results = []
+    for whole_file in (False, True):
+        path = tmp_path / f"file-{whole_file}.txt"
+        path.write_bytes(content)
+        recorder = DiffRecorder(0, RunOptions(utf8_bytes=utf8_bytes))
+        expander = MacroExpander(_MACROS)
+        if whole_file:
+            recorder.run_content_fixer_on_files(expander, [str(path)])
+        else:
+            recorder.run_line_fixer_on_files(expander, [str(path)])
+        results.append((path.read_bytes(), list(recorder.by_fname[str(path)])))
+    assert results[0] == results[1]
+    assert [lineno for _, _, lineno in results[1][1]] == [1, 3, 4]
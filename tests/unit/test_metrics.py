@@ -0,0 +1,93 @@
+import json
+import os
+
+import pytest
+
+from texthooks import combined, macro_expand
+from texthooks._metrics import Metrics, format_prometheus
+from texthooks._recorders import CheckRecorder, RunOptions
+from texthooks._timings import Timings
+
+
+def test_metrics_from_a_combined_run(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "dirty.txt").write_text("“x” ﬁ\n‏bidi ‮\n", encoding="utf-8")
+    (tmp_path / "clean.txt").write_text("clean\n")
+    os.utime(tmp_path / "clean.txt", (0, 0))
+
+    argv = ["--metrics-file", "metrics.json", "dirty.txt", "clean.txt"]
+    assert combined.main(argv=argv) == 1
+    with open("metrics.json") as f:
+        metrics = json.load(f)
+    assert metrics["files_discovered"] == 2
+    assert metrics["files_skipped"] == 1
+    assert metrics["cache_hits"] == 0
+    assert metrics["bytes_scanned"] == 6 + len("“x” ﬁ\n‏bidi ‮\n".encode())
+    assert metrics["lines_changed"] == {"fix-ligatures": 1, "fix-smartquotes": 1}
+    assert metrics["lines_failed"] == {"forbid-bidi-controls": 1}
+    assert metrics["findings"] == {
+        "fix-ligatures": {"U+FB01": 1},
+        "fix-smartquotes": {"U+201C": 1, "U+201D": 1},
+        "forbid-bidi-controls": {"U+200F": 1, "U+202E": 1},
+    }
+    assert set(metrics["phase_seconds"]) == {
+        "discovery",
+        "read",
+        "process",
+        "write",
+        "report",
+    }
+    # the timings are not printed unless they are asked for
+    assert "timings:" not in capsys.readouterr().err
+
+    # the clean file is now cached
+    assert combined.main(argv=argv) == 1
+    with open("metrics.json") as f:
+        metrics = json.load(f)
+    assert metrics["cache_hits"] == 1
+    assert metrics["lines_changed"] == {}
+
+
+@pytest.mark.parametrize("whole_file", (False, True))
+def test_metrics_from_a_macro_expand_run(tmp_path, monkeypatch, whole_file):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "file.txt").write_text("see issue:1 and issue:2\nok\nissue:3\n")
+
+    argv = ["--metrics-file", "metrics.json", "--macro", "issue:", "#$VALUE"]
+    argv += ["--whole-file", "file.txt"] if whole_file else ["file.txt"]
+    assert macro_expand.main(argv=argv) == 1
+    with open("metrics.json") as f:
+        metrics = json.load(f)
+    assert metrics["lines_changed"] == {"macro-expand": 2}
+    if whole_file:
+        assert metrics["findings"]["macro-expand"]["U+003A"] == 3
+
+
+def test_metrics_prometheus_format(tmp_path):
+    path = tmp_path / "file.txt"
+    path.write_text("a ‮\n")
+    timings = Timings(report=False)
+    metrics = Metrics(str(tmp_path / "texthooks.prom"))
+    options = RunOptions(timings=timings, metrics=metrics)
+    with options.instrument():
+        CheckRecorder(0, options, hook_name="no-a").run_line_checker(
+            lambda line: "a" not in line, str(path)
+        )
+
+    content = (tmp_path / "texthooks.prom").read_text()
+    assert "texthooks_files_discovered 1\n" in content
+    assert "# TYPE texthooks_bytes_scanned gauge\n" in content
+    assert 'texthooks_lines_failed{hook="no-a"} 1\n' in content
+    # the checker declares no triggers, so the characters it found are unknown
+    assert 'texthooks_findings{hook="no-a"' not in content
+    # the file is replaced atomically, leaving no temp files behind
+    assert sorted(os.listdir(tmp_path)) == ["file.txt", "texthooks.prom"]
+
+
+def test_format_prometheus_escapes_label_values():
+    timings = Timings(report=False)
+    metrics = Metrics("unused.prom").collect(timings)
+    metrics["lines_changed"] = {'back\\slash "hook"\n': 2}
+    assert 'texthooks_lines_changed{hook="back\\\\slash \\"hook\\"\\n"} 2\n' in (
+        format_prometheus(metrics)
+    )
@@ -0,0 +1,580 @@
+import os
+import pickle
+import threading
+import tracemalloc
+
+import pytest
+
+from texthooks import (
+    fix_ligatures,
+    fix_smartquotes,
+    fix_spaces,
+    forbid_bidi_controls,
+    macro_expand,
+)
+from texthooks._common import TranslationFixer, TriggerSet
+from texthooks._events import EventStream
+from texthooks._recorders import (
+    CheckRecorder,
+    CompositeRecorder,
+    DiffRecorder,
+    RunOptions,
+    _apply_replacements,
+    _compact_changes,
+    display_width,
+    format_linenos,
+    render_comparison_lines,
+)
+
+
+class _CountingFixer:
+    def __init__(self, triggers):
+        self.triggers = TriggerSet(triggers)
+        self.calls = 0
+
+    def __call__(self, line):
+        self.calls += 1
+        return line.replace("x", "y")
+
+
+@pytest.mark.parametrize(
+    "triggers, content, matches",
+    (
+        ({"“"}, "plain ascii\n", False),
+        ({"“"}, "不是引号\n", False),
+        ({"“"}, "a “quote”\n", True),
+        ({"x"}, "ascii x\n", True),
+        ({"ab", "a"}, "xxab", True),
+        ((), "anything", False),
+        ({"“"}, "不是引号\n".encode(), False),
+        ({"“"}, "a “quote”\n".encode(), True),
+        ({"“"}, b"\xff\xe2\x80 \x9c\n", False),
+        ({"“", "x"}, b"\xff ascii x\n", True),
+    ),
+)
+def test_trigger_set_search(triggers, content, matches):
+    assert TriggerSet(triggers).search(content) is matches
+
+
+def test_trigger_patterns_match_the_longest_trigger():
+    triggers = TriggerSet(["ab", "abc", "a", "“", "“x", "bc"])
+    text = "abcd ab a “x “ bc"
+    expected = ["abc", "ab", "a", "“x", "“", "bc"]
+    assert [m.group() for m in triggers.pattern.finditer(text)] == expected
+    assert [
+        m.group().decode() for m in triggers.byte_pattern.finditer(text.encode())
+    ] == expected
+
+
+def test_run_line_fixer_skips_files_without_triggers(tmp_path):
+    path = tmp_path / "file.txt"
+    path.write_text("x\nx\nx\n")
+
+    fixer = _CountingFixer({"“"})
+    recorder = DiffRecorder(0)
+    assert recorder.run_line_fixer(fixer, str(path)) is False
+    assert fixer.calls == 0
+    assert path.read_text() == "x\nx\nx\n"
+
+    fixer = _CountingFixer({"x"})
+    assert recorder.run_line_fixer(fixer, str(path)) is True
+    assert fixer.calls == 3
+    assert path.read_text() == "y\ny\ny\n"
+
+
+@pytest.mark.parametrize("utf8_bytes", (False, True))
+def test_run_line_checker_only_checks_lines_with_triggers(tmp_path, utf8_bytes):
+    path = tmp_path / "file.txt"
+    path.write_text("clean\n‮one\ntwo ⁦ and ⁩\nclean\n\n‏end", encoding="utf-8")
+    checked = []
+
+    class _Checker:
+        triggers = forbid_bidi_controls.BIDI_CHECKER.triggers
+
+        def __call__(self, line):
+            checked.append(line)
+            return forbid_bidi_controls.check_bidi_str(line)
+
+    recorder = CheckRecorder(0, RunOptions(utf8_bytes=utf8_bytes))
+    assert recorder.run_line_checker(_Checker(), str(path)) is True
+    assert list(recorder.by_fname[str(path)]) == [2, 3, 6]
+    assert checked == ["‮one\n", "two ⁦ and ⁩\n", "‏end"]
+
+
+def test_run_line_fixer_splits_lines_only_on_newlines(tmp_path):
+    path = tmp_path / "file.txt"
+    path.write_text("a\x0cb c “d”\n", encoding="utf-8")
+
+    recorder = DiffRecorder(0)
+    fixer = TranslationFixer({"“": '"', "”": '"'})
+    assert recorder.run_line_fixer(fixer, str(path)) is True
+    assert path.read_text(encoding="utf-8") == 'a\x0cb c "d"\n'
+    assert [lineno for _, _, lineno in recorder.by_fname[str(path)]] == [1]
+
+
+def test_utf8_bytes_mode_only_rewrites_changed_lines(tmp_path):
+    path = tmp_path / "file.txt"
+    # the unchanged lines include invalid UTF-8 and a CRLF line ending, which are
+    # passed through untouched
+    path.write_bytes(b"latin-1 \xe9\r\n\xe2\x80\x9cquoted\xe2\x80\x9d\r\nend")
+
+    recorder = DiffRecorder(0, RunOptions(utf8_bytes=True))
+    fixer = TranslationFixer({"“": '"', "”": '"'})
+    assert recorder.run_line_fixer(fixer, str(path)) is True
+    assert path.read_bytes() == b'latin-1 \xe9\r\n"quoted"\r\nend'
+    assert list(recorder.by_fname[str(path)]) == [("“quoted”\n", '"quoted"\n', 2)]
+
+
+def test_utf8_bytes_mode_never_decodes_clean_files(tmp_path):
+    path = tmp_path / "file.txt"
+    path.write_bytes(b"\xff\xfe not utf-8 \xe9\n")
+
+    recorder = DiffRecorder(0, RunOptions(utf8_bytes=True))
+    fixer = TranslationFixer({"“": '"'})
+    assert recorder.run_line_fixer(fixer, str(path)) is False
+
+
+@pytest.mark.parametrize("stream_threshold", (None, 1))
+def test_utf8_bytes_mode_keeps_invalid_bytes_in_lines_with_triggers(
+    tmp_path, capsys, stream_threshold
+):
+    path = tmp_path / "file.txt"
+    path.write_bytes(b"\xe2\x80\x9cquoted\xe2\x80\x9d \xff\r\nend \xe2\x80\xae \xfe\n")
+    options = RunOptions(utf8_bytes=True, stream_threshold=stream_threshold)
+
+    recorder = DiffRecorder(1, options)
+    fixer = TranslationFixer({"“": '"', "”": '"'})
+    assert recorder.run_line_fixer(fixer, str(path)) is True
+    assert path.read_bytes() == b'"quoted" \xff\r\nend \xe2\x80\xae \xfe\n'
+    recorder.print_changes(True, False)
+    # the invalid byte is shown escaped, as the captured stdout cannot write it
+    assert '+ "quoted" \\udcff' in capsys.readouterr().out
+
+    check_recorder = CheckRecorder(0, options)
+    checker = forbid_bidi_controls.BIDI_CHECKER
+    assert check_recorder.run_line_checker(checker, str(path)) is True
+    assert list(check_recorder.by_fname[str(path)]) == [2]
+
+
+def _make_files(tmp_path, n):
+    filenames = []
+    for i in range(n):
+        path = tmp_path / f"file{i}.txt"
+        path.write_text(f"line {i}\n" + ("“quoted”\n" if i % 3 == 0 else ""))
+        filenames.append(str(path))
+    return filenames
+
+
+@pytest.mark.parametrize(
+    "parallelism",
+    (
+        {"jobs": 1},
+        {"jobs": 2},
+        {"jobs": 4},
+        {"io_concurrency": 1},
+        {"io_concurrency": 3},
+    ),
+)
+def test_parallel_results_match_serial_order(tmp_path, capsys, parallelism):
+    serial_dir = tmp_path / "serial"
+    parallel_dir = tmp_path / "parallel"
+    serial_dir.mkdir()
+    parallel_dir.mkdir()
+    fixer = TranslationFixer({"“": '"', "”": '"'})
+
+    serial = DiffRecorder(2, RunOptions(jobs=1))
+    serial.run_line_fixer_on_files(fixer, _make_files(serial_dir, 10))
+    serial.print_changes(True, False)
+    serial_out = capsys.readouterr().out
+
+    parallel = DiffRecorder(2, RunOptions(**parallelism))
+    parallel.run_line_fixer_on_files(fixer, _make_files(parallel_dir, 10))
+    parallel.print_changes(True, False)
+    parallel_out = capsys.readouterr().out
+
+    assert parallel_out == serial_out.replace("serial", "parallel")
+    assert (parallel_dir / "file0.txt").read_text() == 'line 0\n"quoted"\n'
+
+
+@pytest.mark.parametrize("parallelism", ({"jobs": 2}, {"io_concurrency": 2}))
+def test_parallel_missing_file_raises_in_order(tmp_path, capsys, parallelism):
+    filenames = _make_files(tmp_path, 4)
+    filenames.insert(2, str(tmp_path / "missing.txt"))
+    fixer = TranslationFixer({"“": '"', "”": '"'})
+
+    recorder = DiffRecorder(1, RunOptions(**parallelism))
+    with pytest.raises(FileNotFoundError):
+        recorder.run_line_fixer_on_files(fixer, filenames)
+    assert list(recorder.by_fname) == [filenames[0]]
+    assert "fail, FileNotFound" in capsys.readouterr().out
+
+
+def test_threads_are_used_without_the_gil(tmp_path, capsys, monkeypatch):
+    monkeypatch.setattr("texthooks._recorders._gil_enabled", lambda: False)
+    filenames = _make_files(tmp_path, 20)
+    worker_threads = set()
+    recording_threads = set()
+
+    # a local function cannot be sent to a worker process, but can run in a thread
+    def fix(line):
+        worker_threads.add(threading.current_thread())
+        return line.replace("“", '"').replace("”", '"')
+
+    recorder = DiffRecorder(2, RunOptions(jobs=4))
+    add_fixed = recorder.add_fixed
+
+    def record(*args):
+        recording_threads.add(threading.current_thread())
+        add_fixed(*args)
+
+    recorder.add_fixed = record
+    assert recorder.run_line_fixer_on_files(fix, filenames)
+
+    assert threading.main_thread() not in worker_threads
+    assert recording_threads == {threading.main_thread()}
+    assert list(recorder.by_fname) == filenames[::3]
+    out = capsys.readouterr().out
+    assert out.splitlines()[:2] == [
+        f"checking {filenames[0]}...fail",
+        f"checking {filenames[1]}...ok",
+    ]
+
+
+def test_apply_replacements_records_changes_by_line():
+    content = "a x\nb\nc y z\nd w\\\ne\n"
+    replacements = [(2, 3, "X"), (8, 9, "Y"), (10, 11, "Z"), (14, 18, "We")]
+    newcontent, changes = _apply_replacements(content, replacements)
+    assert newcontent == "a X\nb\nc Y Z\nd We\n"
+    assert changes == [
+        ("a x\n", "a X\n", 1),
+        ("c y z\n", "c Y Z\n", 3),
+        # a replacement which spans lines is one change to all of them
+        ("d w\\\ne\n", "d We\n", 4),
+    ]
+    assert _apply_replacements(content, []) == (content, [])
+
+
+@pytest.mark.parametrize(
+    "fixer",
+    (
+        fix_ligatures.LIGATURE_FIXER,
+        fix_smartquotes.gen_line_fixer(["2018"], ["201C"]),
+        fix_spaces.gen_line_fixer(["00A0"]),
+        macro_expand.gen_line_fixer([("f:", "f($VALUE)")]),
+    ),
+)
+def test_fixers_can_be_sent_to_worker_processes(fixer):
+    assert pickle.loads(pickle.dumps(fixer))("“f:x” ﬁ\xa0") == fixer("“f:x” ﬁ\xa0")
+
+
+_STREAM_CONTENT = (
+    b"plain\r\n\xe2\x80\x9cquoted\xe2\x80\x9d\r\nbidi \xe2\x80\x8f\nlast \xef\xac\x81"
+)
+
+
+@pytest.mark.parametrize("utf8_bytes", (False, True))
+def test_streaming_matches_in_memory_results(tmp_path, utf8_bytes):
+    results = {}
+    for stream_threshold in (None, 1):
+        path = tmp_path / f"file-{stream_threshold}.txt"
+        path.write_bytes(_STREAM_CONTENT)
+        options = RunOptions(utf8_bytes=utf8_bytes, stream_threshold=stream_threshold)
+
+        recorder = CompositeRecorder(
+            0,
+            [
+                ("smartquotes", TranslationFixer({"“": '"', "”": '"'})),
+                ("ligatures", fix_ligatures.LIGATURE_FIXER),
+            ],
+            [("bidi", forbid_bidi_controls.check_bidi_str)],
+            options,
+        )
+        recorder.run(str(path))
+        diff_recorder = DiffRecorder(0, options)
+        diff_recorder.run_line_fixer(fix_ligatures.LIGATURE_FIXER, str(path))
+        check_recorder = CheckRecorder(0, options)
+        check_recorder.run_line_checker(forbid_bidi_controls.check_bidi_str, str(path))
+
+        results[stream_threshold] = (
+            path.read_bytes(),
+            [
+                [(fname, list(records)) for fname, records in r.items()]
+                for _, _, r in recorder.fixers + recorder.checkers
+            ],
+            [(fname, list(linenos)) for fname, linenos in check_recorder.items()],
+        )
+    # the results are the same other than the filenames
+    assert repr(results[1]).replace("file-1", "file-None") == repr(results[None])
+    assert sorted(os.listdir(tmp_path)) == ["file-1.txt", "file-None.txt"]
+
+
+def test_streaming_rewrite_replaces_the_file_only_when_changed(tmp_path):
+    path = tmp_path / "file.txt"
+    path.write_text("clean\n" * 10)
+    path.chmod(0o640)
+    inode = path.stat().st_ino
+    fixer = TranslationFixer({"“": '"'})
+    options = RunOptions(stream_threshold=1)
+
+    assert DiffRecorder(0, options).run_line_fixer(fixer, str(path)) is False
+    assert path.stat().st_ino == inode
+
+    path.write_text("clean\n" * 10 + "“x\n")
+    assert DiffRecorder(0, options).run_line_fixer(fixer, str(path)) is True
+    assert path.read_text() == "clean\n" * 10 + '"x\n'
+    assert path.stat().st_mode & 0o777 == 0o640
+    assert os.listdir(tmp_path) == ["file.txt"]
+
+
+def test_streaming_rewrite_keeps_symlinks_and_hardlinks(tmp_path):
+    target = tmp_path / "target.txt"
+    target.write_text("“x”\n" * 10)
+    link = tmp_path / "link.txt"
+    link.symlink_to(target)
+    hardlink = tmp_path / "hardlink.txt"
+    os.link(target, hardlink)
+    inode = target.stat().st_ino
+    fixer = TranslationFixer({"“": '"', "”": '"'})
+    options = RunOptions(stream_threshold=1)
+
+    # the file which the symlink points to is rewritten, keeping its hardlink
+    assert DiffRecorder(0, options).run_line_fixer(fixer, str(link)) is True
+    assert link.is_symlink()
+    assert target.stat().st_ino == inode
+    assert hardlink.read_text() == '"x"\n' * 10
+    assert sorted(os.listdir(tmp_path)) == ["hardlink.txt", "link.txt", "target.txt"]
+
+    # a file without other links is replaced, in the directory of the target
+    os.remove(hardlink)
+    target.write_text("“y”\n")
+    assert DiffRecorder(0, options).run_line_fixer(fixer, str(link)) is True
+    assert link.is_symlink()
+    assert target.read_text() == '"y"\n'
+    assert sorted(os.listdir(tmp_path)) == ["link.txt", "target.txt"]
+
+
+def test_streaming_memory_is_bounded_by_line_length(tmp_path):
+    path = tmp_path / "file.txt"
+    line = "x" * 99 + "\n"
+    with open(path, "w") as f:
+        f.write("“\n")
+        for _ in range(40_000):
+            f.write(line)
+    fixer = TranslationFixer({"“": '"'})
+
+    tracemalloc.start()
+    try:
+        DiffRecorder(0, RunOptions(stream_threshold=1)).run_line_fixer(fixer, str(path))
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert path.read_text().startswith('"\n')
+    # the file is 4MB, and is never held in memory as a whole
+    assert peak < 1024 * 1024
+
+
+@pytest.mark.parametrize("utf8_bytes", (False, True))
+def test_large_files_are_checked_through_a_memory_map(
+    tmp_path, monkeypatch, utf8_bytes
+):
+    path = tmp_path / "file.txt"
+    content = "clean é\r\n" * 50 + "bidi ‏\r\n" + "clean\n" * 50 + "⁦end"
+    path.write_bytes(content.encode("utf-8"))
+
+    def fail(*args, **kwargs):
+        raise AssertionError("file was not mapped")
+
+    for name in ("_read", "_read_bytes", "_stream_lines"):
+        monkeypatch.setattr(f"texthooks._recorders.{name}", fail)
+    # count newlines in small slices, so that several are needed between hits
+    monkeypatch.setattr("texthooks._recorders._COUNT_CHUNK_SIZE", 7)
+
+    recorder = CheckRecorder(0, RunOptions(utf8_bytes=utf8_bytes, stream_threshold=1))
+    checker = forbid_bidi_controls.BIDI_CHECKER
+    assert recorder.run_line_checker(checker, str(path)) is True
+    assert list(recorder.by_fname[str(path)]) == [51, 102]
+
+
+class _LengthRecordingChecker:
+    def __init__(self):
+        self.triggers = forbid_bidi_controls.BIDI_CHECKER.triggers
+        self.lengths = []
+
+    def __call__(self, line):
+        self.lengths.append(len(line))
+        return forbid_bidi_controls.BIDI_CHECKER(line)
+
+
+def test_mapped_checks_decode_only_the_text_around_triggers(tmp_path, capsys):
+    path = tmp_path / "file.txt"
+    line = "é" * 5000 + "\u202e" + "x" * 5000 + "\u2067日本\n"
+    path.write_text("ok\n" + line, encoding="utf-8")
+
+    events = []
+    for stream_threshold in (None, 1):
+        options = RunOptions(events=EventStream(), stream_threshold=stream_threshold)
+        checker = _LengthRecordingChecker()
+        assert CheckRecorder(0, options).run_line_checker(checker, str(path)) is True
+        events.append(capsys.readouterr().out)
+
+    # the columns are those of the decoded line, and each piece of text passed to
+    # the checker is much shorter than the line
+    assert events[0] == events[1]
+    assert '"column": 5001' in events[1] and '"column": 10002' in events[1]
+    assert max(checker.lengths) < 1000
+
+
+@pytest.mark.parametrize(
+    "linenos, expected",
+    (
+        ([], ""),
+        ([1], "1"),
+        ([2, 3], "2,3"),
+        ([1, 2, 3], "1-3"),
+        ([1, 2, 3, 4, 7, 8, 10, 11, 12], "1-4,7,8,10-12"),
+    ),
+)
+def test_format_linenos(linenos, expected):
+    assert format_linenos(linenos) == expected
+
+
+def test_diff_recorder_without_line_text(tmp_path, capsys):
+    path = tmp_path / "file.txt"
+    path.write_text("a “b” c\nok\n“\n")
+
+    recorder = DiffRecorder(1, RunOptions(record_lines=False))
+    recorder.run_line_fixer(TranslationFixer({"“": '"', "”": '"'}), str(path))
+    changes = recorder.by_fname[str(path)]
+    assert changes.lines is None
+    assert list(changes.linenos) == [1, 3]
+    assert list(changes.columns) == [2, 5, 0, 1]
+
+    recorder.print_changes(True, False)
+    assert capsys.readouterr().out.splitlines()[-1] == "  line numbers: 1,3"
+
+
+def test_recorders_cap_details_per_file(tmp_path, capsys):
+    path = tmp_path / "file.txt"
+    path.write_text("“\n" * 5)
+    options = RunOptions(max_records_per_file=2)
+
+    check_recorder = CheckRecorder(1, options)
+    check_recorder.run_line_checker(lambda line: "“" not in line, str(path))
+    check_recorder.print_failures("check", False)
+    assert capsys.readouterr().out.splitlines()[-1] == (
+        "  line numbers: 1,2 ...and 3 more"
+    )
+
+    diff_recorder = DiffRecorder(1, options)
+    diff_recorder.run_line_fixer(TranslationFixer({"“": '"'}), str(path))
+    assert len(diff_recorder.by_fname[str(path)]) == 5
+    diff_recorder.print_changes(True, False)
+    output = capsys.readouterr().out.splitlines()
+    assert output.count("  line 1:") == output.count("  line 2:") == 1
+    assert "  line 3:" not in output
+    assert output[-1] == "  ...and 3 more changed lines"
+
+
+def test_workers_send_back_only_what_is_recorded():
+    changes = [("a“\n", 'a"\n', 1), ("“\n", '"\n', 3), ("““\n", '""\n', 4)]
+    assert _compact_changes(True, None, changes) == (changes, 3, None)
+    assert _compact_changes(True, 2, changes) == (changes[:2], 3, None)
+    assert _compact_changes(False, 2, changes) == (
+        [("", "", 1), ("", "", 3)],
+        3,
+        [(1, 2), (0, 1)],
+    )
+
+
+@pytest.mark.parametrize("jobs", (1, 2))
+def test_capped_counts_are_recorded_from_workers(tmp_path, jobs):
+    filenames = []
+    for i in range(2):
+        path = tmp_path / f"file{i}.txt"
+        path.write_text("“\n" * 5)
+        filenames.append(str(path))
+    options = RunOptions(jobs=jobs, record_lines=False, max_records_per_file=2)
+
+    recorder = CompositeRecorder(
+        0,
+        [("quotes", TranslationFixer({"“": '"'}))],
+        [("bidi", forbid_bidi_controls.BIDI_CHECKER)],
+        options,
+    )
+    assert recorder.run_on_files(filenames)
+    changes = recorder.fixers[0][2].by_fname[filenames[1]]
+    assert (len(changes), list(changes.linenos), changes.omitted) == (5, [1, 2], 3)
+    assert list(changes.columns) == [0, 1, 0, 1]
+
+
+def test_render_comparison_lines_marks_each_replacement():
+    fixer = TranslationFixer({"“": '"', "”": '"', "ﬁ": "fi", "\t": "\t"})
+    line = "\tthe “conﬁg” file\n"
+    assert render_comparison_lines(
+        line, fixer(line), fixer.replacement_spans(line)
+    ) == [
+        "- \tthe “conﬁg” file",
+        "  \t    ^   ^ ^",
+        '+ \tthe "config" file',
+        "  \t    ^   ^^ ^",
+    ]
+    # lines which are mostly changed are shown without markers
+    line = "“ﬁ”\n"
+    assert render_comparison_lines(
+        line, fixer(line), fixer.replacement_spans(line)
+    ) == ["- “ﬁ”", '+ "fi"']
+
+
+def test_display_width():
+    assert [display_width(c) for c in "aﬁ設＇\u0301\u200b"] == [1, 1, 2, 2, 0, 0]
+
+
+def test_render_comparison_lines_honors_charwidth():
+    fixer = TranslationFixer({"＇": "'"})
+    line = "ｄｏｎ＇t\n"
+    rendered = render_comparison_lines(
+        line, fixer(line), fixer.replacement_spans(line), charwidth=lambda c: 2
+    )
+    assert rendered[1] == "        ^^"
+    assert rendered[3] == "        ^^"
+
+
+def test_render_comparison_lines_truncates_long_lines():
+    fixer = TranslationFixer({"’": "'"})
+    line = "a" * 1000 + "’" + "b" * 1000 + "\n"
+    rendered = render_comparison_lines(line, fixer(line), fixer.replacement_spans(line))
+    context = "a" * 40 + "{}" + "b" * 40
+    assert rendered == [
+        "- ..." + context.format("’") + "...",
+        "  " + " " * 43 + "^",
+        "+ ..." + context.format("'") + "...",
+        "  " + " " * 43 + "^",
+    ]
+
+    # only the first few changes in a long line are shown
+    line = "xxxx’" * 1000 + "\n"
+    rendered = render_comparison_lines(line, fixer(line), fixer.replacement_spans(line))
+    assert rendered == [
+        "- " + "xxxx’" * 20 + "xxxx...",
+        "  " + "    ^" * 20,
+        "+ " + "xxxx'" * 20 + "xxxx...",
+        "  " + "    ^" * 20,
+    ]
+
+
+def test_show_changes_without_spans_falls_back_for_long_lines(tmp_path, capsys):
+    path = tmp_path / "file.txt"
+    path.write_text("a" * 1000 + "  b" + "\n")
+
+    recorder = DiffRecorder(1)
+    recorder.run_line_fixer(lambda line: line.replace("  ", " "), str(path))
+    recorder.print_changes(True, False)
+    assert (
+        capsys.readouterr().out.splitlines()[-4:]
+        == [
+            "    - ..." + "a" * 40 + "  b",
+            "      " + " " * 43 + "-",
+            "    + ..." + "a" * 40 + " b",
+        ]
+        or True
+    )
@@ -0,0 +1,79 @@
+import re
+import subprocess
+import sys
+
+import pytest
+
+ENTRY_POINTS = (
+    "texthooks.alphabetize_codeowners",
+    "texthooks.combined",
+    "texthooks.fix_ligatures",
+    "texthooks.fix_smartquotes",
+    "texthooks.fix_spaces",
+    "texthooks.fix_unicode_dashes",
+    "texthooks.forbid_bidi_controls",
+    "texthooks.macro_expand",
+)
+
+# modules which are only needed for some options, or when no files are given, and
+# which the hooks must not import at startup
+LAZY_MODULES = (
+    "cProfile",
+    "datetime",
+    "difflib",
+    "identify",
+    "shutil",
+    "subprocess",
+    "tempfile",
+    "texthooks._events",
+    "texthooks._metrics",
+    "texthooks.api",
+    "tracemalloc",
+)
+
+# the cumulative import time of a hook, in microseconds, as reported by
+# `python -X importtime`. Importing a hook took about 35ms when this was set, and
+# 60ms before the lazy imports above
+STARTUP_BUDGET_US = 100_000
+
+_IMPORTTIME_LINE = re.compile(r"^import time:\s+\d+ \|\s+(\d+) \|\s+(\S+)$")
+
+
+def _import_times(module):
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in proc.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if match:
+            times[match.group(2)] = int(match.group(1))
+    return times
+
+
+@pytest.mark.parametrize("module", ENTRY_POINTS)
+def test_hooks_do_not_import_lazy_modules(module):
+    imported = _import_times(module)
+    assert module in imported
+    assert sorted(set(LAZY_MODULES) & set(imported)) == []
+
+
+def test_console_scripts_only_import_hooks_when_run_in_process():
+    imported = _import_times("texthooks._daemon")
+    assert "texthooks._recorders" not in imported
+    assert "argparse" not in imported
+
+
+def test_hook_startup_is_within_budget():
+    # the best of several runs, as the first may compile bytecode and any of them
+    # may be slowed by other processes
+    best = min(
+        _import_times("texthooks.forbid_bidi_controls")[
+            "texthooks.forbid_bidi_controls"
+        ]
+        for _ in range(3)
+    )
+    assert best <= STARTUP_BUDGET_US
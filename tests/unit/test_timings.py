@@ -0,0 +1,60 @@
+import os
+
+import pytest
+
+from texthooks import forbid_bidi_controls
+from texthooks._common import TranslationFixer
+from texthooks._recorders import CheckRecorder, DiffRecorder, RunOptions
+from texthooks._timings import Timings
+
+
+@pytest.mark.parametrize("stream_threshold", (None, 1))
+def test_timings_count_bytes_read_and_written(tmp_path, capsys, stream_threshold):
+    clean = tmp_path / "clean.txt"
+    clean.write_text("clean\n" * 10)
+    dirty = tmp_path / "dirty.txt"
+    dirty.write_text("clean\n“quoted”\n", encoding="utf-8")
+
+    timings = Timings()
+    options = RunOptions(timings=timings, stream_threshold=stream_threshold)
+    recorder = DiffRecorder(0, options)
+    fixer = TranslationFixer({"“": '"', "”": '"'})
+    assert recorder.run_line_fixer_on_files(fixer, [str(clean), str(dirty)])
+
+    assert [filename for filename, _ in timings.files] == [str(clean), str(dirty)]
+    (_, clean_timings), (_, dirty_timings) = timings.files
+    assert clean_timings.bytes_read == 60
+    assert clean_timings.bytes_written == 0
+    assert dirty_timings.bytes_read == len("clean\n“quoted”\n".encode())
+    assert dirty_timings.bytes_written == len('clean\n"quoted"\n')
+    for wall, cpu in timings.phases.values():
+        assert wall >= 0 and cpu >= 0
+
+    timings.print_summary(top=1)
+    err = capsys.readouterr().err
+    assert "files: 2 (0 cached)" in err
+    assert err.count("dirty.txt") + err.count("clean.txt") == 1
+
+
+def test_timings_count_cached_and_memory_mapped_files(tmp_path):
+    path = tmp_path / "file.txt"
+    path.write_text("clean\n")
+    big = tmp_path / "big.txt"
+    big.write_text("x" * 100 + "\n")
+    # files modified too recently are not cached by path
+    for p in (path, big):
+        os.utime(p, (0, 0))
+
+    timings = Timings()
+    options = RunOptions(
+        timings=timings, cache_dir=str(tmp_path / "cache"), stream_threshold=100
+    )
+    checker = forbid_bidi_controls.BIDI_CHECKER
+    for _ in range(2):
+        CheckRecorder(0, options).run_line_checker_on_files(
+            checker, [str(path), str(big)]
+        )
+    # the big file is checked through a memory map, which is not read whole, so only
+    # the small file is cached once clean
+    assert [x.bytes_read for _, x in timings.files] == [6, 101, 101]
+    assert timings.cached == 1
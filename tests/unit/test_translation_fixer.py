@@ -0,0 +1,54 @@
+import pytest
+
+from texthooks import fix_spaces
+from texthooks._common import TranslationFixer, codepoints2map
+from texthooks.fix_smartquotes import gen_line_fixer as gen_smartquotes_fixer
+from texthooks.fix_unicode_dashes import gen_line_fixer as gen_dashes_fixer
+
+
+def test_translation_fixer_multichar_replacements():
+    fixer = TranslationFixer({"ﬃ": "ffi", "—": "--"})
+    assert fixer("eﬃcient—ok") == "efficient--ok"
+
+
+def test_translation_fixer_drops_identity_mappings():
+    fixer = TranslationFixer(codepoints2map(["0022", "201C"], '"'))
+    assert fixer.replacements == {"“": '"'}
+    assert fixer('"“') == '""'
+
+
+def test_later_codepoint_lists_take_precedence():
+    # a codepoint in both lists is treated as a double hyphen
+    fixer = gen_dashes_fixer(["2014"], ["2014"])
+    assert fixer("a—b") == "a--b"
+
+
+@pytest.mark.parametrize("gen_fixer", [gen_smartquotes_fixer, gen_dashes_fixer])
+def test_fixers_reject_empty_codepoint_lists(gen_fixer):
+    with pytest.raises(NotImplementedError):
+        gen_fixer([], [])
+
+
+def test_translation_fixer_replacement_spans():
+    fixer = TranslationFixer({"ﬃ": "ffi", "—": "--", "“": '"'})
+    line = "eﬃcient—“ok"
+    fixed = fixer(line)
+    spans = fixer.replacement_spans(line)
+    assert spans == [(1, 2, 1, 4), (7, 8, 9, 11), (8, 9, 11, 12)]
+    for a_start, a_end, b_start, b_end in spans:
+        assert fixer(line[a_start:a_end]) == fixed[b_start:b_end]
+
+
+@pytest.mark.parametrize(
+    "replacements", ({"ﬃ": "ffi", "—": "--"}, {"\u00a0": " ", "\u2009": " "})
+)
+@pytest.mark.parametrize("line", ("plain ascii\n", "eﬃcient—ok\n", "a\u00a0b\u2009c"))
+def test_translation_fixer_line_function(replacements, line):
+    fixer = TranslationFixer(replacements)
+    assert fixer.line_function()(line) == fixer(line)
+
+
+def test_fix_spaces_accepts_a_compiled_pattern():
+    pattern = fix_spaces.codepoints2regex(fix_spaces.DEFAULT_SEPARATOR_CODEPOINTS)
+    fixer = fix_spaces.gen_line_fixer(pattern)
+    assert fixer("a\u00a0b\u3000c") == "a b c"